@@ -1,20 +1,67 @@
 """This module defines the APIClient class."""
 
+import json
 import logging
+import threading
+from collections.abc import Iterator
 
 import requests
 import tenacity
+from requests.adapters import HTTPAdapter
 
 from apps.agent.dependencies import constants as c, exceptions as exc
 
 
 class APIClient:
-    """This class acts as a wrapper for the "requests" library."""
+    """
+    This class acts as a wrapper for the "requests" library.
+    Every thread gets its own session, but all sessions share one adapter,
+    so keep-alive connections to the API server are pooled across threads.
+    """
 
-    def __init__(self, logger: logging.Logger) -> None:
+    def __init__(
+        self,
+        logger: logging.Logger,
+        pool_size: int = c.GROCERY_API_SERVER_POOL_SIZE,
+        connect_timeout: float = c.GROCERY_API_SERVER_CONNECT_TIMEOUT,
+        read_timeout: float = c.GROCERY_API_SERVER_READ_TIMEOUT,
+    ) -> None:
         child_logger = logger.getChild("APIClient")
         self.logger = child_logger
-        self.logger.debug("Finished initializing APIClient!")
+        self.timeout = (connect_timeout, read_timeout)
+        # block instead of opening throwaway connections when the pool is exhausted
+        self.adapter = HTTPAdapter(pool_maxsize=pool_size, pool_block=True)
+        self._local = threading.local()
+        self.logger.debug(
+            f"Finished initializing APIClient with {pool_size=} and {self.timeout=}!"
+        )
+
+    @property
+    def session(self) -> requests.Session:
+        """Return the calling thread's session, which uses the shared connection pool."""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("http://", self.adapter)
+            session.mount("https://", self.adapter)
+            self._local.session = session
+        return session
+
+    def pool_stats(self) -> dict[str, int]:
+        """Return how many requests were sent and how many connections were opened."""
+        requests_sent = 0
+        new_connections = 0
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool:
+                requests_sent += pool.num_requests
+                new_connections += pool.num_connections
+        return {
+            "requests": requests_sent,
+            "new_connections": new_connections,
+            "reused_connections": max(requests_sent - new_connections, 0),
+        }
 
     @tenacity.retry(
         retry=tenacity.retry_if_not_exception_type(exc.ProductNotFoundException),
@@ -34,7 +81,7 @@ class APIClient:
             product_id
         )
         try:
-            response = requests.get(url)
+            response = self.session.get(url, timeout=self.timeout)
             if response.status_code == requests.codes.ok:
                 self.logger.debug(f"Successfully retrieved {product_id=}!")
                 return response.json()
@@ -48,6 +95,34 @@ class APIClient:
             self.logger.exception(f"A different error has occurred: {e}")
             raise exc.APIServerException(500)
 
+    @tenacity.retry(
+        stop=tenacity.stop_after_attempt(c.GROCERY_API_SERVER_RETRIES),
+        wait=tenacity.wait_exponential(
+            multiplier=c.GROCERY_API_SERVER_BACKOFF_EXPONENTIAL_FACTOR,
+            min=c.GROCERY_API_SERVER_BACKOFF_MINIMUM,
+            max=c.GROCERY_API_SERVER_BACKOFF_MAXIMUM,
+        ),
+    )
+    def get_products_details(
+        self, product_ids: list[int]
+    ) -> dict[str, list[dict[str, str | int | float]]] | None:
+        """Return the details of several products; non-existing products are left out."""
+        self.logger.debug(f"Getting details of {len(product_ids)} products...")
+        url = c.GROCERY_API_SERVER_BASE_URL + c.GROCERY_API_SERVER_GET_PRODUCTS
+        try:
+            response = self.session.post(
+                url, json={"skus": product_ids}, timeout=self.timeout
+            )
+            if response.status_code == requests.codes.ok:
+                self.logger.debug("Successfully retrieved product details!")
+                return response.json()
+            response.raise_for_status()
+        except requests.exceptions.HTTPError as err:
+            raise exc.APIServerException(err.response.status_code)
+        except Exception as e:
+            self.logger.exception(f"A different error has occurred: {e}")
+            raise exc.APIServerException(500)
+
     @tenacity.retry(
         stop=tenacity.stop_after_attempt(c.GROCERY_API_SERVER_RETRIES),
         wait=tenacity.wait_exponential(
@@ -57,14 +132,21 @@ class APIClient:
         ),
     )
     def get_product_listing(
-        self, page: int, products_per_page: int
+        self, page: int, products_per_page: int, after_sku: int | None = None
     ) -> dict[str, int | str | list[dict[str, str | int]]] | None:
-        """Return a page of the store catalog."""
-        self.logger.debug(f"Getting {page=} and {products_per_page=}...")
+        """
+        Return a page of the store catalog.
+        If `after_sku` is given, the page starts right after that SKU and `page` is ignored.
+        """
+        self.logger.debug(f"Getting {page=}, {after_sku=} and {products_per_page=}...")
         url = c.GROCERY_API_SERVER_BASE_URL + c.GROCERY_API_SERVER_GET_LISTING
-        params = {"page": page, "products_per_page": products_per_page}
+        params = {"products_per_page": products_per_page}
+        if after_sku is None:
+            params["page"] = page
+        else:
+            params["after_sku"] = after_sku
         try:
-            response = requests.get(url, params=params)
+            response = self.session.get(url, params=params, timeout=self.timeout)
             if response.status_code == requests.codes.ok:
                 self.logger.debug("Successfully retrieved listing!")
                 return response.json()
@@ -74,3 +156,58 @@ class APIClient:
         except Exception as e:
             self.logger.exception(f"A different error has occurred: {e}")
             raise exc.APIServerException(500)
+
+    @tenacity.retry(
+        stop=tenacity.stop_after_attempt(c.GROCERY_API_SERVER_RETRIES),
+        wait=tenacity.wait_exponential(
+            multiplier=c.GROCERY_API_SERVER_BACKOFF_EXPONENTIAL_FACTOR,
+            min=c.GROCERY_API_SERVER_BACKOFF_MINIMUM,
+            max=c.GROCERY_API_SERVER_BACKOFF_MAXIMUM,
+        ),
+    )
+    def get_catalog_changes(
+        self, since: int | None, limit: int = c.CATALOG_CHANGES_PER_PAGE
+    ) -> dict[str, int | str | list[dict[str, str | int | None]]] | None:
+        """
+        Return a page of the products changed after catalog version `since`.
+        If `since` isn't given, only the current catalog version is returned.
+        """
+        self.logger.debug(f"Getting catalog changes, {since=} and {limit=}...")
+        url = c.GROCERY_API_SERVER_BASE_URL + c.GROCERY_API_SERVER_GET_CHANGES
+        params = {"limit": limit}
+        if since is not None:
+            params["since"] = since
+        try:
+            response = self.session.get(url, params=params, timeout=self.timeout)
+            if response.status_code == requests.codes.ok:
+                self.logger.debug("Successfully retrieved catalog changes!")
+                return response.json()
+            response.raise_for_status()
+        except requests.exceptions.HTTPError as err:
+            raise exc.APIServerException(err.response.status_code)
+        except Exception as e:
+            self.logger.exception(f"A different error has occurred: {e}")
+            raise exc.APIServerException(500)
+
+    def stream_product_catalog(self) -> Iterator[dict[str, str | int]]:
+        """
+        Yield the products of the store catalog as they arrive from the API server.
+        This is not retried, since a partially consumed stream can't be resumed.
+        """
+        self.logger.debug("Streaming store catalog...")
+        url = c.GROCERY_API_SERVER_BASE_URL + c.GROCERY_API_SERVER_EXPORT_CATALOG
+        try:
+            response = self.session.get(url, stream=True, timeout=self.timeout)
+            try:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if line:
+                        yield json.loads(line)
+            finally:
+                response.close()
+            self.logger.debug("Successfully streamed store catalog!")
+        except requests.exceptions.HTTPError as err:
+            raise exc.APIServerException(err.response.status_code)
+        except Exception as e:
+            self.logger.exception(f"A different error has occurred: {e}")
+            raise exc.APIServerException(500)
@@ -0,0 +1,114 @@
+"""This module defines the AsyncAPIClient class."""
+
+import asyncio
+import logging
+import threading
+import weakref
+
+import httpx
+import tenacity
+
+from apps.agent.dependencies import constants as c, exceptions as exc
+
+
+class AsyncAPIClient:
+    """
+    This class acts as an asynchronous wrapper for the "httpx" library.
+    The underlying connection pool is tied to an event loop, so one is kept per loop;
+    it's dropped along with its loop, and aclose() closes the one of the running loop.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        pool_size: int = c.GROCERY_API_SERVER_POOL_SIZE,
+        connect_timeout: float = c.GROCERY_API_SERVER_CONNECT_TIMEOUT,
+        read_timeout: float = c.GROCERY_API_SERVER_READ_TIMEOUT,
+    ) -> None:
+        child_logger = logger.getChild("AsyncAPIClient")
+        self.logger = child_logger
+        self.limits = httpx.Limits(
+            max_connections=pool_size, max_keepalive_connections=pool_size
+        )
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self._clients = weakref.WeakKeyDictionary()
+        self._clients_lock = threading.Lock()
+        self.logger.debug(f"Finished initializing AsyncAPIClient with {pool_size=}!")
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Return the pooled client for the running event loop."""
+        loop = asyncio.get_running_loop()
+        with self._clients_lock:
+            client = self._clients.get(loop)
+            if client is None:
+                client = httpx.AsyncClient(
+                    base_url=c.GROCERY_API_SERVER_BASE_URL,
+                    limits=self.limits,
+                    timeout=self.timeout,
+                )
+                self._clients[loop] = client
+        return client
+
+    async def aclose(self) -> None:
+        """Close the pooled connections of the running event loop."""
+        with self._clients_lock:
+            client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    @tenacity.retry(
+        retry=tenacity.retry_if_not_exception_type(exc.ProductNotFoundException),
+        stop=tenacity.stop_after_attempt(c.GROCERY_API_SERVER_RETRIES),
+        wait=tenacity.wait_exponential(
+            multiplier=c.GROCERY_API_SERVER_BACKOFF_EXPONENTIAL_FACTOR,
+            min=c.GROCERY_API_SERVER_BACKOFF_MINIMUM,
+            max=c.GROCERY_API_SERVER_BACKOFF_MAXIMUM,
+        ),
+    )
+    async def get_product_details(
+        self, product_id: int
+    ) -> dict[str, dict[str, str | int | float]] | None:
+        """Return a product's details."""
+        self.logger.debug(f"Getting details of {product_id=}...")
+        url = c.GROCERY_API_SERVER_GET_PRODUCT.format(product_id)
+        try:
+            response = await self.client.get(url)
+            if response.status_code == httpx.codes.OK:
+                self.logger.debug(f"Successfully retrieved {product_id=}!")
+                return response.json()
+            response.raise_for_status()
+        except httpx.HTTPStatusError as err:
+            status_code = err.response.status_code
+            if status_code == httpx.codes.NOT_FOUND:
+                raise exc.ProductNotFoundException()
+            raise exc.APIServerException(status_code)
+        except Exception as e:
+            self.logger.exception(f"A different error has occurred: {e}")
+            raise exc.APIServerException(500)
+
+    @tenacity.retry(
+        stop=tenacity.stop_after_attempt(c.GROCERY_API_SERVER_RETRIES),
+        wait=tenacity.wait_exponential(
+            multiplier=c.GROCERY_API_SERVER_BACKOFF_EXPONENTIAL_FACTOR,
+            min=c.GROCERY_API_SERVER_BACKOFF_MINIMUM,
+            max=c.GROCERY_API_SERVER_BACKOFF_MAXIMUM,
+        ),
+    )
+    async def get_products_details(
+        self, product_ids: list[int]
+    ) -> dict[str, list[dict[str, str | int | float]]] | None:
+        """Return the details of several products; non-existing products are left out."""
+        self.logger.debug(f"Getting details of {len(product_ids)} products...")
+        url = c.GROCERY_API_SERVER_GET_PRODUCTS
+        try:
+            response = await self.client.post(url, json={"skus": product_ids})
+            if response.status_code == httpx.codes.OK:
+                self.logger.debug("Successfully retrieved product details!")
+                return response.json()
+            response.raise_for_status()
+        except httpx.HTTPStatusError as err:
+            raise exc.APIServerException(err.response.status_code)
+        except Exception as e:
+            self.logger.exception(f"A different error has occurred: {e}")
+            raise exc.APIServerException(500)
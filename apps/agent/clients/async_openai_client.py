@@ -0,0 +1,104 @@
+"""This module defines the AsyncOpenAIClient class."""
+
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Callable
+
+import openai
+import pydantic
+import tenacity
+from openai.types.responses import Response
+
+from apps.agent.clients.openai_client import retryable_exceptions
+from apps.agent.dependencies import constants as c
+
+
+class AsyncOpenAIClient:
+    """
+    This class acts as a wrapper for the asynchronous openai client.
+    Like AsyncAPIClient, one openai client is kept per event loop.
+    """
+
+    def __init__(self, api_key: str, model: str, logger: logging.Logger) -> None:
+        child_logger = logger.getChild("AsyncOpenAIClient")
+        self.logger = child_logger
+        self.api_key = api_key
+        self.model = model
+        self._clients = weakref.WeakKeyDictionary()
+        self._clients_lock = threading.Lock()
+        self.logger.debug(
+            f"Finished initializing AsyncOpenAIClient with {self.model=}!"
+        )
+
+    @property
+    def client(self) -> openai.AsyncOpenAI:
+        """Return the openai client for the running event loop."""
+        loop = asyncio.get_running_loop()
+        with self._clients_lock:
+            client = self._clients.get(loop)
+            if client is None:
+                client = openai.AsyncOpenAI(api_key=self.api_key)
+                self._clients[loop] = client
+        return client
+
+    async def aclose(self) -> None:
+        """Close the openai client of the running event loop."""
+        with self._clients_lock:
+            client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+
+    @tenacity.retry(
+        retry=tenacity.retry_if_exception_type(retryable_exceptions),
+        stop=tenacity.stop_after_attempt(c.OPENAI_PLATFORM_RETRIES),
+        wait=tenacity.wait_exponential(
+            multiplier=c.OPENAI_PLATFORM_BACKOFF_EXPONENTIAL_FACTOR,
+            min=c.OPENAI_PLATFORM_BACKOFF_MINIMUM,
+            max=c.OPENAI_PLATFORM_BACKOFF_MAXIMUM,
+        ),
+    )
+    async def _send_request(self, func: Callable, prompt: str, **kwargs) -> Response:
+        """
+        Send a request to the model and return its response.
+        This is used internally by the methods that expect different response formats
+        """
+        self.logger.debug(f"Sending request to model {self.model=}")
+        try:
+            response = await func(
+                model=self.model, input=prompt, temperature=0, **kwargs
+            )
+            self.logger.debug("Got response from model!")
+            return response
+        except Exception as e:
+            self.logger.exception(f"Got exception when requesting from model: {e}")
+            raise e
+
+    async def request_string_response(self, prompt: str) -> str:
+        """Request a string response from the model."""
+        self.logger.debug("Requesting string response from model...")
+        func = self.client.responses.create
+        response = await self._send_request(func, prompt)
+        self.logger.debug("Successfully received string response!")
+        return response.output_text
+
+    async def request_json_response(self, prompt: str) -> str:
+        """Request a JSON response from the model."""
+        self.logger.debug("Requesting JSON response from model...")
+        func = self.client.responses.create
+        response = await self._send_request(
+            func, prompt, text={"format": {"type": "json_object"}}
+        )
+        self.logger.debug("Successfully received JSON response!")
+        return response.output_text
+
+    async def request_structured_response(
+        self, prompt: str, response_model: type[pydantic.BaseModel]
+    ) -> pydantic.BaseModel:
+        """Request a response in a Pydantic model."""
+        self.logger.debug("Requesting structured response from model...")
+        func = self.client.responses.parse
+        response = await self._send_request(func, prompt, text_format=response_model)
+        self.logger.debug("Successfully received structured response!")
+        return response.output_parsed
@@ -0,0 +1,193 @@
+"""This module defines the LRUCache class."""
+
+import atexit
+import collections
+import json
+import pathlib
+import sqlite3
+import threading
+import time
+from typing import Any
+
+
+class LRUCache:
+    """
+    This class is a thread-safe, in-memory LRU cache whose entries expire after a TTL.
+    If a database file is given, entries are also written to an SQLite table,
+    so that they survive restarts; values must then be JSON serializable.
+    Writes to the table are batched, and committed every `flush_every` writes or
+    `flush_interval` seconds; each commit also drops the expired rows, and the oldest
+    rows beyond `db_max_size` (`max_size` by default), so the table stays bounded.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: float | None = None,
+        db_file: pathlib.Path | str | None = None,
+        table: str = "cache",
+        db_max_size: int | None = None,
+        flush_every: int = 100,
+        flush_interval: float = 5.0,
+    ) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.table = table
+        self.db_max_size = db_max_size if db_max_size is not None else max_size
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (value, expiry timestamp or None), least recently used first
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        # key -> (JSON value, expiry timestamp or None) to write, or None to delete
+        self._pending = {}
+        self._last_flush = time.monotonic()
+        # serializes the use of the database connection; taken before `_lock`
+        self._db_lock = threading.Lock()
+        if db_file is not None:
+            self._db = sqlite3.connect(db_file, check_same_thread=False)
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+            self._db.commit()
+            # pending writes would otherwise be lost when the process exits
+            atexit.register(self.flush)
+
+    def __len__(self) -> int:
+        """Return the number of entries held in memory."""
+        return len(self._entries)
+
+    def get(self, key: str) -> Any | None:
+        """Return the value cached under the key, or None if it's missing or expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._pending.get(key) is not None:
+                entry = self._decode(self._pending[key])
+            load = entry is None and self._db is not None and key not in self._pending
+        if load:
+            # read outside of `_lock`, so that a slow read only holds up other reads
+            with self._db_lock:
+                entry = self._load(key)
+        with self._lock:
+            if load and (key in self._entries or key in self._pending):
+                # the key was written or deleted while it was being read
+                entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= now:
+                self._delete(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._evict()
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, value: Any) -> None:
+        """Cache the value under the key."""
+        expires_at = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            self._evict()
+            if self._db is not None:
+                self._pending[key] = (json.dumps(value), expires_at)
+        self._maybe_flush()
+
+    def delete(self, key: str) -> None:
+        """Remove the key from the cache."""
+        with self._lock:
+            self._delete(key)
+        self._maybe_flush()
+
+    def clear(self) -> None:
+        """Remove every entry from the cache."""
+        with self._db_lock, self._lock:
+            self._entries.clear()
+            self._pending.clear()
+            if self._db is not None:
+                self._db.execute(f"DELETE FROM {self.table}")
+                self._db.commit()
+
+    def flush(self) -> None:
+        """
+        Write the pending entries to the database and commit them,
+        then drop the expired rows and the oldest rows beyond `db_max_size`.
+        """
+        if self._db is None:
+            return
+        with self._db_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._last_flush = time.monotonic()
+            deleted = [(key,) for key, row in pending.items() if row is None]
+            written = [(key, *row) for key, row in pending.items() if row is not None]
+            self._db.executemany(f"DELETE FROM {self.table} WHERE key = ?", deleted)
+            # a replaced row gets a new rowid, so rowids follow the order of the writes
+            self._db.executemany(
+                f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?)", written
+            )
+            self._db.execute(
+                f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time(),)
+            )
+            self._db.execute(
+                f"DELETE FROM {self.table} WHERE rowid NOT IN "
+                f"(SELECT rowid FROM {self.table} ORDER BY rowid DESC LIMIT ?)",
+                (self.db_max_size,),
+            )
+            self._db.commit()
+
+    def stats(self) -> dict[str, int]:
+        """Return the cache statistics."""
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _load(self, key: str) -> tuple[Any, float | None] | None:
+        """Return the entry stored in the database under the key."""
+        row = self._db.execute(
+            f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return self._decode(row)
+
+    @staticmethod
+    def _decode(row: tuple[str, float | None]) -> tuple[Any, float | None]:
+        """Return the entry held by a database row, or a pending write."""
+        return json.loads(row[0]), row[1]
+
+    def _delete(self, key: str) -> None:
+        """Remove the key from memory, and queue its removal from the database."""
+        self._entries.pop(key, None)
+        if self._db is not None:
+            self._pending[key] = None
+
+    def _evict(self) -> None:
+        """Drop the least recently used entries from memory until the cache fits."""
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _maybe_flush(self) -> None:
+        """Flush the pending writes if there are enough of them, or they're old enough."""
+        if self._pending and (
+            len(self._pending) >= self.flush_every
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+
+def normalize_text(text: str) -> str:
+    """Normalize a text, e.g. a grocery list line, for use as a cache key."""
+    return " ".join(text.split()).casefold()
@@ -7,22 +7,80 @@ PARSER_PROMPT_FILE = "assets/parser_prompt.txt"
 PARSER_DUMMY_RESPONSES = "assets/responses/parser"
 RECOMMENDER_PROMPT_FILE = "assets/recommender_prompt.txt"
 RECOMMENDER_DUMMY_RESPONSES = "assets/responses/recommender"
+# how often, in seconds, the prompt files are checked for changes
+PROMPT_RELOAD_CHECK_INTERVAL = 5
+
+PARSER_CACHE_MAX_SIZE = 10_000
+PARSER_CACHE_TTL = 7 * 24 * 60 * 60
+# set to a file name, e.g. "parser_cache.db", to keep the parsed lines across restarts
+PARSER_CACHE_DB_FILE = None
+# long grocery lists are parsed in chunks of this many lines, some of them concurrently
+PARSER_CHUNK_SIZE = 25
+PARSER_MAX_CONCURRENT_CHUNKS = 4
+# lines the rule-based parser parses with at least this confidence skip the LLM;
+# set to None to send every line to the LLM
+RULE_PARSER_MIN_CONFIDENCE = 0.85
+# also cleared whenever a new store catalog is loaded
+RECOMMENDER_CACHE_MAX_SIZE = 10_000
+RECOMMENDER_CACHE_TTL = 24 * 60 * 60
+# set to a number of lines to send each group of lines in its own, concurrent request;
+# None sends the whole grocery list in a single request
+RECOMMENDER_GROUP_SIZE = None
+RECOMMENDER_MAX_CONCURRENT_REQUESTS = 4
 
 GROCERY_API_SERVER_BASE_URL = "http://localhost:8000"
 GROCERY_API_SERVER_GET_LISTING = "/api/v1/products/"
 GROCERY_API_SERVER_GET_PRODUCT = "/api/v1/products/{}"
+GROCERY_API_SERVER_GET_PRODUCTS = "/api/v1/products/batch"
+GROCERY_API_SERVER_EXPORT_CATALOG = "/api/v1/products/export"
+GROCERY_API_SERVER_GET_CHANGES = "/api/v1/products/changes"
 GROCERY_API_SERVER_HEALTH_CHECK = "/health"
 
 GROCERY_API_SERVER_RETRIES = 3
 GROCERY_API_SERVER_BACKOFF_EXPONENTIAL_FACTOR = 1
 GROCERY_API_SERVER_BACKOFF_MINIMUM = 2
 GROCERY_API_SERVER_BACKOFF_MAXIMUM = 10
+GROCERY_API_SERVER_MAX_PRODUCTS_PER_BATCH = 100
+GROCERY_API_SERVER_POOL_SIZE = 10
+GROCERY_API_SERVER_MAX_CONCURRENT_REQUESTS = 10
+GROCERY_API_SERVER_CONNECT_TIMEOUT = 3.05
+GROCERY_API_SERVER_READ_TIMEOUT = 30
 
 OPENAI_PLATFORM_RETRIES = 3
 OPENAI_PLATFORM_BACKOFF_EXPONENTIAL_FACTOR = 1
 OPENAI_PLATFORM_BACKOFF_MINIMUM = 2
 OPENAI_PLATFORM_BACKOFF_MAXIMUM = 10
 
+# set to a file name, e.g. "catalog.snapshot", to let the web workers memory-map
+# a single copy of the store catalog; it's reloaded once older than the max age
+CATALOG_SNAPSHOT_FILE = None
+CATALOG_SNAPSHOT_MAX_AGE = 60 * 60
+# how often, in seconds, the catalog changes are fetched from the API server in the
+# background and applied to the loaded catalog; set to None to only load it at startup
+CATALOG_REFRESH_INTERVAL = 5 * 60
+CATALOG_CHANGES_PER_PAGE = 500
+
+PRODUCT_DETAILS_CACHE_MAX_SIZE = 10_000
+# how long, in seconds, each field of the cached product details stays fresh; the API server
+# returns both at once, so a product is fetched again as soon as either field is stale
+PRODUCT_DETAILS_TTLS = {"unit_price": 60 * 60, "qty_in_stock": 5 * 60}
+# set to a file name, e.g. "product_details.db", to keep the product details across restarts
+PRODUCT_DETAILS_CACHE_DB_FILE = None
+
 EMPTY_PRODUCT_DETAILS = {"data": {"sku": -1, "qty_in_stock": -1, "unit_price": -1}}
 FUZZY_FILTER_TOP_N = 10
 FUZZY_FILTER_MIN_SCORE = 50
+# score all grocery list lines in one matrix call, using every core
+FUZZY_FILTER_BATCHED = True
+FUZZY_FILTER_WORKERS = -1
+# only score catalog entries sharing a token or trigram with the query, unless
+# the N-th best of them scores below this; set to None to always do a full scan
+FUZZY_FILTER_PREFILTER_SCORE = 70
+# drop candidates scoring more than this below the best one (None keeps them all),
+# and candidates with the same full name as a better one, to keep prompts small
+FUZZY_FILTER_MAX_SCORE_GAP = 20
+FUZZY_FILTER_DEDUPE = True
+# recommend a line's best fuzzy match without the LLM if it scores at least
+# FAST_ACCEPT_MIN_SCORE, and beats the next one by FAST_ACCEPT_MIN_MARGIN; set to None to disable
+FAST_ACCEPT_MIN_SCORE = 90
+FAST_ACCEPT_MIN_MARGIN = 20
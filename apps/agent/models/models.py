@@ -32,16 +32,28 @@ class ParsedGroceryList(BaseModel):
 
 
 class CatalogForFuzzyMatching(BaseModel):
-    """Schema of the data to be forwarded to the fuzzy matching service."""
+    """
+    Schema of the data to be forwarded to the fuzzy matching service;
+    the catalog may be left out if the catalog index is given instead.
+    """
 
-    catalog: ProductCatalog
+    catalog: ProductCatalog | None = None
     grocery_list: ParsedGroceryList
 
 
+class CandidateLineItem(ProductLineItem):
+    """
+    Schema for a candidate product of a grocery list line;
+    the fuzzy matching score is left out when serializing.
+    """
+
+    score: float | None = Field(default=None, exclude=True)
+
+
 class PrunedCatalogPerGroceryListLine(ParsedLineItem):
     """Schema of the per-line subset of the store catalog."""
 
-    candidates: list[ProductLineItem] = Field(default_factory=list)
+    candidates: list[CandidateLineItem] = Field(default_factory=list)
 
 
 class PrunedCatalogList(BaseModel):
@@ -1,5 +1,6 @@
 """This module contains all orchestration logic."""
 
+import asyncio
 import logging
 import os
 import pathlib
@@ -7,13 +8,15 @@ from typing import Any
 
 from dotenv import load_dotenv
 
-from apps.agent.dependencies import constants
+from apps.agent.dependencies import cache, constants
 from apps.agent.models import models
 from apps.agent.services import (
+    fast_accept as fa,
     fuzzy_filter as ff,
     inventory as inv,
     parser,
     recommender,
+    rule_parser as rp,
 )
 
 
@@ -31,11 +34,14 @@ class GroceryAgent:
         fuzzy_filter_svc: ff.FuzzyFilterService,
         api_key: str,
         logger: logging.Logger,
+        fast_accept_svc: fa.FastAcceptService | None = None,
     ) -> None:
         self.parser_svc = parser_svc
         self.recommender_svc = recommender_svc
         self.inventory_svc = inventory_svc
         self.fuzzy_filter_svc = fuzzy_filter_svc
+        # None sends every line to the recommender
+        self.fast_accept_svc = fast_accept_svc
         self.api_key = api_key
         self.logger = logger
         self.logger.debug("Successfully initialized the agent!")
@@ -50,11 +56,11 @@ class GroceryAgent:
         """
         Process the grocery list depending on whether the OpenAI API key exists.
         If the key is present, the normal processing flow is followed, i.e.
-            parser -> fuzzy filter -> recommender -> inventory
+            parser -> fuzzy filter -> fast accept -> recommender -> inventory
         Otherwise, the parser & recommender outputs are mocked, and fuzzy filter is skipped.
         """
         self.logger.debug(f"Processing grocery list, {filename=}, {grocery_text=}...")
-        if not self.inventory_svc.catalog.catalog:
+        if not self.inventory_svc.catalog_index:
             self.logger.warning(
                 "No store catalog found, no recommendations can be generated!"
             )
@@ -70,6 +76,29 @@ class GroceryAgent:
         self.logger.debug("Successfully processed grocery list!")
         return resp.model_dump()
 
+    async def aprocess(self, filename: str, grocery_text: str) -> dict[str, Any]:
+        """
+        Process the grocery list like process(), but without blocking on I/O,
+        so that one event loop can serve many grocery lists at the same time.
+        The fuzzy filter is CPU-bound, so it runs in a worker thread.
+        """
+        self.logger.debug(f"Processing grocery list, {filename=}, {grocery_text=}...")
+        if not self.inventory_svc.catalog_index:
+            self.logger.warning(
+                "No store catalog found, no recommendations can be generated!"
+            )
+            return models.AgentRecommendationList(recommendations=[]).model_dump()
+
+        if self.api_key:
+            self.logger.debug("Will be using LLMs for parsing and recommending...")
+            llm_recommendations = await self._ause_llms(grocery_text)
+        else:
+            self.logger.debug("Will be mocking parsing and recommending...")
+            llm_recommendations = self._mock_llms(filename)
+        resp = await self.inventory_svc.aget_final_recommendations(llm_recommendations)
+        self.logger.debug("Successfully processed grocery list!")
+        return resp.model_dump()
+
     def _use_llms(self, grocery_text: str) -> models.LLMRecommendationList:
         """Use LLMs for parsing and recommending."""
         llm_recommendations = models.LLMRecommendationList(recommendations=[])
@@ -79,27 +108,88 @@ class GroceryAgent:
                 f"Problem parsing the grocery list; setting {llm_recommendations=}!"
             )
             return llm_recommendations
-        data = models.CatalogForFuzzyMatching(
-            grocery_list=parsed_grocery_text, catalog=self.inventory_svc.catalog
+        data = models.CatalogForFuzzyMatching(grocery_list=parsed_grocery_text)
+        pruned_catalog_list = self.fuzzy_filter_svc.filter_catalog(
+            data, self.inventory_svc.catalog_index
         )
-        pruned_catalog_list = self.fuzzy_filter_svc.filter_catalog(data)
         if not pruned_catalog_list:
             self.logger.warning(
                 f"Problem pruning the store catalog; setting {llm_recommendations=}!"
             )
             return llm_recommendations
-        product_recommendations = self.recommender_svc.recommend_products(
-            pruned_catalog_list
-        )
+        accepted, remaining = self._fast_accept(pruned_catalog_list)
+        if accepted and not remaining.lines:
+            self.logger.debug("Every line was accepted, skipping the recommender...")
+            product_recommendations = models.LLMRecommendationList(recommendations=[])
+        else:
+            product_recommendations = self.recommender_svc.recommend_products(
+                remaining, self.inventory_svc.catalog_version
+            )
         if not product_recommendations:
             self.logger.warning(
                 f"Problem retrieving product recommendations; setting {llm_recommendations=}!"
             )
+            product_recommendations = llm_recommendations
+        if accepted:
+            product_recommendations = self.fast_accept_svc.merge(
+                pruned_catalog_list, accepted, product_recommendations
+            )
+        llm_recommendations = product_recommendations
+
+        return llm_recommendations
+
+    async def _ause_llms(self, grocery_text: str) -> models.LLMRecommendationList:
+        """Use LLMs for parsing and recommending, without blocking the event loop."""
+        llm_recommendations = models.LLMRecommendationList(recommendations=[])
+        parsed_grocery_text = await self.parser_svc.aparse_grocery_text(grocery_text)
+        if not parsed_grocery_text:
+            self.logger.warning(
+                f"Problem parsing the grocery list; setting {llm_recommendations=}!"
+            )
+            return llm_recommendations
+        data = models.CatalogForFuzzyMatching(grocery_list=parsed_grocery_text)
+        pruned_catalog_list = await asyncio.to_thread(
+            self.fuzzy_filter_svc.filter_catalog,
+            data,
+            self.inventory_svc.catalog_index,
+        )
+        if not pruned_catalog_list:
+            self.logger.warning(
+                f"Problem pruning the store catalog; setting {llm_recommendations=}!"
+            )
+            return llm_recommendations
+        accepted, remaining = self._fast_accept(pruned_catalog_list)
+        if accepted and not remaining.lines:
+            self.logger.debug("Every line was accepted, skipping the recommender...")
+            product_recommendations = models.LLMRecommendationList(recommendations=[])
         else:
-            llm_recommendations = product_recommendations
+            product_recommendations = await self.recommender_svc.arecommend_products(
+                remaining, self.inventory_svc.catalog_version
+            )
+        if not product_recommendations:
+            self.logger.warning(
+                f"Problem retrieving product recommendations; setting {llm_recommendations=}!"
+            )
+            product_recommendations = llm_recommendations
+        if accepted:
+            product_recommendations = self.fast_accept_svc.merge(
+                pruned_catalog_list, accepted, product_recommendations
+            )
+        llm_recommendations = product_recommendations
 
         return llm_recommendations
 
+    def _fast_accept(
+        self, pruned_catalog_list: models.PrunedCatalogList
+    ) -> tuple[
+        dict[int, models.LLMRecommendationListPerGroceryListLine],
+        models.PrunedCatalogList,
+    ]:
+        """Return the lines accepted without the recommender, and the remaining lines."""
+        if self.fast_accept_svc is None:
+            return {}, pruned_catalog_list
+        return self.fast_accept_svc.accept(pruned_catalog_list)
+
     def _mock_llms(self, filename: str) -> models.LLMRecommendationList:
         """Mock responses of LLMs for parsing and recommending."""
         parsed_grocery_text = self.parser_svc.return_mocked_response(filename)
@@ -143,30 +233,98 @@ def init_agent(catalog_source: str = "api") -> GroceryAgent:
     base_prompt_file = basedir / constants.PARSER_PROMPT_FILE
     dummy_responses_folder = basedir / constants.PARSER_DUMMY_RESPONSES
     model_name = constants.PARSER_LLM_MODEL
+    parser_cache = cache.LRUCache(
+        max_size=constants.PARSER_CACHE_MAX_SIZE,
+        ttl=constants.PARSER_CACHE_TTL,
+        db_file=constants.PARSER_CACHE_DB_FILE,
+        table="parsed_lines",
+    )
+    rule_parser_svc = (
+        rp.RuleParserService(constants.RULE_PARSER_MIN_CONFIDENCE, logger)
+        if constants.RULE_PARSER_MIN_CONFIDENCE is not None
+        else None
+    )
     parser_svc = parser.ParserService(
-        api_key, model_name, base_prompt_file, dummy_responses_folder, logger
+        api_key,
+        model_name,
+        base_prompt_file,
+        dummy_responses_folder,
+        logger,
+        cache=parser_cache,
+        chunk_size=constants.PARSER_CHUNK_SIZE,
+        max_concurrent_chunks=constants.PARSER_MAX_CONCURRENT_CHUNKS,
+        rule_parser=rule_parser_svc,
     )
     base_prompt_file = basedir / constants.RECOMMENDER_PROMPT_FILE
     dummy_responses_folder = basedir / constants.RECOMMENDER_DUMMY_RESPONSES
     model_name = constants.RECOMMENDER_LLM_MODEL
+    recommender_cache = cache.LRUCache(
+        max_size=constants.RECOMMENDER_CACHE_MAX_SIZE,
+        ttl=constants.RECOMMENDER_CACHE_TTL,
+    )
     recommender_svc = recommender.RecommenderService(
-        api_key, model_name, base_prompt_file, dummy_responses_folder, logger
+        api_key,
+        model_name,
+        base_prompt_file,
+        dummy_responses_folder,
+        logger,
+        cache=recommender_cache,
+        group_size=constants.RECOMMENDER_GROUP_SIZE,
+        max_concurrent_requests=constants.RECOMMENDER_MAX_CONCURRENT_REQUESTS,
     )
 
-    inventory_svc = inv.InventoryService(logger)
+    if not api_key:
+        logger.info("Preloading mocked responses...")
+        parser_svc.preload_mocked_responses()
+        recommender_svc.preload_mocked_responses()
+
+    details_cache = cache.LRUCache(
+        max_size=constants.PRODUCT_DETAILS_CACHE_MAX_SIZE,
+        ttl=min(constants.PRODUCT_DETAILS_TTLS.values()),
+        db_file=constants.PRODUCT_DETAILS_CACHE_DB_FILE,
+        table="product_details",
+    )
+    inventory_svc = inv.InventoryService(
+        logger,
+        snapshot_file=constants.CATALOG_SNAPSHOT_FILE,
+        snapshot_max_age=constants.CATALOG_SNAPSHOT_MAX_AGE,
+        details_cache=details_cache,
+    )
     fuzzy_filter_svc = ff.FuzzyFilterService(
         top_n=constants.FUZZY_FILTER_TOP_N,
         min_score=constants.FUZZY_FILTER_MIN_SCORE,
         logger=logger,
+        batched=constants.FUZZY_FILTER_BATCHED,
+        workers=constants.FUZZY_FILTER_WORKERS,
+        prefilter_score=constants.FUZZY_FILTER_PREFILTER_SCORE,
+        max_score_gap=constants.FUZZY_FILTER_MAX_SCORE_GAP,
+        dedupe=constants.FUZZY_FILTER_DEDUPE,
+    )
+    fast_accept_svc = (
+        fa.FastAcceptService(
+            min_score=constants.FAST_ACCEPT_MIN_SCORE,
+            min_margin=constants.FAST_ACCEPT_MIN_MARGIN,
+            logger=logger,
+        )
+        if constants.FAST_ACCEPT_MIN_SCORE is not None
+        else None
     )
     grocery_agent = GroceryAgent(
-        parser_svc, recommender_svc, inventory_svc, fuzzy_filter_svc, api_key, logger
+        parser_svc,
+        recommender_svc,
+        inventory_svc,
+        fuzzy_filter_svc,
+        api_key,
+        logger,
+        fast_accept_svc=fast_accept_svc,
     )
     logger.info("Done initializing agent.")
 
     logger.info("Retrieving store catalog...")
     grocery_agent.load_catalog(source=catalog_source)
     logger.info("Done retrieving store catalog.")
+    if constants.CATALOG_REFRESH_INTERVAL is not None and catalog_source != "file":
+        inventory_svc.start_refresh(constants.CATALOG_REFRESH_INTERVAL)
     return grocery_agent
 
 
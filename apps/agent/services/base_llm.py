@@ -3,13 +3,21 @@
 import json
 import logging
 import pathlib
+import threading
+import time
+import types
 
+from apps.agent.dependencies import constants as c
 from apps.agent.models import models
-from apps.agent.clients import openai_client
+from apps.agent.clients import async_openai_client, openai_client
 
 
 class BaseLLMService:
-    """This class is responsible for prompting the LLM."""
+    """
+    This class is responsible for prompting the LLM.
+    The base prompt is kept in memory, and the file is only checked for changes
+    every PROMPT_RELOAD_CHECK_INTERVAL seconds.
+    """
 
     def __init__(
         self,
@@ -22,6 +30,14 @@ class BaseLLMService:
         self.api_key = api_key
         self.base_prompt_file = base_prompt_file
         self.dummy_responses_folder = dummy_responses_folder
+        self.prompt_reload_check_interval = c.PROMPT_RELOAD_CHECK_INTERVAL
+        self.prompt_reloads = 0
+        self._base_prompt = None
+        self._base_prompt_mtime = None
+        self._base_prompt_checked_at = None
+        self._base_prompt_lock = threading.Lock()
+        # set by preload_mocked_responses()
+        self.mocked_responses = None
         class_name = self.__class__.__name__
         child_logger = logger.getChild(class_name)
         self.logger = child_logger
@@ -30,14 +46,85 @@ class BaseLLMService:
             if self.api_key
             else None
         )
+        self.async_client = (
+            async_openai_client.AsyncOpenAIClient(self.api_key, model_name, self.logger)
+            if self.api_key
+            else None
+        )
         self.logger.debug(
             f"Finished initializing {class_name} with {self. base_prompt_file=}!"
         )
 
+    def _build_prompt(self, user_content: str) -> list[dict[str, str]]:
+        """Build the prompt from the base prompt file and the user's content."""
+        base_prompt = self._load_base_prompt()
+        return [
+            {
+                "role": "system",
+                "content": base_prompt,
+            },
+            {"role": "user", "content": user_content},
+        ]
+
+    def _load_base_prompt(self) -> str:
+        """Return the base prompt, reading the file again only if it was modified."""
+        now = time.monotonic()
+        with self._base_prompt_lock:
+            if (
+                self._base_prompt is not None
+                and now - self._base_prompt_checked_at
+                < self.prompt_reload_check_interval
+            ):
+                return self._base_prompt
+            self._base_prompt_checked_at = now
+            try:
+                mtime = self.base_prompt_file.stat().st_mtime_ns
+            except OSError as e:
+                if self._base_prompt is None:
+                    raise e
+                self.logger.warning(f"Keeping the cached base prompt: {e}")
+                return self._base_prompt
+            if self._base_prompt is None or mtime != self._base_prompt_mtime:
+                self.logger.debug(f"Loading base prompt from {self.base_prompt_file=}")
+                self._base_prompt = self.base_prompt_file.read_text()
+                self._base_prompt_mtime = mtime
+                self.prompt_reloads += 1
+            return self._base_prompt
+
+    def preload_mocked_responses(self) -> None:
+        """
+        Load and validate every mocked response once, so that return_mocked_response()
+        serves them without any I/O.
+        """
+        self.logger.debug(
+            f"Preloading mocked responses from {self.dummy_responses_folder=}..."
+        )
+        responses = {}
+        for file in sorted(self.dummy_responses_folder.iterdir()):
+            if file.is_file():
+                resp = self._read_mocked_response(file.name)
+                if resp is not None:
+                    responses[file.name] = resp
+        self.mocked_responses = types.MappingProxyType(responses)
+        self.logger.debug(f"Successfully preloaded {len(responses)} mocked responses!")
+
     def return_mocked_response(
         self, filename: str
     ) -> models.ParsedGroceryList | models.LLMRecommendationList | None:
         """Return a mocked response based on the grocery list's filename."""
+        if self.mocked_responses is None:
+            return self._read_mocked_response(filename)
+        resp = self.mocked_responses.get(filename)
+        if resp is None:
+            self.logger.warning(f"No mocked response was preloaded for {filename}!")
+            return None
+        # a copy, so that a request modifying its response can't affect the later ones
+        return resp.model_copy(deep=True)
+
+    def _read_mocked_response(
+        self, filename: str
+    ) -> models.ParsedGroceryList | models.LLMRecommendationList | None:
+        """Read a mocked response from the dummy responses folder."""
         class_ = self.__class__.__name__
         model = (
             models.ParsedGroceryList
@@ -47,11 +134,12 @@ class BaseLLMService:
         resp = None
         self.logger.debug(f"Returning mocked response for {filename} from {class_}...")
         try:
-            content = json.load(
-                open(self.dummy_responses_folder / filename, mode="r", encoding="utf-8")
-            )
+            with open(
+                self.dummy_responses_folder / filename, mode="r", encoding="utf-8"
+            ) as f:
+                content = json.load(f)
             resp = model.model_validate(content)
-            self.logger.debug("Successfully retrieved mocked response for {filename}!")
+            self.logger.debug(f"Successfully retrieved mocked response for {filename}!")
         except Exception as e:
             self.logger.exception(f"Exception while retrieving mocked response: {e}")
         return resp
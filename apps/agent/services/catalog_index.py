@@ -0,0 +1,379 @@
+"""This module defines the CatalogIndex class."""
+
+import bisect
+import mmap
+import os
+import pathlib
+import struct
+from array import array
+from collections import defaultdict
+from collections.abc import Callable, Iterable, Sequence
+from typing import Any
+
+from rapidfuzz import utils
+
+from apps.agent.models import models
+
+
+SNAPSHOT_MAGIC = b"CATINDEX"
+# bump whenever the layout of the snapshot sections changes
+SNAPSHOT_FORMAT_VERSION = 2
+SNAPSHOT_SECTIONS = (
+    "skus",
+    "name_offsets",
+    "names",
+    "rows_by_sku",
+    "choice_offsets",
+    "choices",
+    "term_offsets",
+    "terms",
+    "posting_offsets",
+    "posting_rows",
+)
+# magic, format version, catalog change version (-1 if unknown),
+# then the size in bytes of each section
+SNAPSHOT_HEADER = struct.Struct(f"<8sQq{len(SNAPSHOT_SECTIONS)}Q")
+
+
+class CatalogIndex:
+    """
+    This class holds the store catalog in a form that is ready for fuzzy matching.
+    It is built once per catalog load and reused by every request, so that
+    the catalog is never re-processed on the request path.
+    Row `i` of each of the parallel arrays describes the same product; the full names
+    are kept in a single UTF-8 buffer, sliced by row offsets, instead of one object each.
+    The inverted index maps every token of the full names, and every trigram
+    of those tokens, to the rows it appears in.
+    An index can be saved to a binary snapshot file, which other processes can
+    load by memory-mapping it; the arrays, the names, the choices and the inverted
+    index are then read straight from the page cache, shared by every process
+    that loaded it, instead of being rebuilt as Python objects in each of them.
+    The index is never modified in place: with_changes() returns a new index,
+    so that requests can keep using the current one while it's being built.
+    """
+
+    def __init__(
+        self,
+        skus: Sequence[int],
+        full_names: Sequence[str],
+        processor: Callable[[str], str] = utils.default_process,
+        choices: Sequence[str] | None = None,
+        change_version: int | None = None,
+    ) -> None:
+        self.processor = processor
+        # the version of the API server's catalog changes that the index is up to date with
+        self.change_version = change_version
+        self.skus = array("q", skus)
+        self.names, self.name_offsets = _pack_strings(full_names)
+        # the rows sorted by SKU, to look up the row of a SKU by bisection
+        self.rows_by_sku = array(
+            "q", sorted(range(len(self.skus)), key=self.skus.__getitem__)
+        )
+        # the pre-processed full names, i.e. the choices for the fuzzy matcher;
+        # they can be given if they were processed already
+        if choices is None:
+            choices = [processor(full_name) for full_name in full_names]
+        self.choices = list(choices)
+        postings = defaultdict(list)
+        for row, choice in enumerate(self.choices):
+            for term in _terms(choice):
+                postings[term].append(row)
+        # a snapshot's inverted index is looked up in place instead, see load()
+        self.postings = {term: array("q", rows) for term, rows in postings.items()}
+        # the memory-mapped snapshot file, if the index was loaded from one
+        self.snapshot = None
+
+    @classmethod
+    def from_catalog(cls, catalog: models.ProductCatalog) -> "CatalogIndex":
+        """Build the index from the store catalog."""
+        skus = [item.sku for item in catalog.catalog]
+        full_names = [item.full_name for item in catalog.catalog]
+        return cls(skus, full_names)
+
+    @classmethod
+    def from_products(
+        cls, products: Iterable[dict[str, Any]], change_version: int | None = None
+    ) -> "CatalogIndex":
+        """
+        Build the index from raw product dicts, e.g. the API server's listing,
+        validating them one at a time instead of building a ProductCatalog.
+        """
+        skus = []
+        full_names = []
+        for product in products:
+            item = models.ProductLineItem.model_validate(product)
+            skus.append(item.sku)
+            full_names.append(item.full_name)
+        return cls(skus, full_names, change_version=change_version)
+
+    def __len__(self) -> int:
+        """Return the number of products in the index."""
+        return len(self.skus)
+
+    @property
+    def full_names(self) -> list[str]:
+        """Return the full names of all products, in catalog order."""
+        return [self.full_name(row) for row in range(len(self))]
+
+    def full_name(self, row: int) -> str:
+        """Return the full name of the product at the given row."""
+        return str(
+            self.names[self.name_offsets[row] : self.name_offsets[row + 1]], "utf-8"
+        )
+
+    def row(self, sku: int) -> int | None:
+        """Return the row of the product with the given SKU, or None if there's none."""
+        i = bisect.bisect_left(self.rows_by_sku, sku, key=self.skus.__getitem__)
+        if i < len(self.rows_by_sku) and self.skus[self.rows_by_sku[i]] == sku:
+            return self.rows_by_sku[i]
+        return None
+
+    def product(self, row: int) -> models.ProductLineItem:
+        """Return the product at the given row."""
+        return models.ProductLineItem(sku=self.skus[row], full_name=self.full_name(row))
+
+    def candidate(self, row: int, score: float) -> models.CandidateLineItem:
+        """Return the product at the given row as a candidate with the given score."""
+        return models.CandidateLineItem(
+            sku=self.skus[row], full_name=self.full_name(row), score=score
+        )
+
+    def to_catalog(self) -> models.ProductCatalog:
+        """Return the store catalog held by the index."""
+        return models.ProductCatalog(
+            catalog=[self.product(row) for row in range(len(self))]
+        )
+
+    def with_changes(
+        self, changes: dict[int, str | None], change_version: int | None
+    ) -> "CatalogIndex":
+        """
+        Return a new index with the changes applied. `changes` maps SKUs to
+        their new full names, or to None if they were deleted; changed products
+        keep their row, and new ones are added at the end of the catalog.
+        The choices of the unchanged products aren't processed again.
+        """
+        # the rows of the changed products are looked up by SKU, see row()
+        changed_rows = {}
+        added = {}
+        for sku, full_name in changes.items():
+            row = self.row(sku)
+            if row is not None:
+                changed_rows[row] = full_name
+            elif full_name is not None:
+                added[sku] = full_name
+
+        skus = []
+        full_names = []
+        choices = []
+        for row, sku in enumerate(self.skus):
+            if row not in changed_rows:
+                skus.append(sku)
+                full_names.append(self.full_name(row))
+                choices.append(self.choices[row])
+            elif changed_rows[row] is not None:
+                skus.append(sku)
+                full_names.append(changed_rows[row])
+                choices.append(self.processor(changed_rows[row]))
+        for sku, full_name in added.items():
+            skus.append(sku)
+            full_names.append(full_name)
+            choices.append(self.processor(full_name))
+        return CatalogIndex(skus, full_names, self.processor, choices, change_version)
+
+    def save(self, file: pathlib.Path | str) -> None:
+        """
+        Write the index to a snapshot file. The file is replaced atomically,
+        so processes that already loaded the previous snapshot keep using it.
+        """
+        choices, choice_offsets = _pack_strings(self.choices)
+        terms = []
+        posting_offsets = array("q", [0])
+        posting_rows = array("q")
+        # sorted, so that a loaded index can look terms up by bisection
+        for term, rows in self._sorted_postings():
+            terms.append(term)
+            posting_rows.extend(rows)
+            posting_offsets.append(len(posting_rows))
+        term_buffer, term_offsets = _pack_strings(terms)
+        sections = [
+            array("q", self.skus).tobytes(),
+            array("q", self.name_offsets).tobytes(),
+            bytes(self.names),
+            array("q", self.rows_by_sku).tobytes(),
+            choice_offsets.tobytes(),
+            choices,
+            term_offsets.tobytes(),
+            term_buffer,
+            posting_offsets.tobytes(),
+            posting_rows.tobytes(),
+        ]
+
+        file = pathlib.Path(file)
+        tmp_file = file.with_name(f"{file.name}.{os.getpid()}.tmp")
+        with open(tmp_file, "wb") as f:
+            f.write(
+                SNAPSHOT_HEADER.pack(
+                    SNAPSHOT_MAGIC,
+                    SNAPSHOT_FORMAT_VERSION,
+                    -1 if self.change_version is None else self.change_version,
+                    *(len(section) for section in sections),
+                )
+            )
+            for section in sections:
+                f.write(section)
+                f.write(bytes(-len(section) % 8))
+        os.replace(tmp_file, file)
+
+    @classmethod
+    def load(cls, file: pathlib.Path | str) -> "CatalogIndex":
+        """
+        Load an index from a snapshot file, by memory-mapping it read-only.
+        Nothing is copied out of the file: the choices are decoded when they're
+        read, and terms are looked up by bisecting the sorted term section.
+        Raise ValueError if the file isn't a snapshot of the current format.
+        """
+        with open(file, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(buffer) < SNAPSHOT_HEADER.size:
+            raise ValueError(f"{file} is not a catalog snapshot")
+        magic, version, change_version, *sizes = SNAPSHOT_HEADER.unpack_from(buffer)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(
+                f"{file} is not a version {SNAPSHOT_FORMAT_VERSION} snapshot"
+            )
+
+        view = memoryview(buffer)
+        sections = {}
+        start = SNAPSHOT_HEADER.size
+        for name, size in zip(SNAPSHOT_SECTIONS, sizes):
+            if start + size > len(buffer):
+                raise ValueError(f"{file} is truncated")
+            sections[name] = view[start : start + size]
+            # sections are padded, so that the arrays are 8-byte aligned
+            start += size + -size % 8
+        for name in SNAPSHOT_SECTIONS:
+            if name not in ("names", "choices", "terms"):
+                sections[name] = sections[name].cast("q")
+
+        index = cls.__new__(cls)
+        index.processor = utils.default_process
+        index.change_version = None if change_version == -1 else change_version
+        index.skus = sections["skus"]
+        index.names = sections["names"]
+        index.name_offsets = sections["name_offsets"]
+        index.rows_by_sku = sections["rows_by_sku"]
+        index.choices = PackedStrings(sections["choices"], sections["choice_offsets"])
+        index.postings = None
+        index.terms = PackedStrings(sections["terms"], sections["term_offsets"])
+        index.posting_offsets = sections["posting_offsets"]
+        index.posting_rows = sections["posting_rows"]
+        # keeps the file mapped for as long as the index is used
+        index.snapshot = buffer
+        return index
+
+    @staticmethod
+    def snapshot_change_version(file: pathlib.Path | str) -> int | None:
+        """
+        Return the change version of a snapshot file, reading only its header.
+        Raise ValueError if the file isn't a snapshot of the current format.
+        """
+        with open(file, "rb") as f:
+            header = f.read(SNAPSHOT_HEADER.size)
+        if len(header) < SNAPSHOT_HEADER.size:
+            raise ValueError(f"{file} is not a catalog snapshot")
+        magic, version, change_version, *_ = SNAPSHOT_HEADER.unpack(header)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(
+                f"{file} is not a version {SNAPSHOT_FORMAT_VERSION} snapshot"
+            )
+        return None if change_version == -1 else change_version
+
+    def candidate_rows(self, query: str) -> list[int]:
+        """
+        Return, in catalog order, the rows sharing at least one token or trigram
+        with the query. The query should already be pre-processed.
+        """
+        rows = set()
+        for term in _terms(query):
+            rows.update(self._rows_of(term))
+        return sorted(rows)
+
+    def _rows_of(self, term: str) -> Sequence[int]:
+        """Return the rows the term appears in."""
+        if self.postings is not None:
+            return self.postings.get(term, ())
+        # the index was loaded from a snapshot, whose terms are sorted
+        i = self.terms.bisect(term)
+        if i == len(self.terms) or self.terms[i] != term:
+            return ()
+        return self.posting_rows[self.posting_offsets[i] : self.posting_offsets[i + 1]]
+
+    def _sorted_postings(self) -> Iterable[tuple[str, Sequence[int]]]:
+        """Yield every term and the rows it appears in, sorted by term."""
+        if self.postings is not None:
+            for term in sorted(self.postings):
+                yield term, self.postings[term]
+        else:
+            offsets = self.posting_offsets
+            for i, term in enumerate(self.terms):
+                yield term, self.posting_rows[offsets[i] : offsets[i + 1]]
+
+
+def _terms(text: str) -> set[str]:
+    """Return the tokens of a pre-processed text, along with the trigrams of each token."""
+    terms = set()
+    for token in text.split():
+        terms.add(token)
+        terms.update(token[i : i + 3] for i in range(len(token) - 2))
+    return terms
+
+
+def _pack_strings(strings: Iterable[str]) -> tuple[bytes, array]:
+    """Return the strings encoded in a single UTF-8 buffer, and their offsets in it."""
+    encoded = [string.encode() for string in strings]
+    offsets = array("q", [0])
+    for string in encoded:
+        offsets.append(offsets[-1] + len(string))
+    return b"".join(encoded), offsets
+
+
+class PackedStrings(Sequence[str]):
+    """
+    This class is a read-only sequence of the strings packed in a buffer by _pack_strings();
+    each string is decoded when it's read, so the buffer can stay memory-mapped.
+    """
+
+    def __init__(self, buffer: Sequence[int], offsets: Sequence[int]) -> None:
+        self.buffer = buffer
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        """Return the number of strings."""
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        """Return the string at the given position."""
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("PackedStrings index out of range")
+        return str(self.buffer[self.offsets[i] : self.offsets[i + 1]], "utf-8")
+
+    def bisect(self, string: str) -> int:
+        """
+        Return the position where the string would be inserted, if the strings are sorted.
+        UTF-8 preserves the order of code points, so the encoded strings are compared
+        without being decoded.
+        """
+        encoded = string.encode()
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if bytes(self.buffer[self.offsets[mid] : self.offsets[mid + 1]]) < encoded:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
@@ -0,0 +1,97 @@
+"""This module defines the FastAcceptService class."""
+
+import logging
+
+from apps.agent.models import models
+
+
+class FastAcceptService:
+    """
+    This class is responsible for recommending products without the LLM
+    when fuzzy matching leaves no doubt. A line is accepted if its best candidate
+    scores at least `min_score` and beats the next candidate by at least `min_margin`;
+    its fuzzy matching score then becomes the suggestion's confidence.
+    """
+
+    def __init__(
+        self, min_score: float, min_margin: float, logger: logging.Logger
+    ) -> None:
+        child_logger = logger.getChild("FastAcceptService")
+        self.logger = child_logger
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.logger.debug(
+            f"Finished initializing fast accept service, {self.min_score=} and {self.min_margin=}!"
+        )
+
+    def accept(
+        self, pruned_catalog_list: models.PrunedCatalogList
+    ) -> tuple[
+        dict[int, models.LLMRecommendationListPerGroceryListLine],
+        models.PrunedCatalogList,
+    ]:
+        """
+        Return the recommendations of the accepted lines by line number,
+        and the lines that still need to be sent to the recommender.
+        If no line is accepted, the pruned catalog list itself is returned.
+        """
+        accepted = {}
+        for i, line in enumerate(pruned_catalog_list.lines):
+            rec = self._accept_line(line)
+            if rec is not None:
+                accepted[i] = rec
+        self.logger.debug(
+            f"Accepted {len(accepted)} of {len(pruned_catalog_list.lines)} lines"
+        )
+        if not accepted:
+            return accepted, pruned_catalog_list
+
+        remaining_lines = [
+            line
+            for i, line in enumerate(pruned_catalog_list.lines)
+            if i not in accepted
+        ]
+        return accepted, models.PrunedCatalogList(lines=remaining_lines)
+
+    def merge(
+        self,
+        pruned_catalog_list: models.PrunedCatalogList,
+        accepted: dict[int, models.LLMRecommendationListPerGroceryListLine],
+        recommendations: models.LLMRecommendationList,
+    ) -> models.LLMRecommendationList:
+        """Merge the accepted lines with the recommender's, in the original order."""
+        if not accepted:
+            return recommendations
+
+        recommended = iter(recommendations.recommendations)
+        merged = []
+        for i, line in enumerate(pruned_catalog_list.lines):
+            rec = accepted.get(i) or next(recommended, None)
+            if rec is None:
+                rec = models.LLMRecommendationListPerGroceryListLine(
+                    query=line.query, suggestions=[]
+                )
+            merged.append(rec)
+        return models.LLMRecommendationList(recommendations=merged)
+
+    def _accept_line(
+        self, line: models.PrunedCatalogPerGroceryListLine
+    ) -> models.LLMRecommendationListPerGroceryListLine | None:
+        """Return the recommendation of the line if its best candidate is unambiguous."""
+        if not line.candidates or line.candidates[0].score is None:
+            return None
+        best = line.candidates[0]
+        runner_up_score = (
+            line.candidates[1].score if len(line.candidates) > 1 else 0
+        ) or 0
+        if (
+            best.score < self.min_score
+            or best.score - runner_up_score < self.min_margin
+        ):
+            return None
+        suggestion = models.LLMRecommendationLineItem(
+            sku=best.sku, full_name=best.full_name, confidence=best.score
+        )
+        return models.LLMRecommendationListPerGroceryListLine(
+            query=line.query, suggestions=[suggestion]
+        )
@@ -2,35 +2,69 @@
 
 import logging
 
-from rapidfuzz import process
+import numpy as np
+from rapidfuzz import fuzz, process
 
 from apps.agent.models import models
+from apps.agent.services import catalog_index as ci
 
 
 class FuzzyFilterService:
     """This class is responsible for running fuzzy matching on the store catalog."""
 
-    def __init__(self, top_n: int, min_score: int, logger: logging.Logger) -> None:
+    def __init__(
+        self,
+        top_n: int,
+        min_score: int,
+        logger: logging.Logger,
+        batched: bool = False,
+        workers: int = 1,
+        prefilter_score: float | None = None,
+        max_score_gap: float | None = None,
+        dedupe: bool = False,
+    ) -> None:
         child_logger = logger.getChild("FuzzyFilterService")
         self.logger = child_logger
         self.top_n = top_n
         self.min_score = min_score
+        self.batched = batched
+        self.workers = workers
+        # None disables the prefilter, so that every query is scored against the whole catalog
+        self.prefilter_score = prefilter_score
+        # None keeps every candidate scoring at least min_score
+        self.max_score_gap = max_score_gap
+        self.dedupe = dedupe
         self.logger.debug(
-            f"Finished initializing fuzzy matching service, {self.top_n=} and {self.min_score=}!"
+            f"Finished initializing fuzzy matching service, {self.top_n=}, {self.min_score=},"
+            f" {self.batched=}, {self.prefilter_score=}, {self.max_score_gap=}"
+            f" and {self.dedupe=}!"
         )
 
     def filter_catalog(
-        self, data: models.CatalogForFuzzyMatching
+        self,
+        data: models.CatalogForFuzzyMatching,
+        catalog_index: ci.CatalogIndex | None = None,
     ) -> models.PrunedCatalogList:
-        """Returns a pruned catalog per line item of the grocery list."""
+        """
+        Returns a pruned catalog per line item of the grocery list.
+        `catalog_index` should be the index built when the catalog was loaded;
+        if it isn't given, one is built from `data.catalog` for this call only.
+        """
         pruned_list = []
-        store_catalog = data.catalog.catalog
         grocery_list = data.grocery_list.grocery_list
         self.logger.debug(f"Got {grocery_list=}, now pruning store catalog...")
-        products = {item.sku: item.full_name for item in store_catalog}
+        if catalog_index is None:
+            catalog_index = ci.CatalogIndex.from_catalog(data.catalog)
+
+        parsed_lines = [line_item for line_item in grocery_list if line_item.product]
+        if self.batched:
+            matches = self._match_lines(catalog_index, parsed_lines)
+        else:
+            matches = [
+                self._match_line(catalog_index, line_item) for line_item in parsed_lines
+            ]
+        matches = iter(matches)
 
-        # For each item in the parsed grocery list, find top matches
-        # extract() uses fuzz.WRatio by default
         for line_item in grocery_list:
             if not line_item.product:
                 self.logger.debug(
@@ -40,27 +74,158 @@ class FuzzyFilterService:
                     **line_item.model_dump(), candidates=[]
                 )
             else:
-                line = self._process_parsed_line(products, line_item)
+                line = self._process_parsed_line(
+                    catalog_index, line_item, next(matches)
+                )
             pruned_list.append(line)
 
         self.logger.debug(f"Successfully pruned catalog, {len(pruned_list)=}")
         return models.PrunedCatalogList(lines=pruned_list)
 
-    def _process_parsed_line(
-        self, products: dict[int, str], line_item: models.ParsedLineItem
-    ) -> models.PrunedCatalogPerGroceryListLine:
-        """Process a line item from the grocery list."""
+    def _is_confident(self, matches: list[tuple[int, float]]) -> bool:
+        """
+        Return whether the matches found among the prefiltered candidates can be trusted.
+        Rows that share no token or trigram with the query can still get a middling score,
+        so the top N candidates must all score at least `prefilter_score`;
+        otherwise the query is scored against the whole catalog.
+        """
+        return len(matches) >= self.top_n and matches[-1][1] >= self.prefilter_score
+
+    def _match_line(
+        self, catalog_index: ci.CatalogIndex, line_item: models.ParsedLineItem
+    ) -> list[tuple[int, float]]:
+        """Return the (row, score) of the top matches of one line item."""
+        query = catalog_index.processor(line_item.product)
+        if self.prefilter_score is not None:
+            rows = catalog_index.candidate_rows(query)
+            matches = self._extract(query, [catalog_index.choices[row] for row in rows])
+            matches = [(rows[index], score) for index, score in matches]
+            if self._is_confident(matches):
+                return matches
+            self.logger.debug(
+                f"Prefilter recall too low for {query=}, doing a full scan"
+            )
+        return self._extract(query, catalog_index.choices)
+
+    def _extract(self, query: str, choices: list[str]) -> list[tuple[int, float]]:
+        """Return the (index, score) of the top matches of the query among the choices."""
+        # extract() uses fuzz.WRatio by default;
+        # the choices are already pre-processed, so only the query needs to be
         matches = process.extract(
-            query=line_item.product,
-            choices=products,
+            query=query,
+            choices=choices,
+            processor=None,
             limit=self.top_n,
             score_cutoff=self.min_score,
         )
+        # matches is a list of (processed_full_name, score, index)
+        return [(index, score) for _, score, index in matches]
+
+    def _match_lines(
+        self, catalog_index: ci.CatalogIndex, line_items: list[models.ParsedLineItem]
+    ) -> list[list[tuple[int, float]]]:
+        """
+        Return the (row, score) of the top matches of every line item,
+        scoring all of them against the catalog in a single matrix call.
+        The results are the same as calling _match_line() on each line item.
+        """
+        queries = [
+            catalog_index.processor(line_item.product) for line_item in line_items
+        ]
+        if self.prefilter_score is None:
+            return self._cdist(catalog_index, queries)
+
+        # only the rows that are a candidate of at least one query are scored
+        rows_per_query = [catalog_index.candidate_rows(query) for query in queries]
+        columns = sorted(set().union(*rows_per_query))
+        matches = self._cdist(catalog_index, queries, columns, rows_per_query)
+
+        full_scans = [i for i, m in enumerate(matches) if not self._is_confident(m)]
+        if full_scans:
+            self.logger.debug(
+                f"Prefilter recall too low for {len(full_scans)} queries, doing a full scan"
+            )
+            rescored = self._cdist(catalog_index, [queries[i] for i in full_scans])
+            for i, query_matches in zip(full_scans, rescored):
+                matches[i] = query_matches
+        return matches
 
+    def _cdist(
+        self,
+        catalog_index: ci.CatalogIndex,
+        queries: list[str],
+        columns: list[int] | None = None,
+        rows_per_query: list[list[int]] | None = None,
+    ) -> list[list[tuple[int, float]]]:
+        """
+        Return the (row, score) of the top matches of every query among the given rows
+        of the catalog, or the whole catalog if no rows are given.
+        If `rows_per_query` is given, each query only matches its own rows.
+        """
+        if columns is None:
+            columns = range(len(catalog_index))
+        if not queries or not len(columns):
+            return [[] for _ in queries]
+
+        # scores below the cutoff are set to 0
+        scores = process.cdist(
+            queries,
+            [catalog_index.choices[row] for row in columns],
+            scorer=fuzz.WRatio,
+            processor=None,
+            score_cutoff=self.min_score,
+            dtype=np.float64,
+            workers=self.workers,
+        )
+        columns = np.asarray(columns)
+        if rows_per_query is not None:
+            for query_scores, rows in zip(scores, rows_per_query):
+                query_scores[~np.isin(columns, rows)] = -1
+
+        top_n = min(self.top_n, scores.shape[1])
+        # the N-th best score of each query, without sorting all of its scores
+        kth_scores = -np.partition(-scores, top_n - 1, axis=1)[:, top_n - 1]
+
+        matches = []
+        for query_scores, kth_score in zip(scores, kth_scores):
+            # like extract(), break ties on the N-th best score by catalog order
+            above = np.flatnonzero(query_scores > kth_score)
+            ties = np.flatnonzero(query_scores == kth_score)[: top_n - len(above)]
+            indices = np.concatenate((above, ties))
+            indices = indices[query_scores[indices] >= self.min_score]
+            indices = indices[np.lexsort((indices, -query_scores[indices]))]
+            matches.append([(int(columns[i]), float(query_scores[i])) for i in indices])
+        return matches
+
+    def _process_parsed_line(
+        self,
+        catalog_index: ci.CatalogIndex,
+        line_item: models.ParsedLineItem,
+        matches: list[tuple[int, float]],
+    ) -> models.PrunedCatalogPerGroceryListLine:
+        """
+        Process a line item from the grocery list. Candidates scoring more than
+        `max_score_gap` below the best one are dropped, and so are candidates whose
+        full name is a duplicate of a better one's if `dedupe` is set.
+        """
         candidates = []
-        # matches is a list of (product_description, score, sku)
-        for match_name, score, key in matches:
-            candidates.append(models.ProductLineItem(sku=key, full_name=match_name))
+        seen = set()
+        for row, score in matches:
+            # matches are sorted by score, so the rest are even further from the best
+            if (
+                self.max_score_gap is not None
+                and score < matches[0][1] - self.max_score_gap
+            ):
+                break
+            if self.dedupe:
+                if catalog_index.choices[row] in seen:
+                    continue
+                seen.add(catalog_index.choices[row])
+            candidates.append(catalog_index.candidate(row, score))
+        if len(candidates) < len(matches):
+            self.logger.debug(
+                f"Kept {len(candidates)} of {len(matches)} candidates for {line_item.query=}"
+            )
         line = models.PrunedCatalogPerGroceryListLine(
             query=line_item.query,
             product=line_item.product,
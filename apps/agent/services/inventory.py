@@ -1,68 +1,459 @@
 """This module defines the InventoryService class."""
 
+import asyncio
+import concurrent.futures
+import fcntl
 import json
 import logging
+import os
 import pathlib
+import threading
+import time
 
 import tenacity
 
-from apps.agent.clients import api_client
-from apps.agent.dependencies import constants, exceptions
+from apps.agent.clients import api_client, async_api_client
+from apps.agent.dependencies import cache as ch, constants, exceptions
 from apps.agent.models import models
+from apps.agent.services import catalog_index as ci
 
 
 class InventoryService:
-    """This class is responsible for interacting with the API server."""
+    """
+    This class is responsible for interacting with the API server.
+    If a cache is given, product details are read through it; concurrent requests
+    for the same uncached product, whether through get_product() or the batch
+    methods, are coalesced into a single API call either way.
+    """
 
-    def __init__(self, logger: logging.Logger) -> None:
-        self.catalog = []
+    def __init__(
+        self,
+        logger: logging.Logger,
+        snapshot_file: pathlib.Path | str | None = None,
+        snapshot_max_age: float | None = None,
+        details_cache: ch.LRUCache | None = None,
+    ) -> None:
+        # the store catalog is only held by the index, see the catalog property
+        self.catalog_index = ci.CatalogIndex([], [])
+        # if set, the catalog is loaded from this snapshot while it's younger than
+        # snapshot_max_age seconds, and written to it whenever it's loaded otherwise
+        self.snapshot_file = snapshot_file
+        self.snapshot_max_age = snapshot_max_age
+        # incremented every time a catalog is loaded or refreshed,
+        # so that caches can be invalidated
+        self.catalog_version = 0
+        self._refresh_thread = None
+        self._stop_refresh = threading.Event()
+        self.details_cache = details_cache
+        # product ID -> future of its details, for the products being fetched
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
         child_logger = logger.getChild("InventoryService")
         self.logger = child_logger
         self.client = api_client.APIClient(self.logger)
+        self.async_client = async_api_client.AsyncAPIClient(self.logger)
         self.logger.debug("Finished initializing inventory service!")
 
+    @property
+    def catalog(self) -> models.ProductCatalog:
+        """Return the store catalog; it's built from the index on every call."""
+        return self.catalog_index.to_catalog()
+
     def get_product(self, product_id: int) -> dict[str, dict[str, str | int | float]]:
         """Get product details."""
         self.logger.debug(f"Getting product with {product_id=}...")
+        cached, to_fetch, pending = self._claim_products([product_id])
+        if product_id in cached:
+            return cached[product_id]
+        if product_id in pending:
+            details = pending[product_id].result()
+            return constants.EMPTY_PRODUCT_DETAILS if details is None else details
+
+        fetched = {}
         resp = constants.EMPTY_PRODUCT_DETAILS
         try:
             resp = self.client.get_product_details(product_id)
             self.logger.debug(f"Successfully got product details! {resp=}")
+            fetched[product_id] = resp
         except tenacity.RetryError as e:
             original_exc = e.last_attempt.exception()
             self.logger.exception(f"Failed after retries due to: {original_exc}")
         except exceptions.ProductNotFoundException:
             self.logger.warning(f"Product {product_id} not found!")
+        finally:
+            self._settle_products(to_fetch, fetched)
         return resp
 
+    def get_products(
+        self, product_ids: list[int]
+    ) -> dict[int, dict[str, dict[str, str | int | float]]]:
+        """Get the details of several products, keyed by product ID."""
+        unique_ids = list(dict.fromkeys(product_ids))
+        self.logger.debug(f"Getting details of {len(unique_ids)} products...")
+        products, to_fetch, pending = self._claim_products(unique_ids)
+        fetched = {}
+        try:
+            for batch in self._split_into_batches(to_fetch):
+                try:
+                    resp = self.client.get_products_details(batch)
+                    for details in resp["data"]:
+                        fetched[details["sku"]] = {"data": details}
+                except tenacity.RetryError as e:
+                    original_exc = e.last_attempt.exception()
+                    self.logger.exception(
+                        f"Failed after retries due to: {original_exc}"
+                    )
+        finally:
+            self._settle_products(to_fetch, fetched)
+
+        products.update(fetched)
+        for product_id, future in pending.items():
+            details = future.result()
+            if details is not None:
+                products[product_id] = details
+        return self._fill_in_missing_products(unique_ids, products)
+
+    async def aget_products(
+        self, product_ids: list[int]
+    ) -> dict[int, dict[str, dict[str, str | int | float]]]:
+        """
+        Get the details of several products, keyed by product ID.
+        Batches are requested concurrently, up to a bounded number at a time.
+        """
+        unique_ids = list(dict.fromkeys(product_ids))
+        self.logger.debug(f"Getting details of {len(unique_ids)} products...")
+        products, to_fetch, pending = self._claim_products(unique_ids)
+        semaphore = asyncio.Semaphore(
+            constants.GROCERY_API_SERVER_MAX_CONCURRENT_REQUESTS
+        )
+
+        async def fetch(batch: list[int]) -> list[dict[str, str | int | float]]:
+            async with semaphore:
+                try:
+                    resp = await self.async_client.get_products_details(batch)
+                    return resp["data"]
+                except tenacity.RetryError as e:
+                    original_exc = e.last_attempt.exception()
+                    self.logger.exception(
+                        f"Failed after retries due to: {original_exc}"
+                    )
+                    return []
+
+        fetched = {}
+        try:
+            results = await asyncio.gather(
+                *(fetch(batch) for batch in self._split_into_batches(to_fetch))
+            )
+            for result in results:
+                for details in result:
+                    fetched[details["sku"]] = {"data": details}
+        finally:
+            self._settle_products(to_fetch, fetched)
+
+        products.update(fetched)
+        for product_id, future in pending.items():
+            details = await asyncio.wrap_future(future)
+            if details is not None:
+                products[product_id] = details
+        return self._fill_in_missing_products(unique_ids, products)
+
+    def _claim_products(
+        self, product_ids: list[int]
+    ) -> tuple[
+        dict[int, dict[str, dict[str, str | int | float]]],
+        list[int],
+        dict[int, concurrent.futures.Future],
+    ]:
+        """
+        Return the cached products' details, the IDs of the products this call
+        must fetch, and the futures of the products other calls are already fetching.
+        The products to fetch must then be passed to _settle_products().
+        """
+        cached = {}
+        uncached = product_ids
+        # read outside the lock, since the cache may have to read its database
+        if self.details_cache is not None:
+            uncached = []
+            for product_id in product_ids:
+                details = self.details_cache.get(str(product_id))
+                if details is None:
+                    uncached.append(product_id)
+                else:
+                    cached[product_id] = details
+        to_fetch = []
+        pending = {}
+        with self._inflight_lock:
+            for product_id in uncached:
+                future = self._inflight.get(product_id)
+                if future is None:
+                    self._inflight[product_id] = concurrent.futures.Future()
+                    to_fetch.append(product_id)
+                else:
+                    pending[product_id] = future
+        self.logger.debug(
+            f"{len(cached)} products cached, {len(pending)} already being fetched"
+        )
+        return cached, to_fetch, pending
+
+    def _settle_products(
+        self,
+        product_ids: list[int],
+        products: dict[int, dict[str, dict[str, str | int | float]]],
+    ) -> None:
+        """Cache the fetched products' details, and pass them to the calls waiting for them."""
+        # cached outside the lock, and before the futures are removed, so that a product
+        # is always either cached or in flight; products that couldn't be fetched
+        # aren't cached, so that they are retried
+        try:
+            if self.details_cache is not None:
+                for product_id in product_ids:
+                    details = products.get(product_id)
+                    if details is not None:
+                        self.details_cache.set(str(product_id), details)
+        finally:
+            with self._inflight_lock:
+                for product_id in product_ids:
+                    self._inflight.pop(product_id).set_result(products.get(product_id))
+
+    def _split_into_batches(self, product_ids: list[int]) -> list[list[int]]:
+        """Split the product IDs into batches that the API server accepts."""
+        batch_size = constants.GROCERY_API_SERVER_MAX_PRODUCTS_PER_BATCH
+        return [
+            product_ids[start : start + batch_size]
+            for start in range(0, len(product_ids), batch_size)
+        ]
+
+    def _fill_in_missing_products(
+        self,
+        product_ids: list[int],
+        products: dict[int, dict[str, dict[str, str | int | float]]],
+    ) -> dict[int, dict[str, dict[str, str | int | float]]]:
+        """Give blank product details to the products that couldn't be retrieved."""
+        for product_id in product_ids:
+            if product_id not in products:
+                self.logger.warning(f"Product {product_id} not found!")
+                products[product_id] = constants.EMPTY_PRODUCT_DETAILS
+        self.logger.debug("Successfully got product details!")
+        return products
+
     def load_catalog(self, products_per_page: int = 50, source: str = "api") -> None:
-        """Load the store catalog, i.e. product descriptions and SKUs only."""
+        """
+        Load the store catalog, i.e. product descriptions and SKUs only.
+        If a snapshot file is set and fresh enough, the catalog is memory-mapped from it
+        instead, so that worker processes share a single copy of the catalog.
+        """
+        if self.snapshot_file is not None and self._load_snapshot():
+            self.catalog_version += 1
+            return
+
+        change_version = None
         if source == "file":
             basedir = pathlib.Path(__file__).parent.parent.resolve()
             list_of_products = json.load(open(basedir / "assets/catalog.txt"))[
                 "catalog"
             ]
         else:
-            list_of_products = self._retrieve_from_server(products_per_page)
+            # asked for first, so that changes made while loading are applied by the next refresh
+            change_version = self._get_change_version()
+            if source == "stream":
+                list_of_products = self._stream_from_server()
+            else:
+                list_of_products = self._retrieve_from_server(products_per_page)
+
+        self.catalog_index = ci.CatalogIndex.from_products(
+            list_of_products, change_version
+        )
+        self.catalog_version += 1
+        # an empty catalog usually means loading failed, so it's not worth sharing
+        if self.snapshot_file is not None and len(self.catalog_index):
+            self._share_snapshot()
+
+    def refresh_catalog(self) -> bool:
+        """
+        Apply the changes made to the store catalog since it was loaded or last refreshed,
+        and return whether there were any. The changes are applied to a new index,
+        which replaces the current one once ready, so requests are never blocked.
+        If a snapshot file is set, a single process applies the changes and rewrites
+        the snapshot, and every process then loads it, so that they keep sharing it.
+        """
+        if self.snapshot_file is not None:
+            return self._refresh_snapshot()
+
+        catalog_index = self._apply_changes(self.catalog_index)
+        if catalog_index is None:
+            return False
+        self.catalog_index = catalog_index
+        self.catalog_version += 1
+        return True
+
+    def start_refresh(self, interval: float) -> None:
+        """Refresh the store catalog every `interval` seconds in a background thread."""
+        if self._refresh_thread is not None:
+            return
 
-        self.catalog = models.ProductCatalog.model_validate(
-            {"catalog": list_of_products}
+        def refresh_periodically() -> None:
+            while not self._stop_refresh.wait(interval):
+                self.refresh_catalog()
+
+        self._stop_refresh.clear()
+        self._refresh_thread = threading.Thread(
+            target=refresh_periodically, name="CatalogRefresh", daemon=True
         )
+        self._refresh_thread.start()
+        self.logger.debug(f"Refreshing store catalog every {interval} seconds")
+
+    def stop_refresh(self) -> None:
+        """Stop refreshing the store catalog in the background."""
+        if self._refresh_thread is None:
+            return
+        self._stop_refresh.set()
+        self._refresh_thread.join()
+        self._refresh_thread = None
+
+    def _refresh_snapshot(self) -> bool:
+        """
+        Load the snapshot if another process made it newer than the current catalog;
+        otherwise, unless another process is doing so, apply the changes to the snapshot.
+        Return whether the catalog changed.
+        """
+        if self._load_newer_snapshot():
+            return True
+        lock_file = f"{self.snapshot_file}.lock"
+        with open(lock_file, "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.logger.debug("Another process is refreshing the catalog snapshot")
+                return False
+            # the process that held the lock may have just written a newer snapshot
+            if self._load_newer_snapshot():
+                return True
+            catalog_index = self._apply_changes(self.catalog_index)
+            if catalog_index is None:
+                return False
+            self.catalog_index = catalog_index
+            self._share_snapshot()
+        self.catalog_version += 1
+        return True
+
+    def _load_newer_snapshot(self) -> bool:
+        """Load the snapshot if it's newer than the current catalog; return whether it was."""
+        try:
+            change_version = ci.CatalogIndex.snapshot_change_version(self.snapshot_file)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Cannot read the catalog snapshot: {e}")
+            return False
+        current_version = self.catalog_index.change_version
+        if change_version is None or (
+            current_version is not None and change_version <= current_version
+        ):
+            return False
+        if not self._load_snapshot(check_age=False):
+            return False
+        self.catalog_version += 1
+        self.logger.debug(f"Loaded the catalog snapshot of {change_version=}")
+        return True
+
+    def _apply_changes(self, catalog_index: ci.CatalogIndex) -> ci.CatalogIndex | None:
+        """
+        Return a new index with the catalog changes made since the given one applied,
+        or None if there were none, or if they couldn't be retrieved.
+        """
+        since = catalog_index.change_version
+        if since is None:
+            self.logger.debug("Catalog change version unknown, cannot refresh catalog")
+            return None
+
+        changes = {}
+        try:
+            has_next = True
+            while has_next:
+                response = self.client.get_catalog_changes(since)
+                for product in response["data"]:
+                    changes[product["sku"]] = product["full_name"]
+                since = response["version"]
+                has_next = bool(response["next"])
+        except Exception as e:
+            self.logger.exception(
+                f"Caught exception while refreshing store catalog: {e}"
+            )
+            return None
+        if not changes:
+            return None
+
+        self.logger.debug(f"Applying {len(changes)} catalog changes, {since=}")
+        return catalog_index.with_changes(changes, since)
+
+    def _get_change_version(self) -> int | None:
+        """Return the current version of the store catalog's changes, or None if unknown."""
+        try:
+            return int(self.client.get_catalog_changes(None)["version"])
+        except Exception as e:
+            self.logger.exception(
+                f"Caught exception while getting catalog version: {e}"
+            )
+            self.logger.warning("The store catalog won't be refreshed.")
+            return None
+
+    def _load_snapshot(self, check_age: bool = True) -> bool:
+        """Load the catalog from the snapshot file; return whether it was loaded."""
+        try:
+            age = time.time() - os.stat(self.snapshot_file).st_mtime
+            if (
+                check_age
+                and self.snapshot_max_age is not None
+                and age > self.snapshot_max_age
+            ):
+                self.logger.debug(f"Catalog snapshot is stale, {age=}")
+                return False
+            self.catalog_index = ci.CatalogIndex.load(self.snapshot_file)
+        except FileNotFoundError:
+            self.logger.debug("No catalog snapshot found")
+            return False
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Cannot load the catalog snapshot: {e}")
+            return False
+        self.logger.debug(
+            f"Loaded {len(self.catalog_index)} products from the catalog snapshot!"
+        )
+        return True
+
+    def _share_snapshot(self) -> None:
+        """
+        Write the catalog to the snapshot file, then load it back, since the index
+        that was built is private to this process, unlike the snapshot's pages.
+        """
+        try:
+            self.catalog_index.save(self.snapshot_file)
+            self.logger.debug("Saved the catalog snapshot!")
+        except OSError as e:
+            self.logger.exception(f"Cannot save the catalog snapshot: {e}")
+            return
+        self._load_snapshot(check_age=False)
 
     def _retrieve_from_server(
         self, products_per_page: int
     ) -> list[dict[str, str | int]]:
-        """Retrieve product details from the API server."""
+        """
+        Retrieve product details from the API server.
+        Pages after the first are requested with the last SKU seen as the cursor,
+        so that the server never has to skip over the rows already loaded.
+        """
         self.logger.debug(f"Loading store catalog, {products_per_page=}...")
         list_of_products = []
         try:
-            page_to_load = 1
-            while page_to_load != -1:
+            after_sku = None
+            has_next = True
+            while has_next:
                 response = self.client.get_product_listing(
-                    page_to_load, products_per_page
+                    1, products_per_page, after_sku=after_sku
                 )
                 list_of_products.extend(response["data"])
-                page_to_load = page_to_load + 1 if response["next"] else -1
+                has_next = bool(response["next"] and response["data"])
+                if has_next:
+                    after_sku = response["data"][-1]["sku"]
             self.logger.debug("Successfully loaded store catalog!")
         except Exception as e:
             list_of_products = []
@@ -71,17 +462,62 @@ class InventoryService:
 
         return list_of_products
 
+    def _stream_from_server(self) -> list[dict[str, str | int]]:
+        """Retrieve the whole store catalog from the API server in a single stream."""
+        self.logger.debug("Streaming store catalog...")
+        list_of_products = []
+        try:
+            for product in self.client.stream_product_catalog():
+                list_of_products.append(product)
+            self.logger.debug(
+                f"Successfully streamed {len(list_of_products)} products!"
+            )
+        except Exception as e:
+            list_of_products = []
+            self.logger.exception(
+                f"Caught exception while streaming store catalog: {e}"
+            )
+            self.logger.warning("Setting catalog to [].")
+
+        return list_of_products
+
     def get_final_recommendations(
         self, llm_recommendations: models.LLMRecommendationList
     ) -> models.AgentRecommendationList:
         """Return the finalized recommendations based on the LLM's recommendations."""
         self.logger.debug("Getting final recommendations...")
-        line_items = []
+        products = self.get_products(self._suggested_skus(llm_recommendations))
+        return self._consolidate(llm_recommendations, products)
 
+    async def aget_final_recommendations(
+        self, llm_recommendations: models.LLMRecommendationList
+    ) -> models.AgentRecommendationList:
+        """Return the finalized recommendations, without blocking the event loop."""
+        self.logger.debug("Getting final recommendations...")
+        products = await self.aget_products(self._suggested_skus(llm_recommendations))
+        return self._consolidate(llm_recommendations, products)
+
+    def _suggested_skus(
+        self, llm_recommendations: models.LLMRecommendationList
+    ) -> list[int]:
+        """Return the SKUs of every suggestion in the LLM's recommendations."""
+        return [
+            suggestion.sku
+            for rec in llm_recommendations.recommendations
+            for suggestion in rec.suggestions
+        ]
+
+    def _consolidate(
+        self,
+        llm_recommendations: models.LLMRecommendationList,
+        products: dict[int, dict[str, dict[str, str | int | float]]],
+    ) -> models.AgentRecommendationList:
+        """Merge the LLM's recommendations with the products' details."""
+        line_items = []
         for rec in llm_recommendations.recommendations:
             suggestions = []
             for suggestion in rec.suggestions:
-                details = self.get_product(suggestion.sku)["data"]
+                details = products[suggestion.sku]["data"]
                 suggestion_dict = {
                     **suggestion.model_dump(),
                     "qty_in_stock": details["qty_in_stock"],
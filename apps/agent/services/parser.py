@@ -1,14 +1,28 @@
 """This module defines the ParserService class."""
 
+import asyncio
+import concurrent.futures
 import logging
 import pathlib
 
+from apps.agent.dependencies import cache as ch
 from apps.agent.models import models
-from apps.agent.services import base_llm
+from apps.agent.services import base_llm, rule_parser as rp
+
+
+LINE_SEPARATOR = "<li/>"
 
 
 class ParserService(base_llm.BaseLLMService):
-    """This class is responsible for prompting the parsing LLM."""
+    """
+    This class is responsible for prompting the parsing LLM.
+    If a cache is given, lines parsed before are taken from it; if a rule-based parser
+    is given, the lines it parses confidently are taken from it. Only the remaining
+    lines are sent to the LLM.
+    Long grocery lists are sent in chunks of `chunk_size` lines, at most
+    `max_concurrent_chunks` at a time; the lines of a chunk that still fails
+    after retrying are returned unparsed, instead of failing the whole list.
+    """
 
     def __init__(
         self,
@@ -17,24 +31,51 @@ class ParserService(base_llm.BaseLLMService):
         base_prompt_file: pathlib.Path,
         dummy_responses_folder: pathlib.Path,
         logger: logging.Logger,
+        cache: ch.LRUCache | None = None,
+        chunk_size: int | None = None,
+        max_concurrent_chunks: int = 1,
+        rule_parser: rp.RuleParserService | None = None,
     ) -> None:
         super().__init__(
             api_key, model_name, base_prompt_file, dummy_responses_folder, logger
         )
+        self.cache = cache
+        self.chunk_size = chunk_size
+        self.max_concurrent_chunks = max_concurrent_chunks
+        self.rule_parser = rule_parser
 
     def parse_grocery_text(self, grocery_text: str) -> models.ParsedGroceryList:
         """Parse grocery list submitted by the user."""
         self.logger.debug(f"Parsing grocery text {grocery_text=}")
+        lines, cached, chunks = self._plan_chunks(grocery_text)
+        if len(chunks) <= 1:
+            results = [self._parse_chunk(chunk) for chunk in chunks]
+        else:
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.max_concurrent_chunks
+            ) as executor:
+                results = list(executor.map(self._parse_chunk, chunks))
+        return self._merge_lines(lines, cached, chunks, results)
+
+    async def aparse_grocery_text(self, grocery_text: str) -> models.ParsedGroceryList:
+        """Parse grocery list submitted by the user, without blocking the event loop."""
+        self.logger.debug(f"Parsing grocery text {grocery_text=}")
+        lines, cached, chunks = self._plan_chunks(grocery_text)
+        semaphore = asyncio.Semaphore(self.max_concurrent_chunks)
+
+        async def parse(chunk: list[str]) -> models.ParsedGroceryList | None:
+            async with semaphore:
+                return await self._aparse_chunk(chunk)
+
+        results = await asyncio.gather(*(parse(chunk) for chunk in chunks))
+        return self._merge_lines(lines, cached, chunks, results)
+
+    def _parse_chunk(self, chunk: list[str]) -> models.ParsedGroceryList | None:
+        """Send a chunk of lines to the LLM."""
+        self.logger.debug(f"Parsing a chunk of {len(chunk)} lines...")
         resp = None
         try:
-            base_prompt = self.base_prompt_file.read_text()
-            prompt = [
-                {
-                    "role": "system",
-                    "content": base_prompt,
-                },
-                {"role": "user", "content": grocery_text},
-            ]
+            prompt = self._build_prompt(join_lines(chunk))
             resp = self.client.request_structured_response(
                 prompt, models.ParsedGroceryList
             )
@@ -42,3 +83,101 @@ class ParserService(base_llm.BaseLLMService):
         except Exception as e:
             self.logger.exception(f"Exception while parsing grocery text: {e}")
         return resp
+
+    async def _aparse_chunk(self, chunk: list[str]) -> models.ParsedGroceryList | None:
+        """Send a chunk of lines to the LLM, without blocking the event loop."""
+        self.logger.debug(f"Parsing a chunk of {len(chunk)} lines...")
+        resp = None
+        try:
+            prompt = self._build_prompt(join_lines(chunk))
+            resp = await self.async_client.request_structured_response(
+                prompt, models.ParsedGroceryList
+            )
+            self.logger.debug("Successfully parsed grocery text!")
+        except Exception as e:
+            self.logger.exception(f"Exception while parsing grocery text: {e}")
+        return resp
+
+    def _plan_chunks(
+        self, grocery_text: str
+    ) -> tuple[list[str], dict[str, models.ParsedLineItem], list[list[str]]]:
+        """
+        Split the grocery text into lines, and look each of them up in the cache
+        or parse it with the rule-based parser. Return the lines, the line items
+        already known by line, and the chunks of lines to send to the LLM.
+        """
+        lines = [line for line in grocery_text.split(LINE_SEPARATOR) if line.strip()]
+        cached = {}
+        if self.cache is not None:
+            for line in lines:
+                content = self.cache.get(ch.normalize_text(line))
+                if content is not None:
+                    cached[line] = models.ParsedLineItem(**{**content, "query": line})
+        if self.rule_parser is not None:
+            cached.update(
+                self.rule_parser.parse_lines(
+                    [line for line in lines if line not in cached]
+                )
+            )
+        uncached_lines = list(
+            dict.fromkeys(line for line in lines if line not in cached)
+        )
+        chunk_size = self.chunk_size or len(uncached_lines) or 1
+        chunks = [
+            uncached_lines[i : i + chunk_size]
+            for i in range(0, len(uncached_lines), chunk_size)
+        ]
+        self.logger.debug(
+            f"Found {len(cached)} of {len(lines)} lines in the cache or parsed by rules, "
+            f"{len(uncached_lines)} lines left to parse in {len(chunks)} chunks"
+        )
+        return lines, cached, chunks
+
+    def _merge_lines(
+        self,
+        lines: list[str],
+        cached: dict[str, models.ParsedLineItem],
+        chunks: list[list[str]],
+        results: list[models.ParsedGroceryList | None],
+    ) -> models.ParsedGroceryList | None:
+        """
+        Cache the newly parsed lines, and return the parsed grocery list in the original order.
+        The lines of a failed chunk, or that the LLM left out of its response,
+        are returned as unparsed lines; if every chunk failed, None is returned.
+        """
+        if chunks and all(resp is None for resp in results):
+            return None
+
+        parsed = {}
+        for chunk, resp in zip(chunks, results):
+            if resp is None:
+                self.logger.warning(f"Returning {len(chunk)} lines unparsed!")
+                continue
+            if len(resp.grocery_list) == len(chunk):
+                pairs = zip(chunk, resp.grocery_list)
+            else:
+                by_key = {
+                    ch.normalize_text(line_item.query): line_item
+                    for line_item in resp.grocery_list
+                }
+                pairs = ((line, by_key.get(ch.normalize_text(line))) for line in chunk)
+            for line, line_item in pairs:
+                if line_item is None:
+                    continue
+                parsed[line] = line_item
+                # unparsed lines aren't cached, so that they are retried
+                if self.cache is not None and line_item.product:
+                    self.cache.set(ch.normalize_text(line), line_item.model_dump())
+
+        grocery_list = []
+        for line in lines:
+            line_item = cached.get(line) or parsed.get(line)
+            if line_item is None:
+                line_item = models.ParsedLineItem(query=line, product=None)
+            grocery_list.append(line_item.model_copy(update={"query": line}))
+        return models.ParsedGroceryList(grocery_list=grocery_list)
+
+
+def join_lines(lines: list[str]) -> str:
+    """Join grocery list lines into the format expected by the LLM."""
+    return "".join(LINE_SEPARATOR + line for line in lines)
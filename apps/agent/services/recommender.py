@@ -1,15 +1,26 @@
 """This module defines the RecommenderService class."""
 
+import asyncio
+import concurrent.futures
+import hashlib
 import json
 import logging
 import pathlib
 
+from apps.agent.dependencies import cache as ch
 from apps.agent.models import models
 from apps.agent.services import base_llm
 
 
 class RecommenderService(base_llm.BaseLLMService):
-    """This class is responsible for prompting the recommending LLM."""
+    """
+    This class is responsible for prompting the recommending LLM.
+    If a cache is given, the suggestions for a product with the same candidates are
+    taken from it, and only the other lines are sent to the LLM. The cache is cleared
+    whenever a new version of the store catalog is loaded.
+    By default all the lines are sent in one request; if `group_size` is given, they are
+    sent in groups of that many lines instead, at most `max_concurrent_requests` at a time.
+    """
 
     def __init__(
         self,
@@ -18,28 +29,63 @@ class RecommenderService(base_llm.BaseLLMService):
         base_prompt_file: pathlib.Path,
         dummy_responses_folder: pathlib.Path,
         logger: logging.Logger,
+        cache: ch.LRUCache | None = None,
+        group_size: int | None = None,
+        max_concurrent_requests: int = 1,
     ) -> None:
         super().__init__(
             api_key, model_name, base_prompt_file, dummy_responses_folder, logger
         )
+        self.cache = cache
+        self.catalog_version = None
+        self.group_size = group_size
+        self.max_concurrent_requests = max_concurrent_requests
 
     def recommend_products(
-        self, pruned_catalog_list: models.PrunedCatalogList
+        self,
+        pruned_catalog_list: models.PrunedCatalogList,
+        catalog_version: int | None = None,
     ) -> models.LLMRecommendationList:
         """Recommend products based on pruned catalog list."""
         self.logger.debug("Generating product recommendations...")
+        cached, groups, rows = self._plan_groups(pruned_catalog_list, catalog_version)
+        if len(groups) <= 1:
+            results = [self._recommend_group(group) for group in groups]
+        else:
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.max_concurrent_requests
+            ) as executor:
+                results = list(executor.map(self._recommend_group, groups))
+        return self._merge_lines(pruned_catalog_list, cached, rows, results)
+
+    async def arecommend_products(
+        self,
+        pruned_catalog_list: models.PrunedCatalogList,
+        catalog_version: int | None = None,
+    ) -> models.LLMRecommendationList:
+        """Recommend products based on pruned catalog list, without blocking the event loop."""
+        self.logger.debug("Generating product recommendations...")
+        cached, groups, rows = self._plan_groups(pruned_catalog_list, catalog_version)
+        semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+
+        async def recommend(
+            group: models.PrunedCatalogList,
+        ) -> models.LLMRecommendationList | None:
+            async with semaphore:
+                return await self._arecommend_group(group)
+
+        results = await asyncio.gather(*(recommend(group) for group in groups))
+        return self._merge_lines(pruned_catalog_list, cached, rows, results)
+
+    def _recommend_group(
+        self, group: models.PrunedCatalogList
+    ) -> models.LLMRecommendationList | None:
+        """Send a group of lines to the LLM."""
         resp = None
         try:
-            dumped_list = json.dumps(pruned_catalog_list.model_dump())
+            dumped_list = json.dumps(group.model_dump())
             self.logger.debug(f"Pruned catalog: {dumped_list}")
-            base_prompt = self.base_prompt_file.read_text()
-            prompt = [
-                {
-                    "role": "system",
-                    "content": base_prompt,
-                },
-                {"role": "user", "content": dumped_list},
-            ]
+            prompt = self._build_prompt(dumped_list)
             resp = self.client.request_structured_response(
                 prompt, models.LLMRecommendationList
             )
@@ -49,3 +95,132 @@ class RecommenderService(base_llm.BaseLLMService):
                 f"Exception while generating product recommendations: {e}"
             )
         return resp
+
+    async def _arecommend_group(
+        self, group: models.PrunedCatalogList
+    ) -> models.LLMRecommendationList | None:
+        """Send a group of lines to the LLM, without blocking the event loop."""
+        resp = None
+        try:
+            dumped_list = json.dumps(group.model_dump())
+            self.logger.debug(f"Pruned catalog: {dumped_list}")
+            prompt = self._build_prompt(dumped_list)
+            resp = await self.async_client.request_structured_response(
+                prompt, models.LLMRecommendationList
+            )
+            self.logger.debug("Successfully generated product recommendations!")
+        except Exception as e:
+            self.logger.exception(
+                f"Exception while generating product recommendations: {e}"
+            )
+        return resp
+
+    def _plan_groups(
+        self,
+        pruned_catalog_list: models.PrunedCatalogList,
+        catalog_version: int | None,
+    ) -> tuple[
+        dict[int, models.LLMRecommendationListPerGroceryListLine],
+        list[models.PrunedCatalogList],
+        list[list[int]] | None,
+    ]:
+        """
+        Look each line up in the cache, clearing it first if the catalog version changed.
+        Return the cached recommendations by line number, the groups of lines to send
+        to the LLM, and the line numbers in each group. Without a cache or groups,
+        the whole list is sent as is and there are no line numbers.
+        """
+        if self.cache is None and self.group_size is None:
+            return {}, [pruned_catalog_list], None
+
+        cached = {}
+        if self.cache is not None:
+            if catalog_version != self.catalog_version:
+                self.logger.debug(
+                    f"Store catalog changed from {self.catalog_version=} to {catalog_version=},"
+                    " clearing the cache"
+                )
+                self.cache.clear()
+                self.catalog_version = catalog_version
+            for i, line in enumerate(pruned_catalog_list.lines):
+                key = cache_key(line)
+                suggestions = self.cache.get(key) if key else None
+                if suggestions is not None:
+                    cached[i] = models.LLMRecommendationListPerGroceryListLine(
+                        query=line.query, suggestions=suggestions
+                    )
+
+        lines = pruned_catalog_list.lines
+        uncached_rows = [i for i in range(len(lines)) if i not in cached]
+        group_size = self.group_size or len(uncached_rows) or 1
+        rows = [
+            uncached_rows[i : i + group_size]
+            for i in range(0, len(uncached_rows), group_size)
+        ]
+        groups = [
+            models.PrunedCatalogList(lines=[lines[i] for i in group_rows])
+            for group_rows in rows
+        ]
+        self.logger.debug(
+            f"Found {len(cached)} of {len(lines)} lines in the cache, "
+            f"{len(uncached_rows)} lines left to send in {len(groups)} requests"
+        )
+        return cached, groups, rows
+
+    def _merge_lines(
+        self,
+        pruned_catalog_list: models.PrunedCatalogList,
+        cached: dict[int, models.LLMRecommendationListPerGroceryListLine],
+        rows: list[list[int]] | None,
+        results: list[models.LLMRecommendationList | None],
+    ) -> models.LLMRecommendationList | None:
+        """
+        Cache the new recommendations, and return the recommendations in the original order.
+        The lines of a failed request, or that the LLM left out of its response,
+        get no suggestions; if every request failed, None is returned.
+        """
+        if rows is None:
+            return results[0]
+        if rows and all(resp is None for resp in results):
+            return None
+
+        lines = pruned_catalog_list.lines
+        recommendations = dict(cached)
+        for group_rows, resp in zip(rows, results):
+            if resp is None:
+                self.logger.warning(f"No suggestions for {len(group_rows)} lines!")
+                continue
+            if len(resp.recommendations) == len(group_rows):
+                pairs = zip(group_rows, resp.recommendations)
+            else:
+                by_query = {rec.query: rec for rec in resp.recommendations}
+                pairs = ((i, by_query.get(lines[i].query)) for i in group_rows)
+            for i, rec in pairs:
+                if rec is None:
+                    continue
+                recommendations[i] = rec.model_copy(update={"query": lines[i].query})
+                key = cache_key(lines[i])
+                if self.cache is not None and key:
+                    self.cache.set(key, [s.model_dump() for s in rec.suggestions])
+
+        return models.LLMRecommendationList(
+            recommendations=[
+                recommendations.get(i)
+                or models.LLMRecommendationListPerGroceryListLine(
+                    query=line.query, suggestions=[]
+                )
+                for i, line in enumerate(lines)
+            ]
+        )
+
+
+def cache_key(line: models.PrunedCatalogPerGroceryListLine) -> str | None:
+    """
+    Return the cache key of a line, made of its product and a hash of its candidates' SKUs;
+    unparsed lines have no key.
+    """
+    if not line.product:
+        return None
+    skus = ",".join(str(sku) for sku in sorted(c.sku for c in line.candidates))
+    digest = hashlib.sha1(skus.encode()).hexdigest()
+    return f"{ch.normalize_text(line.product)}:{digest}"
@@ -0,0 +1,129 @@
+"""This module defines the RuleParserService class."""
+
+import logging
+import re
+
+from apps.agent.models import models
+
+
+NUMBER_WORDS = {
+    "a": 1,
+    "an": 1,
+    "one": 1,
+    "two": 2,
+    "three": 3,
+    "four": 4,
+    "five": 5,
+    "six": 6,
+    "seven": 7,
+    "eight": 8,
+    "nine": 9,
+    "ten": 10,
+    "eleven": 11,
+    "twelve": 12,
+    "dozen": 12,
+}
+UNITS = (
+    "bag|bags|bar|bars|bottle|bottles|box|boxes|bunch|bunches|can|cans|carton|cartons|"
+    "dozen|g|gram|grams|jar|jars|kg|kilo|kilos|l|lb|lbs|liter|liters|litre|litres|loaf|"
+    "loaves|ml|pack|packs|packet|packets|piece|pieces|pound|pounds|tin|tins|tub|tubs"
+)
+# words that usually mean the line says more than just a product, e.g. "tuna in can"
+NOT_PRODUCT_WORDS = {"and", "for", "in", "of", "or", "with", "without"}
+
+QUANTITY_FIRST = re.compile(
+    rf"^(?P<quantity>\d+(?:\.\d+)?|[a-z]+(?=\s))\s*(?:(?P<unit>{UNITS})\s+(?:of\s+)?)?\s*"
+    r"(?P<product>[a-z][a-z' -]*)$"
+)
+QUANTITY_LAST = re.compile(r"^(?P<product>[a-z][a-z' -]*),?\s+(?P<quantity>\d+)$")
+PRODUCT_ONLY = re.compile(r"^(?P<product>[a-z][a-z' -]*)$")
+
+
+class RuleParserService:
+    """
+    This class is responsible for parsing simple grocery list lines, e.g. "3 packs of milk",
+    without an LLM. Each parsed line comes with a confidence between 0 and 1;
+    only the lines parsed with at least `min_confidence` are returned by parse_lines().
+    """
+
+    def __init__(self, min_confidence: float, logger: logging.Logger) -> None:
+        child_logger = logger.getChild("RuleParserService")
+        self.logger = child_logger
+        self.min_confidence = min_confidence
+        self.logger.debug(
+            f"Finished initializing rule-based parser, {self.min_confidence=}!"
+        )
+
+    def parse_lines(self, lines: list[str]) -> dict[str, models.ParsedLineItem]:
+        """Return the line items of the lines that were parsed confidently, by line."""
+        parsed = {}
+        for line in lines:
+            line_item, confidence = self.parse_line(line)
+            if line_item is not None and confidence >= self.min_confidence:
+                parsed[line] = line_item
+        self.logger.debug(f"Confidently parsed {len(parsed)} of {len(lines)} lines")
+        return parsed
+
+    def parse_line(self, line: str) -> tuple[models.ParsedLineItem | None, float]:
+        """Parse a grocery list line; a line that matches no rule has a confidence of 0."""
+        text = " ".join(line.split()).lower()
+
+        match = QUANTITY_FIRST.match(text)
+        if match:
+            quantity = parse_quantity(match["quantity"])
+            if quantity is not None:
+                # "3 packs of milk" is more certain than "3 cookies" or "four apples";
+                # without a known unit, extra words may be an unknown unit, e.g. "2 heads
+                # lettuce", or adjectives, so they're as uncertain as in PRODUCT_ONLY
+                if match["unit"]:
+                    confidence = 0.95
+                elif len(match["product"].split()) == 1:
+                    confidence = 0.9
+                else:
+                    confidence = 0.75
+                if not match["quantity"][0].isdigit():
+                    confidence = round(confidence - 0.05, 2)
+                return self._line_item(
+                    line, match["product"], quantity, match["unit"], confidence
+                )
+
+        match = QUANTITY_LAST.match(text)
+        if match:
+            return self._line_item(
+                line, match["product"], float(match["quantity"]), None, 0.85
+            )
+
+        match = PRODUCT_ONLY.match(text)
+        if match:
+            # extra words are often adjectives the LLM would drop, e.g. "fresh lemonade"
+            confidence = 0.9 if len(match["product"].split()) == 1 else 0.75
+            return self._line_item(line, match["product"], None, None, confidence)
+
+        return None, 0
+
+    def _line_item(
+        self,
+        line: str,
+        product: str,
+        quantity: float | None,
+        unit: str | None,
+        confidence: float,
+    ) -> tuple[models.ParsedLineItem | None, float]:
+        """Return the line item and its confidence, unless the product looks wrong."""
+        product = product.strip(" -'")
+        words = product.split()
+        if not words or NOT_PRODUCT_WORDS.intersection(words) or len(words) > 4:
+            return None, 0
+        line_item = models.ParsedLineItem(
+            query=line, product=product, quantity=quantity, unit=unit
+        )
+        return line_item, confidence
+
+
+def parse_quantity(text: str) -> float | None:
+    """Return the quantity written in digits or as a word, or None if it isn't one."""
+    if text[0].isdigit():
+        return float(text)
+    if text in NUMBER_WORDS:
+        return float(NUMBER_WORDS[text])
+    return None
@@ -1,3 +1,4 @@
+DROP TABLE IF EXISTS catalog_changes;
 DROP TABLE IF EXISTS products;
 CREATE TABLE products (
 	sku INTEGER,
@@ -6,4 +7,24 @@ CREATE TABLE products (
 	unit_price FLOAT,
 	qty_in_stock INTEGER,
 	PRIMARY KEY (sku)
-);
\ No newline at end of file
+);
+-- one row per change to a product's SKU or full name, so that clients can
+-- refresh their copy of the catalog with the changes since the version they have
+CREATE TABLE catalog_changes (
+	version INTEGER PRIMARY KEY AUTOINCREMENT,
+	sku INTEGER NOT NULL,
+	changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TRIGGER products_inserted AFTER INSERT ON products
+BEGIN
+	INSERT INTO catalog_changes (sku) VALUES (NEW.sku);
+END;
+CREATE TRIGGER products_renamed AFTER UPDATE OF sku, brand, description ON products
+BEGIN
+	INSERT INTO catalog_changes (sku) SELECT OLD.sku WHERE OLD.sku != NEW.sku;
+	INSERT INTO catalog_changes (sku) VALUES (NEW.sku);
+END;
+CREATE TRIGGER products_deleted AFTER DELETE ON products
+BEGIN
+	INSERT INTO catalog_changes (sku) VALUES (OLD.sku);
+END;
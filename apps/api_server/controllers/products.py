@@ -1,10 +1,13 @@
 """This module defines the functions called when the routes in routers/products.py are invoked."""
 
-from collections.abc import Sequence
+import json
+from collections.abc import Iterator, Sequence
 
 from sqlmodel import Session
 
+from apps.api_server.dependencies import cache, constants
 from apps.api_server.models import products
+from apps.api_server.schemas import products as sp
 
 
 def retrieve_product(session: Session, product_id: int) -> products.Products:
@@ -12,6 +15,29 @@ def retrieve_product(session: Session, product_id: int) -> products.Products:
     return products.Products.retrieve(session, product_id)
 
 
+def retrieve_product_details(
+    session: Session, product_id: int
+) -> tuple[sp.WrappedProductDetails, str]:
+    """Retrieve a single product's details and their ETag, through the cache."""
+    entry = cache.products.get(product_id)
+    if entry is None:
+        generation = cache.products.generation
+        product = retrieve_product(session, product_id)
+        product_details = sp.WrappedProductDetails(
+            data=sp.ProductDetails.model_validate(product)
+        )
+        entry = (product_details, cache.compute_etag(product_details))
+        cache.products.set(product_id, entry, generation)
+    return entry
+
+
+def retrieve_products(
+    session: Session, product_ids: Sequence[int]
+) -> Sequence[products.Products]:
+    """Retrieve several products at once."""
+    return products.Products.retrieve_many(session, sorted(set(product_ids)))
+
+
 def retrieve_listing(
     session: Session, page: int, products_per_page: int, route_of_listing: str
 ) -> tuple[Sequence[products.Products], dict[str, int | str | None]]:
@@ -25,3 +51,105 @@ def retrieve_listing(
         "next": route_of_listing.format(page + 1, limit) if has_more else None,
     }
     return fetched_records, fetch_metadata
+
+
+def retrieve_listing_after(
+    session: Session, after_sku: int, products_per_page: int, route_of_listing: str
+) -> tuple[Sequence[products.Products], dict[str, int | str | None]]:
+    """Retrieve a list of products whose SKUs come after `after_sku`."""
+    limit = products_per_page
+    fetched_records, has_more = products.Products.listing_after(
+        session, after_sku, limit
+    )
+    fetch_metadata = {
+        "count": len(fetched_records),
+        # keyset pagination only moves forward
+        "previous": None,
+        "next": (
+            route_of_listing.format(fetched_records[-1].sku, limit)
+            if has_more
+            else None
+        ),
+    }
+    return fetched_records, fetch_metadata
+
+
+def export_catalog(session: Session) -> Iterator[str]:
+    """Export the store catalog as NDJSON, one product per line."""
+    rows = products.Products.stream_short_info(
+        session, constants.CATALOG_EXPORT_BATCH_SIZE
+    )
+    for sku, brand, description in rows:
+        yield json.dumps({"sku": sku, "full_name": brand + " " + description}) + "\n"
+
+
+def retrieve_changes(
+    session: Session, since: int | None, limit: int, route_of_changes: str
+) -> tuple[dict[int, products.Products | None], dict[str, int | str | None]]:
+    """
+    Retrieve the products changed after version `since`, by SKU, in the order
+    of their latest change; deleted products are None. If `since` isn't given,
+    no products are retrieved, only the current version.
+    """
+    if since is None:
+        return {}, {
+            "version": products.CatalogChanges.latest_version(session),
+            "next": None,
+        }
+
+    limit = min(limit, constants.MAX_PRODUCTS_PER_BATCH)
+    changes, has_more = products.CatalogChanges.since(session, since, limit)
+    skus = list(dict.fromkeys(change.sku for change in reversed(changes)))[::-1]
+    existing = {
+        product.sku: product
+        for product in products.Products.retrieve_many(session, skus)
+    }
+    version = changes[-1].version if changes else since
+    fetch_metadata = {
+        "version": version,
+        "next": route_of_changes.format(version, limit) if has_more else None,
+    }
+    return {sku: existing.get(sku) for sku in skus}, fetch_metadata
+
+
+def retrieve_listing_page(
+    session: Session,
+    page: int,
+    products_per_page: int,
+    after_sku: int | None,
+    route_of_listing: str,
+    route_of_cursor_listing: str,
+) -> tuple[sp.WrappedProductListing, str]:
+    """
+    Retrieve a listing page and its ETag, through the cache.
+    If `after_sku` is given, the listing is paginated with a cursor and `page` is ignored.
+    """
+    key = (after_sku, page if after_sku is None else None, products_per_page)
+    entry = cache.listings.get(key)
+    if entry is not None:
+        return entry
+
+    generation = cache.listings.generation
+    if after_sku is None:
+        retrieved_products, metadata = retrieve_listing(
+            session, page, products_per_page, route_of_listing
+        )
+    else:
+        retrieved_products, metadata = retrieve_listing_after(
+            session, after_sku, products_per_page, route_of_cursor_listing
+        )
+    product_listing = []
+    for product in retrieved_products:
+        product_info = sp.ProductShortInfo(
+            sku=product.sku, full_name=product.brand + " " + product.description
+        )
+        product_listing.append(product_info)
+    wrapped_listing = sp.WrappedProductListing(
+        data=product_listing,
+        count=metadata["count"],
+        previous=metadata["previous"],
+        next=metadata["next"],
+    )
+    entry = (wrapped_listing, cache.compute_etag(wrapped_listing))
+    cache.listings.set(key, entry, generation)
+    return entry
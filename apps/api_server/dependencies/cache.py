@@ -0,0 +1,118 @@
+"""This module defines the in-process caches of the API server, and their ETag helpers."""
+
+import collections
+import hashlib
+import threading
+import time
+from collections.abc import Hashable
+from typing import Any
+
+from sqlmodel import SQLModel
+
+from apps.api_server.dependencies import constants
+
+
+class LRUCache:
+    """
+    This class is a thread-safe, in-memory LRU cache whose entries expire after `ttl` seconds.
+    A max size of 0 disables the cache, i.e. nothing is ever cached.
+    """
+
+    def __init__(self, max_size: int, ttl: float | None = None) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # incremented by every deletion, see set()
+        self.generation = 0
+        # key -> (value, expiry time or None)
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of entries."""
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any | None:
+        """Return the value cached under the key, or None if it's missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if (
+                entry is not None
+                and entry[1] is not None
+                and entry[1] <= time.monotonic()
+            ):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any, generation: int | None = None) -> None:
+        """
+        Cache the value under the key.
+        If given, `generation` is the cache's generation read before the value was loaded;
+        the value isn't cached if anything was invalidated since, as it may be stale.
+        """
+        if self.max_size <= 0:
+            return
+        expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        """Remove the key from the cache."""
+        with self._lock:
+            self.generation += 1
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove every entry from the cache."""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        """Return the cache statistics."""
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# product ID -> (wrapped product details, ETag)
+products = LRUCache(constants.PRODUCT_CACHE_MAX_SIZE, constants.PRODUCT_CACHE_TTL)
+# (after_sku, page, products_per_page) -> (wrapped product listing, ETag)
+listings = LRUCache(constants.LISTING_CACHE_MAX_SIZE, constants.LISTING_CACHE_TTL)
+
+
+def invalidate_product(product_id: int) -> None:
+    """
+    Drop a product, and every listing page since any of them may hold it, from the caches.
+    This is called when a change to the product is committed through the ORM in this
+    process; other changes are only seen once the cached entries expire.
+    """
+    products.delete(product_id)
+    listings.clear()
+
+
+def compute_etag(model: SQLModel) -> str:
+    """Return a strong ETag for a response body."""
+    digest = hashlib.sha1(model.model_dump_json().encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Return whether the value of an If-None-Match header matches the ETag."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored
+    candidates = (candidate.strip() for candidate in if_none_match.split(","))
+    return etag in (candidate.removeprefix("W/") for candidate in candidates)
@@ -8,4 +8,42 @@ SQLITE_SEED_SCRIPT = "assets/seed.sql"
 # allow FastAPI to use the same SQLite database in different threads
 SQLITE_CONNECT_ARGS = {"check_same_thread": False}
 
+# set on every new connection; WAL lets readers run while a write is in progress,
+# and NORMAL synchronous is safe with WAL while syncing far less often
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    # negative sizes are in KiB, i.e. 64 MiB of page cache per connection
+    "cache_size": -64_000,
+    "mmap_size": 256 * 2**20,
+    "temp_store": "MEMORY",
+}
+
+# log every SQL statement executed; very slow under load, so only meant for debugging
+SQL_ECHO = False
+
+# upper bounds, in seconds, of the buckets of the query latency histograms
+QUERY_TIMING_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+# fraction of the SQL statements that are timed
+QUERY_TIMING_SAMPLE_RATE = 1.0
+# statements slower than this many seconds are logged; set to None to disable
+SLOW_QUERY_THRESHOLD = 0.1
+
+# largest page of the product listing that can be requested
+MAX_PRODUCTS_PER_PAGE = 1000
+
+# keep well below SQLite's limit on the number of host parameters in one statement
+MAX_PRODUCTS_PER_BATCH = 500
+
+# number of rows fetched from the database cursor at a time when exporting the catalog
+CATALOG_EXPORT_BATCH_SIZE = 1000
+
+# number of products and listing pages kept in memory; 0 disables caching.
+# Invalidation is process-local, so changes made by other processes (other workers,
+# the seed script, raw SQL) are only seen once the entries expire, after the TTLs in seconds
+PRODUCT_CACHE_MAX_SIZE = 0
+LISTING_CACHE_MAX_SIZE = 0
+PRODUCT_CACHE_TTL = 5.0
+LISTING_CACHE_TTL = 5.0
+
 ERROR_NOT_FOUND = "The specified product was not found."
@@ -1,14 +1,17 @@
 """Ths module is responsible for the application's integration with the database."""
 
 import pathlib
+from collections.abc import Callable
 from typing import Any, Generator
 
-from sqlalchemy import Engine
+from sqlalchemy import Engine, event
 from sqlmodel import Session, create_engine
 
-from apps.api_server.dependencies import constants
+from apps.api_server.dependencies import constants, query_timer
 
 engine = None
+# a separate pool of connections that can only read, for the routes that don't write
+read_only_engine = None
 
 
 def compute_database_uri() -> str:
@@ -18,14 +21,39 @@ def compute_database_uri() -> str:
     return constants.SQLITE_URI.format(database_location)
 
 
-def get_engine(database_uri: str | None) -> Engine:
-    """Create an engine to the given URI and return it."""
+def get_engine(database_uri: str | None, read_only: bool = False) -> Engine:
+    """
+    Create an engine to the given URI, time its statements, and return it.
+    Every new connection is tuned with SQLITE_PRAGMAS; if `read_only` is set,
+    it's also made to refuse writes.
+    """
     if database_uri is None:
         database_uri = compute_database_uri()
 
-    return create_engine(
-        database_uri, connect_args=constants.SQLITE_CONNECT_ARGS, echo=True
+    engine = create_engine(
+        database_uri,
+        connect_args=constants.SQLITE_CONNECT_ARGS,
+        echo=constants.SQL_ECHO,
     )
+    pragmas = dict(constants.SQLITE_PRAGMAS)
+    if read_only:
+        pragmas["query_only"] = "ON"
+    if pragmas:
+        event.listen(engine, "connect", _pragma_setter(pragmas))
+    query_timer.timer.attach(engine)
+    return engine
+
+
+def _pragma_setter(pragmas: dict[str, str | int]) -> Callable[[Any, Any], None]:
+    """Return a connect event listener that sets the pragmas on new connections."""
+
+    def set_pragmas(dbapi_connection: Any, connection_record: Any) -> None:
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+    return set_pragmas
 
 
 def get_session() -> Generator[Session, Any, None]:
@@ -35,3 +63,12 @@ def get_session() -> Generator[Session, Any, None]:
         engine = get_engine(None)
     with Session(engine) as session:
         yield session
+
+
+def get_read_only_session() -> Generator[Session, Any, None]:
+    """Yield a database session from the read-only pool."""
+    global read_only_engine
+    if not read_only_engine:
+        read_only_engine = get_engine(None, read_only=True)
+    with Session(read_only_engine) as session:
+        yield session
@@ -0,0 +1,127 @@
+"""This module times the SQL statements executed by the database engines."""
+
+import bisect
+import logging
+import random
+import threading
+import time
+from typing import Any
+
+from sqlalchemy import Engine, event
+
+from apps.api_server.dependencies import constants
+
+
+class QueryTimer:
+    """
+    This class records the latency of SQL statements, through SQLAlchemy's cursor events.
+    Each distinct statement gets a histogram of its latencies; statements slower than
+    `slow_query_threshold` seconds are logged. Only a `sample_rate` fraction of the
+    executions are timed, so that timing stays cheap under load.
+    """
+
+    def __init__(
+        self,
+        buckets: tuple[float, ...],
+        slow_query_threshold: float | None,
+        sample_rate: float,
+        logger: logging.Logger,
+    ) -> None:
+        # upper bounds of the histogram buckets, in seconds; the last bucket is unbounded
+        self.buckets = tuple(sorted(buckets))
+        self.slow_query_threshold = slow_query_threshold
+        self.sample_rate = sample_rate
+        self.logger = logger.getChild("QueryTimer")
+        self._statements = {}
+        self._lock = threading.Lock()
+
+    def attach(self, engine: Engine) -> None:
+        """Time the statements executed by the engine."""
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def record(self, statement: str, elapsed: float) -> None:
+        """Record one execution of the statement, which took `elapsed` seconds."""
+        bucket = bisect.bisect_left(self.buckets, elapsed)
+        with self._lock:
+            stats = self._statements.get(statement)
+            if stats is None:
+                stats = {
+                    "count": 0,
+                    "total": 0.0,
+                    "max": 0.0,
+                    "histogram": [0] * (len(self.buckets) + 1),
+                }
+                self._statements[statement] = stats
+            stats["count"] += 1
+            stats["total"] += elapsed
+            stats["max"] = max(stats["max"], elapsed)
+            stats["histogram"][bucket] += 1
+
+        if (
+            self.slow_query_threshold is not None
+            and elapsed > self.slow_query_threshold
+        ):
+            self.logger.warning(f"Slow query ({elapsed:.3f}s): {statement}")
+
+    def stats(self) -> dict[str, Any]:
+        """Return the histogram buckets, and the latency statistics of each statement."""
+        with self._lock:
+            statements = [
+                {
+                    "statement": statement,
+                    "count": stats["count"],
+                    "mean": stats["total"] / stats["count"],
+                    "max": stats["max"],
+                    "histogram": list(stats["histogram"]),
+                }
+                for statement, stats in self._statements.items()
+            ]
+        statements.sort(key=lambda stats: stats["count"] * stats["mean"], reverse=True)
+        return {
+            "buckets": list(self.buckets),
+            "sample_rate": self.sample_rate,
+            "statements": statements,
+        }
+
+    def reset(self) -> None:
+        """Forget every recorded execution."""
+        with self._lock:
+            self._statements.clear()
+
+    def _before_cursor_execute(
+        self,
+        conn: Any,
+        cursor: Any,
+        statement: str,
+        parameters: Any,
+        context: Any,
+        executemany: bool,
+    ) -> None:
+        """Note, on the execution context, when a sampled statement starts executing."""
+        if context is not None and (
+            self.sample_rate >= 1 or random.random() < self.sample_rate
+        ):
+            context.query_start_time = time.perf_counter()
+
+    def _after_cursor_execute(
+        self,
+        conn: Any,
+        cursor: Any,
+        statement: str,
+        parameters: Any,
+        context: Any,
+        executemany: bool,
+    ) -> None:
+        """Record the latency of a sampled statement."""
+        start = getattr(context, "query_start_time", None)
+        if start is not None:
+            self.record(statement, time.perf_counter() - start)
+
+
+timer = QueryTimer(
+    constants.QUERY_TIMING_BUCKETS,
+    constants.SLOW_QUERY_THRESHOLD,
+    constants.QUERY_TIMING_SAMPLE_RATE,
+    logging.getLogger("APIServer"),
+)
@@ -1,8 +1,11 @@
 """This is the main module of the API server application."""
 
+from typing import Any
+
 import uvicorn
 from fastapi import FastAPI, status
 
+from apps.api_server.dependencies import query_timer
 from apps.api_server.routers import products
 
 app = FastAPI()
@@ -22,5 +25,11 @@ async def health() -> dict[str, str]:
     return {"message": "All is well."}
 
 
+@app.get("/metrics/queries", status_code=status.HTTP_200_OK)
+async def query_metrics() -> dict[str, Any]:
+    """Handle query metrics requests; returns the latency histogram of each SQL statement."""
+    return query_timer.timer.stats()
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="127.0.0.1", port=8000)
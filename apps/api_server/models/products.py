@@ -1,12 +1,13 @@
-"""This module defines the Product model for the sqlmodel ORM."""
+"""This module defines the Product and CatalogChanges models for the sqlmodel ORM."""
 
-from collections.abc import Sequence
-from typing import Self
+from collections.abc import Iterator, Sequence
+from typing import Any, Self
 
 from fastapi import HTTPException
-from sqlmodel import Session, select
+from sqlalchemy import event, orm
+from sqlmodel import Session, func, select
 
-from apps.api_server.dependencies import constants
+from apps.api_server.dependencies import cache, constants
 from apps.api_server.schemas import products
 
 
@@ -24,6 +25,17 @@ class Products(products.ProductDetails, table=True):
             raise HTTPException(status_code=404, detail=constants.ERROR_NOT_FOUND)
         return existing_obj
 
+    @classmethod
+    def retrieve_many(
+        cls, session: Session, product_ids: Sequence[int]
+    ) -> Sequence[Self]:
+        """The bulk Retrieve operation; non-existing products are left out."""
+        if not product_ids:
+            return []
+        return session.exec(
+            select(cls).where(cls.sku.in_(product_ids)).order_by(cls.sku)
+        ).all()
+
     @classmethod
     def listing(
         cls, session: Session, offset: int, limit: int
@@ -34,3 +46,79 @@ class Products(products.ProductDetails, table=True):
             select(cls).order_by(cls.sku).offset(offset).limit(limit + 1)
         ).all()
         return fetched_records[:limit], len(fetched_records) > limit
+
+    @classmethod
+    def listing_after(
+        cls, session: Session, after_sku: int, limit: int
+    ) -> tuple[Sequence[Self], bool]:
+        """The Listing operation, using keyset pagination on the primary key."""
+        # unlike OFFSET, seeking past `after_sku` doesn't scan the earlier rows
+        fetched_records = session.exec(
+            select(cls).where(cls.sku > after_sku).order_by(cls.sku).limit(limit + 1)
+        ).all()
+        return fetched_records[:limit], len(fetched_records) > limit
+
+    @classmethod
+    def stream_short_info(
+        cls, session: Session, batch_size: int
+    ) -> Iterator[tuple[int, str, str]]:
+        """The Export operation; yields (sku, brand, description) without loading all rows."""
+        statement = (
+            select(cls.sku, cls.brand, cls.description)
+            .order_by(cls.sku)
+            .execution_options(yield_per=batch_size)
+        )
+        yield from session.exec(statement)
+
+
+@event.listens_for(Products, "after_insert")
+@event.listens_for(Products, "after_update")
+@event.listens_for(Products, "after_delete")
+def _record_changed_product(
+    mapper: orm.Mapper, connection: Any, target: Products
+) -> None:
+    """Remember the products changed by a flush, until the session commits."""
+    session = orm.object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_products", set()).add(target.sku)
+
+
+@event.listens_for(orm.Session, "after_commit")
+def _invalidate_changed_products(session: orm.Session) -> None:
+    """Drop the products changed by a commit from the caches."""
+    for sku in session.info.pop("changed_products", ()):
+        cache.invalidate_product(sku)
+
+
+@event.listens_for(orm.Session, "after_rollback")
+def _forget_changed_products(session: orm.Session) -> None:
+    """Forget the products changed by a rolled back transaction."""
+    session.info.pop("changed_products", None)
+
+
+class CatalogChanges(products.CatalogChange, table=True):
+    """
+    ORM class for `catalog_changes` table.
+    The table is filled by triggers on the `products` table, see create.sql.
+    """
+
+    __tablename__ = "catalog_changes"
+
+    @classmethod
+    def latest_version(cls, session: Session) -> int:
+        """Return the version of the latest change, or 0 if there's none."""
+        return session.exec(select(func.max(cls.version))).one() or 0
+
+    @classmethod
+    def since(
+        cls, session: Session, version: int, limit: int
+    ) -> tuple[Sequence[Self], bool]:
+        """The Listing operation, for the changes made after `version`."""
+        # fetch an extra record, to check whether there are more changes
+        fetched_records = session.exec(
+            select(cls)
+            .where(cls.version > version)
+            .order_by(cls.version)
+            .limit(limit + 1)
+        ).all()
+        return fetched_records[:limit], len(fetched_records) > limit
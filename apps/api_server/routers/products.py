@@ -1,14 +1,21 @@
-"""This module defines the API router to handle requests to /stars."""
+"""
+This module defines the API router to handle requests to /stars.
+The routes are plain functions, so FastAPI runs them in its threadpool
+and their blocking database calls don't hold up the event loop.
+"""
 
-from fastapi import APIRouter, status, Depends
+from fastapi import APIRouter, Depends, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session
 
 from apps.api_server.controllers import products
-from apps.api_server.dependencies import database
+from apps.api_server.dependencies import cache, constants, database
 from apps.api_server.schemas import products as sp
 
 prefix = "/api/v1/products"
 route_of_listing = "/?page={0}&products_per_page={1}"
+route_of_cursor_listing = "/?after_sku={0}&products_per_page={1}"
+route_of_changes = "/changes?since={0}&limit={1}"
 
 router = APIRouter(
     prefix=prefix,
@@ -17,34 +24,97 @@ router = APIRouter(
 
 
 @router.get(path=route_of_listing.split("?")[0], status_code=status.HTTP_200_OK)
-async def retrieve_listing(
-    page: int = 1,
-    products_per_page: int = 50,
-    session: Session = Depends(database.get_session),
+def retrieve_listing(
+    request: Request,
+    response: Response,
+    page: int = Query(1, ge=1),
+    products_per_page: int = Query(50, ge=1, le=constants.MAX_PRODUCTS_PER_PAGE),
+    after_sku: int | None = None,
+    session: Session = Depends(database.get_read_only_session),
 ) -> sp.WrappedProductListing:
-    """Handle GET listing request."""
-    retrieved_products, metadata = products.retrieve_listing(
-        session, page, products_per_page, prefix + route_of_listing
+    """
+    Handle GET listing request.
+    If `after_sku` is given, the listing is paginated with a cursor and `page` is ignored;
+    the `next` link then carries the cursor for the following page.
+    A request whose If-None-Match header matches the page's ETag gets a 304 without a body.
+    """
+    product_listing, etag = products.retrieve_listing_page(
+        session,
+        page,
+        products_per_page,
+        after_sku,
+        prefix + route_of_listing,
+        prefix + route_of_cursor_listing,
     )
-    product_listing = []
-    for product in retrieved_products:
-        product_info = sp.ProductShortInfo(
-            sku=product.sku, full_name=product.brand + " " + product.description
+    if cache.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
         )
-        product_listing.append(product_info)
-    return sp.WrappedProductListing(
-        data=product_listing,
-        count=metadata["count"],
-        previous=metadata["previous"],
-        next=metadata["next"],
+    response.headers["ETag"] = etag
+    return product_listing
+
+
+@router.get("/export", status_code=status.HTTP_200_OK)
+def export_catalog(
+    session: Session = Depends(database.get_read_only_session),
+) -> StreamingResponse:
+    """Handle GET export request; streams the whole catalog as NDJSON."""
+    return StreamingResponse(
+        products.export_catalog(session), media_type="application/x-ndjson"
     )
 
 
+@router.get(path=route_of_changes.split("?")[0], status_code=status.HTTP_200_OK)
+def retrieve_changes(
+    since: int | None = None,
+    limit: int = Query(constants.MAX_PRODUCTS_PER_BATCH, ge=1),
+    session: Session = Depends(database.get_read_only_session),
+) -> sp.WrappedProductChanges:
+    """
+    Handle GET changes request.
+    Without `since`, only the current catalog version is returned; a client should
+    ask for it before loading the catalog, then ask for the changes since then.
+    """
+    changed_products, metadata = products.retrieve_changes(
+        session, since, limit, prefix + route_of_changes
+    )
+    product_changes = []
+    for sku, product in changed_products.items():
+        full_name = product.brand + " " + product.description if product else None
+        product_changes.append(sp.ProductChange(sku=sku, full_name=full_name))
+    return sp.WrappedProductChanges(
+        data=product_changes, version=metadata["version"], next=metadata["next"]
+    )
+
+
+@router.post("/batch", status_code=status.HTTP_200_OK)
+def get_products(
+    batch_request: sp.ProductBatchRequest,
+    session: Session = Depends(database.get_read_only_session),
+) -> sp.WrappedProductDetailsList:
+    """Handle POST batch request; products that don't exist are left out."""
+    retrieved_products = products.retrieve_products(session, batch_request.skus)
+    product_details = [
+        sp.ProductDetails.model_validate(product) for product in retrieved_products
+    ]
+    return sp.WrappedProductDetailsList(data=product_details)
+
+
 @router.get("/{product_id}", status_code=status.HTTP_200_OK)
-async def get_product(
-    product_id: int, session: Session = Depends(database.get_session)
+def get_product(
+    product_id: int,
+    request: Request,
+    response: Response,
+    session: Session = Depends(database.get_read_only_session),
 ) -> sp.WrappedProductDetails:
-    """Handle GET product request."""
-    retrieved_product = products.retrieve_product(session, product_id)
-    product_details = sp.ProductDetails.model_validate(retrieved_product)
-    return sp.WrappedProductDetails(data=product_details)
+    """
+    Handle GET product request.
+    A request whose If-None-Match header matches the product's ETag gets a 304 without a body.
+    """
+    product_details, etag = products.retrieve_product_details(session, product_id)
+    if cache.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
+    response.headers["ETag"] = etag
+    return product_details
@@ -5,6 +5,8 @@ SQLModel is a SQLAlchemy, and also a Pydantic model.
 
 from sqlmodel import Field, SQLModel
 
+from apps.api_server.dependencies import constants
+
 
 class ProductBase(SQLModel):
     """Base class for Product* classes."""
@@ -27,6 +29,18 @@ class WrappedProductDetails(SQLModel):
     data: ProductDetails
 
 
+class WrappedProductDetailsList(SQLModel):
+    """Schema to use to display the details of several products."""
+
+    data: list[ProductDetails]
+
+
+class ProductBatchRequest(SQLModel):
+    """Schema of the request for the details of several products."""
+
+    skus: list[int] = Field(max_length=constants.MAX_PRODUCTS_PER_BATCH)
+
+
 class ProductShortInfo(SQLModel):
     """Schema to use to display a product's short info."""
 
@@ -41,3 +55,25 @@ class WrappedProductListing(SQLModel):
     count: int
     previous: str | None
     next: str | None
+
+
+class CatalogChange(SQLModel):
+    """Base class for the `catalog_changes` table; one row per change to a product."""
+
+    version: int = Field(primary_key=True)
+    sku: int = Field()
+
+
+class ProductChange(SQLModel):
+    """Schema to use to display a changed product; deleted products have no full name."""
+
+    sku: int
+    full_name: str | None
+
+
+class WrappedProductChanges(SQLModel):
+    """Schema to use to display the changes to the catalog since a version."""
+
+    data: list[ProductChange]
+    version: int
+    next: str | None
@@ -1,14 +1,39 @@
 """This module is the web application's interface to the agent application."""
 
+import asyncio
+import threading
+
 from apps.agent import orchestrator
 
+# the event loop that the agent's requests run on, shared by every request thread
+# so that the agent's connection pools are reused across grocery lists
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Return the agent's event loop, starting it in a background thread on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever, name="AgentEventLoop", daemon=True
+            ).start()
+    return _loop
+
 
 def send_to_agent(filename: str, content: str, agent: orchestrator.GroceryAgent) -> str:
     """
     Send the contents of the grocery list file to the agent
     and return the agent's response.
+    The grocery list is processed on the agent's event loop, so that the request
+    threads only wait for their own list while the agent's I/O overlaps.
     """
-    response = agent.process(filename, format_content(content))
+    future = asyncio.run_coroutine_threadsafe(
+        agent.aprocess(filename, format_content(content)), get_event_loop()
+    )
+    response = future.result()
     return transform_response(response)
 
 
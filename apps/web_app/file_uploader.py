@@ -15,7 +15,7 @@ def home(error: str | None = None, status_code: int = 200) -> tuple[str, int]:
     """Display the application's home page."""
     global grocery_agent
     if not grocery_agent:
-        grocery_agent = orchestrator.init_agent()
+        grocery_agent = orchestrator.init_agent(catalog_source="stream")
 
     return render_template("upload.html", error=error), status_code
 
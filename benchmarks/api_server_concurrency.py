@@ -0,0 +1,142 @@
+"""
+Measure how slow database queries hold up unrelated requests to the API server,
+when the product details route is an `async def` that calls the database directly,
+and when it's a plain function that FastAPI runs in its threadpool.
+
+Run from the repository root:
+    python -m benchmarks.api_server_concurrency --slow-query 0.2 --duration 10
+"""
+
+import argparse
+import random
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import httpx
+import uvicorn
+from fastapi import Depends, FastAPI
+from sqlalchemy import event, text
+from sqlmodel import Session
+
+from apps.api_server import grocery
+from apps.api_server.controllers import products
+from apps.api_server.dependencies import (
+    cache,
+    constants,
+    database,
+    query_timer,
+    scripts,
+)
+from apps.api_server.schemas import products as sp
+from benchmarks.api_server_throughput import free_port
+
+# the product whose lookups are slow
+SLOW_SKU = 50017
+
+blocking_app = FastAPI()
+
+
+@blocking_app.get("/api/v1/products/{product_id}")
+async def get_product(
+    product_id: int, session: Session = Depends(database.get_read_only_session)
+) -> sp.WrappedProductDetails:
+    """The product details route as it was, running its queries on the event loop."""
+    return products.retrieve_product_details(session, product_id)[0]
+
+
+def load(url: str, skus: list[int], duration: float) -> list[float]:
+    """Request random products until `duration` seconds pass; return the latencies."""
+    latencies = []
+    deadline = time.perf_counter() + duration
+    with httpx.Client(base_url=url, timeout=60) as client:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = client.get(f"/api/v1/products/{random.choice(skus)}")
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def run(
+    app: FastAPI, skus: list[int], fast_clients: int, slow_clients: int, duration: float
+) -> list[float]:
+    """Serve the app and load it; return the latencies of the fast requests."""
+    port = free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    server_thread = threading.Thread(target=server.run, daemon=True)
+    server_thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    url = f"http://127.0.0.1:{port}"
+    try:
+        with ThreadPoolExecutor(fast_clients + slow_clients) as executor:
+            for _ in range(slow_clients):
+                executor.submit(load, url, [SLOW_SKU], duration)
+            futures = [
+                executor.submit(load, url, skus, duration) for _ in range(fast_clients)
+            ]
+            return [latency for future in futures for latency in future.result()]
+    finally:
+        server.should_exit = True
+        server_thread.join()
+
+
+def main() -> None:
+    """Print the throughput and latencies of the fast requests for each route."""
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--fast-clients", type=int, default=8)
+    arg_parser.add_argument("--slow-clients", type=int, default=2)
+    arg_parser.add_argument("--slow-query", type=float, default=0.2)
+    arg_parser.add_argument("--duration", type=float, default=10.0)
+    args = arg_parser.parse_args()
+
+    # every request must reach the database, and the slow queries aren't worth logging
+    cache.products.max_size = 0
+    query_timer.timer.slow_query_threshold = None
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_uri = constants.SQLITE_URI.format(f"{tmp_dir}/inventory.sqlite3")
+        database.engine = database.get_engine(database_uri)
+        scripts.create(database.engine)
+        scripts.seed(database.engine, None)
+        with database.engine.connect() as conn:
+            skus = list(conn.execute(text("SELECT sku FROM products")).scalars())
+        skus.remove(SLOW_SKU)
+
+        database.read_only_engine = database.get_engine(database_uri, read_only=True)
+
+        @event.listens_for(database.read_only_engine, "before_cursor_execute")
+        def slow_down(
+            conn: Any, cursor: Any, statement: str, parameters: Any, *_: Any
+        ) -> None:
+            """Make the queries for the slow product take `--slow-query` seconds."""
+            if SLOW_SKU in (parameters or ()):
+                time.sleep(args.slow_query)
+
+        print(
+            f"{args.fast_clients} clients requesting random products, "
+            f"{args.slow_clients} requesting one whose query takes {args.slow_query}s"
+        )
+        for name, app in [
+            ("async def route (blocking)", blocking_app),
+            ("def route (threadpool)", grocery.app),
+        ]:
+            latencies = run(
+                app, skus, args.fast_clients, args.slow_clients, args.duration
+            )
+            quantiles = statistics.quantiles(latencies, n=100)
+            print(
+                f"{name:<28} {len(latencies) / args.duration:>8.0f} req/s"
+                f"   p50 {quantiles[49] * 1000:>7.1f} ms   p99 {quantiles[98] * 1000:>7.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Compare the throughput of the API server's product details route under concurrent load,
+with the default SQLite settings and a single pool, and with the tuned pragmas and
+a separate read-only pool, while another thread keeps updating the stock.
+
+Run from the repository root:
+    python -m benchmarks.api_server_throughput --clients 16 --duration 10
+"""
+
+import argparse
+import random
+import socket
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import uvicorn
+from sqlalchemy import Engine, text
+from sqlmodel import create_engine
+
+from apps.api_server import grocery
+from apps.api_server.dependencies import cache, constants, database, scripts
+
+
+def free_port() -> int:
+    """Return a TCP port that is free on the loopback interface."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def write_stock(
+    engine: Engine, skus: list[int], interval: float, stop: threading.Event
+) -> None:
+    """Update the stock of a random product every `interval` seconds, until stopped."""
+    while not stop.wait(interval):
+        with engine.begin() as conn:
+            conn.execute(
+                text("UPDATE products SET qty_in_stock = :qty WHERE sku = :sku"),
+                {"qty": random.randint(0, 100), "sku": random.choice(skus)},
+            )
+
+
+def load(url: str, skus: list[int], duration: float) -> list[float]:
+    """Request random products until `duration` seconds pass; return the latencies."""
+    latencies = []
+    deadline = time.perf_counter() + duration
+    with httpx.Client(base_url=url) as client:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = client.get(f"/api/v1/products/{random.choice(skus)}")
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def run(
+    engine: Engine,
+    read_only_engine: Engine,
+    skus: list[int],
+    clients: int,
+    duration: float,
+    write_interval: float,
+) -> list[float]:
+    """Serve the API with the given engines, load it, and return the request latencies."""
+    database.engine = engine
+    database.read_only_engine = read_only_engine
+    port = free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(grocery.app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    server_thread = threading.Thread(target=server.run, daemon=True)
+    server_thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    stop = threading.Event()
+    writer = threading.Thread(
+        target=write_stock, args=(engine, skus, write_interval, stop), daemon=True
+    )
+    if write_interval:
+        writer.start()
+    try:
+        with ThreadPoolExecutor(clients) as executor:
+            futures = [
+                executor.submit(load, f"http://127.0.0.1:{port}", skus, duration)
+                for _ in range(clients)
+            ]
+            return [latency for future in futures for latency in future.result()]
+    finally:
+        stop.set()
+        server.should_exit = True
+        server_thread.join()
+        if writer.is_alive():
+            writer.join()
+
+
+def main() -> None:
+    """Print the throughput and latencies of each database setup."""
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--clients", type=int, default=16)
+    arg_parser.add_argument("--duration", type=float, default=10.0)
+    arg_parser.add_argument(
+        "--write-interval",
+        type=float,
+        default=0.01,
+        help="seconds between stock updates; 0 disables them",
+    )
+    args = arg_parser.parse_args()
+
+    # every request must reach the database
+    cache.products.max_size = 0
+    cache.listings.max_size = 0
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_uri = constants.SQLITE_URI.format(f"{tmp_dir}/inventory.sqlite3")
+        # the settings before tuning: a single pool with SQLite's defaults;
+        # the database is seeded without the pragmas, since WAL mode persists in the file
+        default_engine = create_engine(
+            database_uri, connect_args=constants.SQLITE_CONNECT_ARGS
+        )
+        scripts.create(default_engine)
+        scripts.seed(default_engine, None)
+        with default_engine.connect() as conn:
+            skus = list(conn.execute(text("SELECT sku FROM products")).scalars())
+
+        setups = [
+            ("Default settings, single pool", default_engine, default_engine),
+            (
+                "Tuned pragmas, read-only pool",
+                database.get_engine(database_uri),
+                database.get_engine(database_uri, read_only=True),
+            ),
+        ]
+
+        print(
+            f"{args.clients} clients for {args.duration:.0f}s, {len(skus)} products, "
+            f"stock updated every {args.write_interval}s"
+        )
+        for name, engine, read_only_engine in setups:
+            latencies = run(
+                engine,
+                read_only_engine,
+                skus,
+                args.clients,
+                args.duration,
+                args.write_interval,
+            )
+            quantiles = statistics.quantiles(latencies, n=100)
+            print(
+                f"{name:<32} {len(latencies) / args.duration:>8.0f} req/s"
+                f"   p50 {quantiles[49] * 1000:>6.1f} ms   p99 {quantiles[98] * 1000:>6.1f} ms"
+            )
+            engine.dispose()
+            read_only_engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Compare the memory held by the agent's store catalog as a list of pydantic models
+with the memory held by the compact catalog index, for synthetic products.
+
+Run from the repository root:
+    python -m benchmarks.catalog_memory --products 1000000
+"""
+
+import argparse
+import gc
+import random
+import tracemalloc
+from collections.abc import Callable
+from typing import Any
+
+from apps.agent.models import models
+from apps.agent.services import catalog_index as ci
+
+
+BRANDS = ["Zephyr", "Phoenix", "Aurora", "Nimbus", "Orchid", "Summit", "Willow"]
+PRODUCTS = ["milk", "bread", "eggs", "butter", "apples", "rice", "coffee", "tea"]
+SIZES = ["250g", "500g", "1kg", "1L", "2L", "6 pack", "12 pack"]
+
+
+def synthetic_products(count: int, seed: int = 0) -> list[dict[str, str | int]]:
+    """Return `count` products shaped like the API server's catalog listing."""
+    rng = random.Random(seed)
+    return [
+        {
+            "sku": sku,
+            "full_name": f"{rng.choice(BRANDS)} {rng.choice(PRODUCTS)} - "
+            f"{rng.choice(SIZES)} #{sku}",
+        }
+        for sku in range(1, count + 1)
+    ]
+
+
+def measure(build: Callable[[], Any]) -> tuple[Any, int]:
+    """Return the object built and the bytes still allocated for it once built."""
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, size
+
+
+def main() -> None:
+    """Print the bytes per product of each catalog representation."""
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--products", type=int, default=1_000_000)
+    args = arg_parser.parse_args()
+
+    products = synthetic_products(args.products)
+    catalog, catalog_size = measure(
+        lambda: models.ProductCatalog.model_validate({"catalog": products})
+    )
+    del catalog
+    index, index_size = measure(lambda: ci.CatalogIndex.from_products(products))
+    # the choices and the postings are only needed for fuzzy matching
+    store_size = (
+        index.skus.buffer_info()[1] * index.skus.itemsize
+        + len(index.names)
+        + index.name_offsets.buffer_info()[1] * index.name_offsets.itemsize
+        + index.rows_by_sku.buffer_info()[1] * index.rows_by_sku.itemsize
+    )
+
+    print(f"{args.products} products")
+    for name, size in [
+        ("ProductCatalog (pydantic models)", catalog_size),
+        ("CatalogIndex (with fuzzy matching data)", index_size),
+        ("CatalogIndex (SKUs, names and SKU lookup only)", store_size),
+    ]:
+        print(
+            f"{name:<48} {size / 2**20:>10.1f} MiB {size / args.products:>8.1f} B/product"
+        )
+
+
+if __name__ == "__main__":
+    main()
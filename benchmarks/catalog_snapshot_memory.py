@@ -0,0 +1,96 @@
+"""
+Measure the private memory and the startup time of worker processes that build
+the agent's catalog index, and of worker processes that load it from a snapshot.
+
+Private memory is the anonymous memory a worker allocated for its index, read from
+/proc/self/smaps_rollup, so this only runs on Linux; the snapshot's pages are
+file-backed, so they're shared by the workers through the page cache.
+
+Run from the repository root:
+    python -m benchmarks.catalog_snapshot_memory --products 200000 --workers 4
+"""
+
+import argparse
+import multiprocessing
+import pathlib
+import tempfile
+import time
+
+from apps.agent.services import catalog_index as ci
+from benchmarks.catalog_memory import synthetic_products
+
+# queries run by every worker once its index is ready, so that its pages are touched
+QUERIES = ["milk", "brown bread", "coffee 1kg", "zephyr tea"]
+
+
+def anonymous_memory() -> int:
+    """Return the bytes of anonymous memory mapped by this process."""
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            if line.startswith("Anonymous:"):
+                return int(line.split()[1]) * 1024
+    raise RuntimeError("/proc/self/smaps_rollup has no Anonymous field")
+
+
+def worker(
+    mode: str,
+    products: int,
+    snapshot: pathlib.Path,
+    results: multiprocessing.Queue,
+) -> None:
+    """Build or load the index, then report the time it took and the memory it holds."""
+    catalog = synthetic_products(products) if mode == "build" else None
+    before = anonymous_memory()
+    start = time.perf_counter()
+    if mode == "build":
+        index = ci.CatalogIndex.from_products(catalog)
+    else:
+        index = ci.CatalogIndex.load(snapshot)
+    elapsed = time.perf_counter() - start
+    for query in QUERIES:
+        for row in index.candidate_rows(query)[:100]:
+            index.full_name(row)
+    # the product dicts are only needed to build the index
+    del catalog
+    results.put((elapsed, anonymous_memory() - before))
+
+
+def main() -> None:
+    """Print the mean startup time and private memory of the workers of each mode."""
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--products", type=int, default=200_000)
+    arg_parser.add_argument("--workers", type=int, default=4)
+    args = arg_parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        snapshot = pathlib.Path(tmp_dir) / "catalog.snapshot"
+        ci.CatalogIndex.from_products(synthetic_products(args.products)).save(snapshot)
+
+        print(
+            f"{args.products} products, {args.workers} workers, "
+            f"snapshot of {snapshot.stat().st_size / 2**20:.1f} MiB"
+        )
+        for mode in ("build", "load"):
+            results = ctx.Queue()
+            workers = [
+                ctx.Process(
+                    target=worker, args=(mode, args.products, snapshot, results)
+                )
+                for _ in range(args.workers)
+            ]
+            for process in workers:
+                process.start()
+            measures = [results.get() for _ in workers]
+            for process in workers:
+                process.join()
+
+            elapsed = sum(seconds for seconds, _ in measures) / len(measures)
+            private = sum(size for _, size in measures) / len(measures)
+            print(
+                f"{mode:<6} {elapsed:>8.2f} s {private / 2**20:>10.1f} MiB private per worker"
+            )
+
+
+if __name__ == "__main__":
+    main()
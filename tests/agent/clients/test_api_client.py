@@ -1,5 +1,7 @@
 """Unit tests for api_client.py"""
 
+import threading
+
 import pytest
 import requests
 import tenacity
@@ -120,6 +122,44 @@ def test_get_product_details_on_non_existing_product_stops_immediately(
     assert mocked_get.call_count == 2
 
 
+def test_get_products_details_returns_200(mocker, mocked_post):
+    """Test that the client returns the details of several products in one request."""
+    client = api_client.APIClient(logger=mocker.Mock())
+    mocked_response = mocker.Mock()
+    mocked_response.status_code = 200
+    mocked_json_response = {
+        "data": [
+            {
+                "brand": "Phoenix",
+                "description": "canned chickpeas - 450g",
+                "qty_in_stock": 34,
+                "sku": 50017,
+                "unit_price": 7.69,
+            }
+        ]
+    }
+    mocked_response.json.return_value = mocked_json_response
+    mocked_post.return_value = mocked_response
+    response = client.get_products_details([50017, 999])
+    assert response == mocked_json_response
+    assert mocked_post.call_count == 1
+    assert mocked_post.call_args.kwargs["json"] == {"skus": [50017, 999]}
+
+
+def test_get_products_details_raises_504(mocker, mocked_post):
+    """Test that the client retries, then raises on a non-200 response."""
+    client = api_client.APIClient(logger=mocker.Mock())
+    mocked_response = mocker.Mock()
+    mocked_response.status_code = 504
+    mocked_response.raise_for_status.side_effect = requests.exceptions.HTTPError(
+        response=mocked_response
+    )
+    mocked_post.return_value = mocked_response
+    with pytest.raises(tenacity.RetryError):
+        client.get_products_details([50017])
+    assert mocked_post.call_count == constants.GROCERY_API_SERVER_RETRIES
+
+
 def test_get_product_listing_returns_200(mocker, mocked_get):
     """Test that the client returns the product listing."""
     client = api_client.APIClient(logger=mocker.Mock())
@@ -133,6 +173,22 @@ def test_get_product_listing_returns_200(mocker, mocked_get):
     assert mocked_get.call_count == 1
 
 
+def test_get_product_listing_with_cursor(mocker, mocked_get):
+    """Test that the client sends the cursor instead of the page number when given."""
+    client = api_client.APIClient(logger=mocker.Mock())
+    mocked_response = mocker.Mock()
+    mocked_response.status_code = 200
+    mocked_response.json.return_value = {"data": []}
+    mocked_get.return_value = mocked_response
+    client.get_product_listing(1, 5)
+    assert mocked_get.call_args.kwargs["params"] == {"page": 1, "products_per_page": 5}
+    client.get_product_listing(1, 5, after_sku=50017)
+    assert mocked_get.call_args.kwargs["params"] == {
+        "after_sku": 50017,
+        "products_per_page": 5,
+    }
+
+
 def test_get_product_listing_raises_504(mocker, mocked_get):
     """Test that the client raises APIServerException for a non-200 response."""
     client = api_client.APIClient(logger=mocker.Mock())
@@ -178,3 +234,98 @@ def test_get_product_listing_succeeds_after_two_failures(mocker, mocked_get):
     response = client.get_product_listing(1, 5)
     assert response == mocked_json_response
     assert mocked_get.call_count == 3
+
+
+def test_stream_product_catalog(mocker, mocked_get):
+    """Test that the client yields one product per NDJSON line."""
+    client = api_client.APIClient(logger=mocker.Mock())
+    mocked_response = mocker.Mock()
+    mocked_response.iter_lines.return_value = [
+        b'{"sku": 50000, "full_name": "Twilight sour cream - 250g"}',
+        b"",
+        b'{"sku": 50017, "full_name": "Phoenix canned chickpeas - 450g"}',
+    ]
+    mocked_get.return_value = mocked_response
+    products = list(client.stream_product_catalog())
+    assert products == [
+        {"sku": 50000, "full_name": "Twilight sour cream - 250g"},
+        {"sku": 50017, "full_name": "Phoenix canned chickpeas - 450g"},
+    ]
+    assert mocked_get.call_args.kwargs["stream"] is True
+    assert mocked_response.close.call_count == 1
+
+
+def test_stream_product_catalog_raises_504(mocker, mocked_get):
+    """Test that the client raises APIServerException without retrying."""
+    client = api_client.APIClient(logger=mocker.Mock())
+    mocked_response = mocker.Mock()
+    mocked_response.status_code = 504
+    mocked_response.raise_for_status.side_effect = requests.exceptions.HTTPError(
+        response=mocked_response
+    )
+    mocked_get.return_value = mocked_response
+    with pytest.raises(exc.APIServerException):
+        list(client.stream_product_catalog())
+    assert mocked_get.call_count == 1
+
+
+def test_session_is_shared_within_a_thread(mocker):
+    """Test that a thread reuses its session, and that all sessions share one pool."""
+    client = api_client.APIClient(logger=mocker.Mock(), pool_size=4)
+    assert client.session is client.session
+
+    other_sessions = []
+    thread = threading.Thread(target=lambda: other_sessions.append(client.session))
+    thread.start()
+    thread.join()
+
+    assert other_sessions[0] is not client.session
+    assert other_sessions[0].get_adapter("http://localhost") is client.adapter
+    assert client.session.get_adapter("http://localhost") is client.adapter
+
+
+def test_requests_use_timeouts(mocker, mocked_get):
+    """Test that every request is sent with the configured connect/read timeouts."""
+    client = api_client.APIClient(
+        logger=mocker.Mock(), connect_timeout=1, read_timeout=2
+    )
+    mocked_get.return_value.status_code = 200
+    client.get_product_details(50017)
+    assert mocked_get.call_args.kwargs["timeout"] == (1, 2)
+
+
+def test_pool_stats(mocker):
+    """Test that pool_stats() reports new and reused connections."""
+    client = api_client.APIClient(logger=mocker.Mock())
+    assert client.pool_stats() == {
+        "requests": 0,
+        "new_connections": 0,
+        "reused_connections": 0,
+    }
+
+    pool = client.adapter.poolmanager.connection_from_url(
+        constants.GROCERY_API_SERVER_BASE_URL
+    )
+    pool.num_requests = 10
+    pool.num_connections = 2
+    assert client.pool_stats() == {
+        "requests": 10,
+        "new_connections": 2,
+        "reused_connections": 8,
+    }
+
+
+def test_get_catalog_changes(mocker, mocked_get):
+    """Test that the client only sends the version to get the changes since when given."""
+    client = api_client.APIClient(logger=mocker.Mock())
+    mocked_response = mocker.Mock()
+    mocked_response.status_code = 200
+    mocked_json_response = {"data": [], "version": 7, "next": None}
+    mocked_response.json.return_value = mocked_json_response
+    mocked_get.return_value = mocked_response
+    assert client.get_catalog_changes(None) == mocked_json_response
+    assert mocked_get.call_args.kwargs["params"] == {
+        "limit": constants.CATALOG_CHANGES_PER_PAGE
+    }
+    client.get_catalog_changes(5, 10)
+    assert mocked_get.call_args.kwargs["params"] == {"since": 5, "limit": 10}
@@ -0,0 +1,104 @@
+"""Unit tests for async_api_client.py"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from apps.agent.clients import async_api_client
+from apps.agent.dependencies import exceptions as exc
+
+
+def make_response(
+    status_code: int, json_response: dict | None = None
+) -> httpx.Response:
+    """A helper function to build an httpx response."""
+    request = httpx.Request("GET", "http://localhost:8000")
+    return httpx.Response(status_code, json=json_response, request=request)
+
+
+def test_get_product_details_on_existing_product(mocker, mocked_httpx_client):
+    """Test that the client returns the details of an existing product."""
+    client = async_api_client.AsyncAPIClient(logger=mocker.Mock())
+    mocked_json_response = {
+        "data": {
+            "brand": "Phoenix",
+            "description": "canned chickpeas - 450g",
+            "qty_in_stock": 34,
+            "sku": 50017,
+            "unit_price": 7.69,
+        }
+    }
+    mocked_function = mocker.AsyncMock(
+        return_value=make_response(200, mocked_json_response)
+    )
+    mocked_httpx_client.return_value.get = mocked_function
+
+    response = asyncio.run(client.get_product_details(50017))
+    assert response == mocked_json_response
+    assert mocked_function.call_count == 1
+
+
+def test_get_product_details_on_non_existing_product(mocker, mocked_httpx_client):
+    """Test that the client raises ProductNotFoundException without retrying."""
+    client = async_api_client.AsyncAPIClient(logger=mocker.Mock())
+    mocked_function = mocker.AsyncMock(return_value=make_response(404))
+    mocked_httpx_client.return_value.get = mocked_function
+
+    with pytest.raises(exc.ProductNotFoundException):
+        asyncio.run(client.get_product_details(999))
+    assert mocked_function.call_count == 1
+
+
+def test_get_products_details_succeeds_after_one_failure(mocker, mocked_httpx_client):
+    """Test that the client returns the details of several products after a retry."""
+    client = async_api_client.AsyncAPIClient(logger=mocker.Mock())
+    mocked_json_response = {"data": [{"sku": 50017}]}
+    mocked_function = mocker.AsyncMock(
+        side_effect=(make_response(503), make_response(200, mocked_json_response))
+    )
+    mocked_httpx_client.return_value.post = mocked_function
+
+    response = asyncio.run(client.get_products_details([50017, 999]))
+    assert response == mocked_json_response
+    assert mocked_function.call_count == 2
+    assert mocked_function.call_args.kwargs["json"] == {"skus": [50017, 999]}
+
+
+def test_client_is_created_per_event_loop(mocker, mocked_httpx_client):
+    """Test that the pooled client is reused within a loop and recreated across loops."""
+    client = async_api_client.AsyncAPIClient(logger=mocker.Mock())
+
+    async def get_clients():
+        return client.client, client.client
+
+    first, second = asyncio.run(get_clients())
+    assert first is second
+    assert mocked_httpx_client.call_count == 1
+
+    asyncio.run(get_clients())
+    assert mocked_httpx_client.call_count == 2
+
+
+def test_client_is_closed_per_event_loop(mocker, mocked_httpx_client):
+    """Test that aclose() only closes the pooled client of the running loop."""
+    mocked_httpx_client.side_effect = lambda **kwargs: mocker.AsyncMock()
+    client = async_api_client.AsyncAPIClient(logger=mocker.Mock())
+    loop = asyncio.new_event_loop()
+
+    async def get_client():
+        return client.client
+
+    other = loop.run_until_complete(get_client())
+
+    async def get_and_close():
+        pooled = client.client
+        await client.aclose()
+        return pooled, client.client
+
+    closed, reopened = asyncio.run(get_and_close())
+    closed.aclose.assert_awaited_once()
+    assert reopened is not closed
+    other.aclose.assert_not_awaited()
+    assert loop.run_until_complete(get_client()) is other
+    loop.close()
@@ -0,0 +1,68 @@
+"""Unit tests for async_openai_client.py"""
+
+import asyncio
+
+import openai
+import pytest
+
+from apps.agent.clients import async_openai_client
+from apps.agent.models import models
+
+
+def test_request_structured_response_success(mocker, mocked_async_openai):
+    """Test that the client returns the LLM response."""
+    client = async_openai_client.AsyncOpenAIClient(
+        "test_key", "test_model", mocker.Mock()
+    )
+    mocked_structured_response = models.ProductLineItem(
+        full_name="Some product", sku=12345
+    )
+    mocked_function = mocker.AsyncMock(
+        return_value=mocker.Mock(output_parsed=mocked_structured_response)
+    )
+    mocked_async_openai.return_value.responses.parse = mocked_function
+
+    response = asyncio.run(
+        client.request_structured_response(
+            "Test prompt", response_model=models.ProductLineItem
+        )
+    )
+    assert response == mocked_structured_response
+    assert mocked_function.call_count == 1
+
+
+def test_request_string_response_success_on_2nd_try(mocker, mocked_async_openai):
+    """Test that the client retries on a retryable error."""
+    client = async_openai_client.AsyncOpenAIClient(
+        "test_key", "test_model", mocker.Mock()
+    )
+    mocked_function = mocker.AsyncMock(
+        side_effect=(
+            openai.RateLimitError(
+                message="For testing purposes", body=None, response=mocker.Mock()
+            ),
+            mocker.Mock(output_text="Hello, this is only a test."),
+        )
+    )
+    mocked_async_openai.return_value.responses.create = mocked_function
+
+    response = asyncio.run(client.request_string_response("Test prompt"))
+    assert response == "Hello, this is only a test."
+    assert mocked_function.call_count == 2
+
+
+def test_request_json_response_raises_401(mocker, mocked_async_openai):
+    """Test that the client doesn't retry on an authentication error."""
+    client = async_openai_client.AsyncOpenAIClient(
+        "test_key", "test_model", mocker.Mock()
+    )
+    mocked_function = mocker.AsyncMock(
+        side_effect=openai.AuthenticationError(
+            message="For testing purposes", body=None, response=mocker.Mock()
+        )
+    )
+    mocked_async_openai.return_value.responses.create = mocked_function
+
+    with pytest.raises(openai.AuthenticationError):
+        asyncio.run(client.request_json_response("Test prompt"))
+    assert mocked_function.call_count == 1
@@ -8,7 +8,12 @@ import pytest_mock
 
 @pytest.fixture
 def mocked_get(mocker: pytest_mock.plugin.MockerFixture) -> unittest.mock.MagicMock:
-    return mocker.patch("apps.agent.clients.api_client.requests.get")
+    return mocker.patch("apps.agent.clients.api_client.requests.Session.get")
+
+
+@pytest.fixture
+def mocked_post(mocker: pytest_mock.plugin.MockerFixture) -> unittest.mock.MagicMock:
+    return mocker.patch("apps.agent.clients.api_client.requests.Session.post")
 
 
 @pytest.fixture
@@ -18,6 +23,20 @@ def mocked_api_client(
     return mocker.patch("apps.agent.services.inventory.api_client.APIClient")
 
 
+@pytest.fixture
+def mocked_httpx_client(
+    mocker: pytest_mock.plugin.MockerFixture,
+) -> unittest.mock.MagicMock:
+    return mocker.patch("apps.agent.clients.async_api_client.httpx.AsyncClient")
+
+
+@pytest.fixture
+def mocked_async_api_client(
+    mocker: pytest_mock.plugin.MockerFixture,
+) -> unittest.mock.MagicMock:
+    return mocker.patch("apps.agent.services.inventory.async_api_client.AsyncAPIClient")
+
+
 @pytest.fixture
 def mocked_openai(mocker: pytest_mock.plugin.MockerFixture) -> unittest.mock.MagicMock:
     return mocker.patch("apps.agent.clients.openai_client.openai.OpenAI")
@@ -30,6 +49,22 @@ def mocked_openai_client(
     return mocker.patch("apps.agent.services.base_llm.openai_client.OpenAIClient")
 
 
+@pytest.fixture
+def mocked_async_openai(
+    mocker: pytest_mock.plugin.MockerFixture,
+) -> unittest.mock.MagicMock:
+    return mocker.patch("apps.agent.clients.async_openai_client.openai.AsyncOpenAI")
+
+
+@pytest.fixture
+def mocked_async_openai_client(
+    mocker: pytest_mock.plugin.MockerFixture,
+) -> unittest.mock.MagicMock:
+    return mocker.patch(
+        "apps.agent.services.base_llm.async_openai_client.AsyncOpenAIClient"
+    )
+
+
 @pytest.fixture
 def mocked_parser_service(
     mocker: pytest_mock.plugin.MockerFixture,
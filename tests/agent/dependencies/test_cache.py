@@ -0,0 +1,99 @@
+"""Unit tests for cache.py"""
+
+from apps.agent.dependencies import cache as ch
+
+
+def test_get_and_set():
+    """Test that a cached value is returned, and that a missing key returns None."""
+    cache = ch.LRUCache(max_size=2)
+    cache.set("milk", {"product": "milk"})
+
+    assert cache.get("milk") == {"product": "milk"}
+    assert cache.get("sugar") is None
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 1, "evictions": 0}
+
+
+def test_least_recently_used_entry_is_evicted():
+    """Test that the least recently used entry is evicted once the cache is full."""
+    cache = ch.LRUCache(max_size=2)
+    cache.set("milk", 1)
+    cache.set("sugar", 2)
+    cache.get("milk")
+    cache.set("eggs", 3)
+
+    assert len(cache) == 2
+    assert cache.stats()["evictions"] == 1
+    assert cache.get("sugar") is None
+    assert cache.get("milk") == 1
+    assert cache.get("eggs") == 3
+
+
+def test_expired_entry_is_missing(mocker):
+    """Test that an entry is no longer returned once its TTL has passed."""
+    mocked_time = mocker.patch("apps.agent.dependencies.cache.time.time")
+    mocked_time.return_value = 1000
+    cache = ch.LRUCache(max_size=2, ttl=60)
+    cache.set("milk", 1)
+
+    mocked_time.return_value = 1059
+    assert cache.get("milk") == 1
+
+    mocked_time.return_value = 1060
+    assert cache.get("milk") is None
+    assert len(cache) == 0
+
+
+def test_database_backing(tmp_path):
+    """Test that entries written to the database are found by a new cache."""
+    db_file = tmp_path / "cache.db"
+    cache = ch.LRUCache(max_size=1, db_file=db_file, db_max_size=2)
+    cache.set("milk", {"product": "milk"})
+    cache.set("sugar", {"product": "sugar"})
+
+    # evicted from memory, but still pending for the database
+    assert cache.get("milk") == {"product": "milk"}
+    cache.flush()
+
+    cache = ch.LRUCache(max_size=1, db_file=db_file, db_max_size=2)
+    assert cache.get("sugar") == {"product": "sugar"}
+    assert cache.get("milk") == {"product": "milk"}
+
+    cache.delete("sugar")
+    cache.flush()
+    assert ch.LRUCache(max_size=1, db_file=db_file).get("sugar") is None
+
+    cache.clear()
+    assert ch.LRUCache(max_size=1, db_file=db_file).get("milk") is None
+
+
+def test_database_writes_are_batched(tmp_path):
+    """Test that writes are only committed every `flush_every` writes."""
+    db_file = tmp_path / "cache.db"
+    cache = ch.LRUCache(max_size=10, db_file=db_file, flush_every=3)
+    cache.set("milk", 1)
+    cache.set("sugar", 2)
+    assert ch.LRUCache(max_size=10, db_file=db_file).get("milk") is None
+
+    cache.set("eggs", 3)
+    assert ch.LRUCache(max_size=10, db_file=db_file).get("milk") == 1
+
+
+def test_database_is_bounded(mocker, tmp_path):
+    """Test that flushing drops the expired rows, and the oldest rows beyond the cap."""
+    mocked_time = mocker.patch("apps.agent.dependencies.cache.time.time")
+    mocked_time.return_value = 1000
+    db_file = tmp_path / "cache.db"
+    cache = ch.LRUCache(max_size=1, ttl=60, db_file=db_file, db_max_size=3)
+    for i in range(5):
+        cache.set(f"item {i}", i)
+    cache.flush()
+    assert cache._db.execute("SELECT key FROM cache ORDER BY key").fetchall() == [
+        ("item 2",),
+        ("item 3",),
+        ("item 4",),
+    ]
+
+    mocked_time.return_value = 1060
+    cache.set("item 5", 5)
+    cache.flush()
+    assert cache._db.execute("SELECT key FROM cache").fetchall() == [("item 5",)]
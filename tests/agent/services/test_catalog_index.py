@@ -0,0 +1,157 @@
+"""Unit tests for catalog_index.py"""
+
+import pytest
+
+from apps.agent.models import models
+from apps.agent.services import catalog_index as ci
+
+
+def test_from_catalog():
+    """Test that the index holds the pre-processed catalog in parallel arrays."""
+    catalog = models.ProductCatalog(
+        catalog=[
+            models.ProductLineItem(sku=1, full_name="Zephyr milk - 1L"),
+            models.ProductLineItem(sku=2, full_name="Phoenix Canned Chickpeas"),
+        ]
+    )
+
+    index = ci.CatalogIndex.from_catalog(catalog)
+
+    assert len(index) == 2
+    assert list(index.skus) == [1, 2]
+    assert index.full_names == ["Zephyr milk - 1L", "Phoenix Canned Chickpeas"]
+    assert index.choices == ["zephyr milk   1l", "phoenix canned chickpeas"]
+    assert index.product(1) == catalog.catalog[1]
+
+
+def test_empty_index():
+    """Test that an empty index can be built."""
+    index = ci.CatalogIndex([], [])
+    assert len(index) == 0
+    assert index.choices == []
+
+
+def test_candidate_rows():
+    """Test that the rows sharing a token or a trigram with the query are returned in catalog order."""
+    index = ci.CatalogIndex(
+        [1, 2, 3, 4],
+        ["Oat Milk 1L", "Brown Eggs", "Buttermilk", "Salted Butter"],
+    )
+
+    assert index.candidate_rows("milk") == [0, 2]
+    assert index.candidate_rows("eggs") == [1]
+    assert index.candidate_rows("butter") == [2, 3]
+    assert index.candidate_rows("1l") == [0]
+    assert index.candidate_rows("caviar") == []
+    assert index.candidate_rows("") == []
+
+
+def test_from_products():
+    """Test that the index can be built from raw product dicts, and looks up SKUs."""
+    index = ci.CatalogIndex.from_products(
+        [
+            {"sku": 30, "full_name": "Crème fraîche"},
+            {"sku": 10, "full_name": "Oat Milk 1L"},
+            {"sku": 20, "full_name": ""},
+        ]
+    )
+
+    assert index.full_names == ["Crème fraîche", "Oat Milk 1L", ""]
+    assert index.full_name(0) == "Crème fraîche"
+    assert [index.row(sku) for sku in (10, 20, 30, 15, 40)] == [1, 2, 0, None, None]
+    assert index.to_catalog() == models.ProductCatalog(
+        catalog=[
+            models.ProductLineItem(sku=30, full_name="Crème fraîche"),
+            models.ProductLineItem(sku=10, full_name="Oat Milk 1L"),
+            models.ProductLineItem(sku=20, full_name=""),
+        ]
+    )
+
+
+def test_save_and_load_snapshot(tmp_path):
+    """Test that an index loaded from a snapshot file behaves like the one saved."""
+    index = ci.CatalogIndex(
+        [4, 2, 3, 1],
+        ["Oat Milk 1L", "Brown Eggs", "Crème fraîche", "Salted Butter"],
+    )
+    file = tmp_path / "catalog.snapshot"
+
+    index.save(file)
+    loaded = ci.CatalogIndex.load(file)
+
+    assert len(loaded) == 4
+    assert list(loaded.skus) == [4, 2, 3, 1]
+    assert loaded.full_names == index.full_names
+    assert list(loaded.choices) == index.choices
+    assert loaded.choices[-1] == index.choices[-1]
+    assert loaded.postings is None
+    assert loaded.row(3) == 2
+    assert loaded.product(2) == index.product(2)
+    for query in ["milk", "eggs", "creme", "crème", "butter", "caviar", "zz", ""]:
+        assert loaded.candidate_rows(query) == index.candidate_rows(query)
+
+    # a loaded index can be saved again, e.g. by a worker refreshing it
+    loaded.save(tmp_path / "copy.snapshot")
+    copy = ci.CatalogIndex.load(tmp_path / "copy.snapshot")
+    assert list(copy.choices) == index.choices
+    assert copy.candidate_rows("milk") == index.candidate_rows("milk")
+    (tmp_path / "copy.snapshot").unlink()
+    assert list(tmp_path.iterdir()) == [file]
+
+
+def test_load_snapshot_rejects_other_files(tmp_path):
+    """Test that loading a file that isn't a snapshot of the current format fails."""
+    file = tmp_path / "catalog.snapshot"
+    ci.CatalogIndex([1], ["Oat Milk 1L"]).save(file)
+    content = file.read_bytes()
+
+    for bad_content in [b"", b"not a snapshot" * 10, content[:-16]]:
+        file.write_bytes(bad_content)
+        with pytest.raises(ValueError):
+            ci.CatalogIndex.load(file)
+        # only the header is read, so a truncated snapshot isn't noticed
+        if bad_content != content[:-16]:
+            with pytest.raises(ValueError):
+                ci.CatalogIndex.snapshot_change_version(file)
+
+
+def test_with_changes(tmp_path):
+    """Test that changes are applied to a new index, which can be saved with its version."""
+    index = ci.CatalogIndex([1, 2, 3], ["Oat Milk 1L", "Brown Eggs", "Salted Butter"])
+
+    changed = index.with_changes(
+        {2: None, 3: "Unsalted Butter", 4: "Goat Milk 1L"}, change_version=7
+    )
+
+    assert list(changed.skus) == [1, 3, 4]
+    assert changed.full_names == ["Oat Milk 1L", "Unsalted Butter", "Goat Milk 1L"]
+    assert changed.choices == ["oat milk 1l", "unsalted butter", "goat milk 1l"]
+    assert changed.candidate_rows("milk") == [0, 2]
+    assert changed.row(2) is None
+    assert changed.change_version == 7
+    assert list(index.skus) == [1, 2, 3]
+
+    file = tmp_path / "catalog.snapshot"
+    changed.save(file)
+    assert ci.CatalogIndex.load(file).change_version == 7
+    assert ci.CatalogIndex.snapshot_change_version(file) == 7
+    index.save(file)
+    assert ci.CatalogIndex.load(file).change_version is None
+    assert ci.CatalogIndex.snapshot_change_version(file) is None
+
+
+def test_with_changes_looks_up_changed_rows(tmp_path, mocker):
+    """Test that the rows of the changed products are looked up by SKU, also in a snapshot."""
+    file = tmp_path / "catalog.snapshot"
+    ci.CatalogIndex([3, 1, 2], ["Salted Butter", "Oat Milk 1L", "Brown Eggs"]).save(
+        file
+    )
+    loaded = ci.CatalogIndex.load(file)
+    spied_row = mocker.spy(loaded, "row")
+
+    changed = loaded.with_changes({1: None, 2: "White Eggs", 5: "Goat Milk 1L"}, 8)
+
+    assert [call.args[0] for call in spied_row.call_args_list] == [1, 2, 5]
+    assert list(changed.skus) == [3, 2, 5]
+    assert changed.full_names == ["Salted Butter", "White Eggs", "Goat Milk 1L"]
+    assert changed.row(5) == 2
@@ -0,0 +1,82 @@
+"""Unit tests for fast_accept.py"""
+
+import pytest
+
+from apps.agent.models import models
+from apps.agent.services import fast_accept as fa
+
+
+def pruned_line(query: str, scores: list[float]):
+    """Return a pruned catalog line whose candidates have the given scores."""
+    return models.PrunedCatalogPerGroceryListLine(
+        query=query,
+        product=query,
+        candidates=[
+            models.CandidateLineItem(full_name=f"Product {sku}", sku=sku, score=score)
+            for sku, score in enumerate(scores, start=1)
+        ],
+    )
+
+
+def recommendation(query: str, sku: int, confidence: float):
+    """Return the recommendation of a line, suggesting the given SKU."""
+    return models.LLMRecommendationListPerGroceryListLine(
+        query=query,
+        suggestions=[
+            models.LLMRecommendationLineItem(
+                full_name=f"Product {sku}", sku=sku, confidence=confidence
+            )
+        ],
+    )
+
+
+@pytest.mark.parametrize(
+    "scores, expected",
+    [
+        pytest.param([95, 60], True, id="Clear winner"),
+        pytest.param([90], True, id="Single candidate"),
+        pytest.param([95, 80], False, id="Small margin"),
+        pytest.param([85, 50], False, id="Low score"),
+        pytest.param([], False, id="No candidates"),
+        pytest.param([None], False, id="Unscored candidates"),
+    ],
+)
+def test_accept(mocker, scores, expected):
+    """Test that accept() only accepts lines whose best candidate is unambiguous."""
+    service = fa.FastAcceptService(min_score=90, min_margin=20, logger=mocker.Mock())
+    pruned = models.PrunedCatalogList(lines=[pruned_line("milk", scores)])
+
+    accepted, remaining = service.accept(pruned)
+
+    if expected:
+        assert accepted == {0: recommendation("milk", 1, scores[0])}
+        assert remaining.lines == []
+    else:
+        assert accepted == {}
+        assert remaining is pruned
+
+
+def test_merge(mocker):
+    """Test that merge() returns the accepted and recommended lines in the original order."""
+    service = fa.FastAcceptService(min_score=90, min_margin=20, logger=mocker.Mock())
+    pruned = models.PrunedCatalogList(
+        lines=[
+            pruned_line("bread", [70, 65]),
+            pruned_line("milk", [95]),
+            pruned_line("eggs", [80, 75]),
+        ]
+    )
+    accepted, remaining = service.accept(pruned)
+    assert [line.query for line in remaining.lines] == ["bread", "eggs"]
+    recommended = models.LLMRecommendationList(
+        recommendations=[recommendation("bread", 2, 80)]
+    )
+
+    result = service.merge(pruned, accepted, recommended)
+
+    assert result.recommendations == [
+        recommendation("bread", 2, 80),
+        recommendation("milk", 1, 95),
+        models.LLMRecommendationListPerGroceryListLine(query="eggs", suggestions=[]),
+    ]
+    assert service.merge(pruned, {}, recommended) is recommended
@@ -1,7 +1,9 @@
 """Unit tests for fuzzy_filter.py"""
 
+import pathlib
+
 from apps.agent.models import models
-from apps.agent.services import fuzzy_filter
+from apps.agent.services import catalog_index as ci, fuzzy_filter
 
 
 def test_filter_catalog_basic_match(mocker):
@@ -205,3 +207,203 @@ def test_filter_catalog_empty_catalog(mocker):
 
     assert len(result.lines) == 1
     assert result.lines[0].candidates == []
+
+
+def test_filter_catalog_reuses_catalog_index(mocker):
+    """Test that a prebuilt catalog index is used instead of the catalog in the data."""
+    service = fuzzy_filter.FuzzyFilterService(
+        top_n=5, min_score=60, logger=mocker.Mock()
+    )
+    index = ci.CatalogIndex.from_catalog(
+        models.ProductCatalog(
+            catalog=[
+                models.ProductLineItem(sku=1, full_name="Whole MILK 1L"),
+                models.ProductLineItem(sku=2, full_name="Brown Eggs Large"),
+            ]
+        )
+    )
+    mocked_from_catalog = mocker.patch.object(ci.CatalogIndex, "from_catalog")
+
+    data = models.CatalogForFuzzyMatching(
+        catalog=models.ProductCatalog(catalog=[]),
+        grocery_list=models.ParsedGroceryList(
+            grocery_list=[models.ParsedLineItem(query="Milk", product="Milk")]
+        ),
+    )
+
+    result = service.filter_catalog(data, index)
+
+    assert mocked_from_catalog.call_count == 0
+    assert result.lines[0].candidates == [
+        models.CandidateLineItem(sku=1, full_name="Whole MILK 1L", score=90)
+    ]
+
+
+def test_filter_catalog_batched_matches_per_line(mocker):
+    """Test that the batched mode returns the same candidates, in the same order, as per-line mode."""
+    catalog = models.ProductCatalog(
+        catalog=[
+            models.ProductLineItem(sku=1, full_name="Whole Milk 1L"),
+            models.ProductLineItem(sku=2, full_name="Almond Milk Unsweetened"),
+            models.ProductLineItem(sku=3, full_name="Brown Eggs Large"),
+            models.ProductLineItem(sku=4, full_name="Oat Milk"),
+            models.ProductLineItem(sku=5, full_name="Oat Milk"),
+            models.ProductLineItem(sku=6, full_name="Salted Butter"),
+            models.ProductLineItem(sku=7, full_name="Oat Milk"),
+            models.ProductLineItem(sku=8, full_name="White Bread"),
+        ]
+    )
+    grocery_list = models.ParsedGroceryList(
+        grocery_list=[
+            models.ParsedLineItem(query="oat milk", product="oat milk"),
+            models.ParsedLineItem(query="0", product=None),
+            models.ParsedLineItem(query="eggs", product="eggs"),
+            models.ParsedLineItem(query="butter", product="butter"),
+            models.ParsedLineItem(query="caviar", product="caviar"),
+        ]
+    )
+    data = models.CatalogForFuzzyMatching(catalog=catalog, grocery_list=grocery_list)
+
+    for top_n, min_score in [(2, 60), (3, 0), (10, 50), (1, 90)]:
+        per_line = fuzzy_filter.FuzzyFilterService(
+            top_n=top_n, min_score=min_score, logger=mocker.Mock()
+        )
+        batched = fuzzy_filter.FuzzyFilterService(
+            top_n=top_n, min_score=min_score, logger=mocker.Mock(), batched=True
+        )
+
+        assert batched.filter_catalog(data) == per_line.filter_catalog(data)
+
+
+def test_filter_catalog_batched_empty_catalog(mocker):
+    """Test that the batched mode returns no candidates when the store catalog is empty."""
+    service = fuzzy_filter.FuzzyFilterService(
+        top_n=5, min_score=60, logger=mocker.Mock(), batched=True
+    )
+    data = models.CatalogForFuzzyMatching(
+        catalog=models.ProductCatalog(catalog=[]),
+        grocery_list=models.ParsedGroceryList(
+            grocery_list=[models.ParsedLineItem(query="milk", product="milk")]
+        ),
+    )
+
+    result = service.filter_catalog(data)
+
+    assert len(result.lines) == 1
+    assert result.lines[0].candidates == []
+
+
+def test_filter_catalog_prefilter_matches_full_scan(mocker, tmp_path):
+    """
+    Test that prefiltering the catalog with the inverted index returns the same candidates
+    as a full scan on the shipped sample lists, in both per-line and batched modes,
+    whether the index was built or loaded from a snapshot.
+    """
+    with open("apps/agent/assets/catalog.txt") as f:
+        catalog = models.ProductCatalog.model_validate_json(f.read())
+    index = ci.CatalogIndex.from_catalog(catalog)
+    index.save(tmp_path / "catalog.snapshot")
+    loaded = ci.CatalogIndex.load(tmp_path / "catalog.snapshot")
+
+    for path in sorted(pathlib.Path("apps/agent/assets/responses/parser").iterdir()):
+        data = models.CatalogForFuzzyMatching(
+            catalog=catalog,
+            grocery_list=models.ParsedGroceryList.model_validate_json(path.read_text()),
+        )
+        full_scan = fuzzy_filter.FuzzyFilterService(
+            top_n=10, min_score=50, logger=mocker.Mock()
+        ).filter_catalog(data, index)
+
+        for batched in (False, True):
+            service = fuzzy_filter.FuzzyFilterService(
+                top_n=10,
+                min_score=50,
+                logger=mocker.Mock(),
+                batched=batched,
+                prefilter_score=70,
+            )
+            assert service.filter_catalog(data, index) == full_scan
+            assert service.filter_catalog(data, loaded) == full_scan
+            service.prefilter_score = None
+            assert service.filter_catalog(data, loaded) == full_scan
+
+
+def test_filter_catalog_prefilter_scores_candidates_only(mocker):
+    """Test that only the catalog entries sharing a token or trigram with the query are scored."""
+    index = ci.CatalogIndex(
+        [1, 2, 3],
+        ["Oat Milk", "Whole Milk", "Brown Eggs"],
+    )
+    data = models.CatalogForFuzzyMatching(
+        catalog=models.ProductCatalog(catalog=[]),
+        grocery_list=models.ParsedGroceryList(
+            grocery_list=[models.ParsedLineItem(query="milk", product="milk")]
+        ),
+    )
+    service = fuzzy_filter.FuzzyFilterService(
+        top_n=2, min_score=50, logger=mocker.Mock(), prefilter_score=70
+    )
+    spied_extract = mocker.spy(fuzzy_filter.process, "extract")
+
+    result = service.filter_catalog(data, index)
+
+    assert spied_extract.call_count == 1
+    assert spied_extract.call_args.kwargs["choices"] == ["oat milk", "whole milk"]
+    assert [c.sku for c in result.lines[0].candidates] == [1, 2]
+
+
+def test_filter_catalog_prefilter_falls_back_to_full_scan(mocker):
+    """Test that the whole catalog is scored when the prefiltered candidates don't score high enough."""
+    index = ci.CatalogIndex(
+        [1, 2, 3],
+        ["Oat Milk", "Whole Milk", "Brown Eggs"],
+    )
+    data = models.CatalogForFuzzyMatching(
+        catalog=models.ProductCatalog(catalog=[]),
+        grocery_list=models.ParsedGroceryList(
+            grocery_list=[models.ParsedLineItem(query="milk", product="milk")]
+        ),
+    )
+    service = fuzzy_filter.FuzzyFilterService(
+        top_n=3, min_score=0, logger=mocker.Mock(), prefilter_score=70
+    )
+    spied_extract = mocker.spy(fuzzy_filter.process, "extract")
+
+    result = service.filter_catalog(data, index)
+
+    assert spied_extract.call_count == 2
+    assert spied_extract.call_args.kwargs["choices"] == index.choices
+    assert [c.sku for c in result.lines[0].candidates] == [1, 2, 3]
+
+
+def test_filter_catalog_max_score_gap_and_dedupe(mocker):
+    """Test that candidates far below the best one, and duplicate full names, are dropped."""
+    catalog = models.ProductCatalog(
+        catalog=[
+            models.ProductLineItem(sku=1, full_name="Zephyr milk - 1L"),
+            models.ProductLineItem(sku=2, full_name="Zephyr milk - 1L"),
+            models.ProductLineItem(sku=3, full_name="Zephyr milk - 2L"),
+            models.ProductLineItem(sku=4, full_name="Milky Way chocolate bar"),
+        ]
+    )
+    data = models.CatalogForFuzzyMatching(
+        catalog=catalog,
+        grocery_list=models.ParsedGroceryList(
+            grocery_list=[
+                models.ParsedLineItem(query="zephyr milk", product="zephyr milk 1l")
+            ]
+        ),
+    )
+    service = fuzzy_filter.FuzzyFilterService(
+        top_n=10, min_score=40, logger=mocker.Mock()
+    )
+    all_skus = [c.sku for c in service.filter_catalog(data).lines[0].candidates]
+    assert sorted(all_skus) == [1, 2, 3, 4]
+
+    service = fuzzy_filter.FuzzyFilterService(
+        top_n=10, min_score=40, logger=mocker.Mock(), max_score_gap=20, dedupe=True
+    )
+    candidates = service.filter_catalog(data).lines[0].candidates
+
+    assert [c.sku for c in candidates] == [1, 3]
+    assert candidates[0].score - candidates[-1].score <= 20
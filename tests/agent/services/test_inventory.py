@@ -1,12 +1,15 @@
 """Unit tests for inventory.py"""
 
-import copy
+import asyncio
+import fcntl
 import json
+import threading
+import time
 
 import pytest
 import tenacity
 
-from apps.agent.dependencies import constants, exceptions as exc
+from apps.agent.dependencies import cache as ch, constants, exceptions as exc
 from apps.agent.models import models
 from apps.agent.services import inventory as inv
 
@@ -63,6 +66,48 @@ def test_get_product(mocked_api_client, mocker, test_input, expected):
         assert len(response["data"]) == 3
 
 
+def test_get_products(mocked_api_client, mocker):
+    """Check that get_products() fills in blank details for missing products."""
+    mocked_get_products_details = mocked_api_client.return_value.get_products_details
+    mocked_get_products_details.return_value = {
+        "data": [
+            {
+                "brand": "Test Brand",
+                "description": "Test Description",
+                "qty_in_stock": 34,
+                "sku": 100,
+                "unit_price": 7.69,
+            }
+        ]
+    }
+
+    service = inv.InventoryService(logger=mocker.Mock())
+    response = service.get_products([100, 990, 100])
+
+    assert mocked_get_products_details.call_count == 1
+    assert mocked_get_products_details.call_args.args == ([100, 990],)
+    assert response[100]["data"]["qty_in_stock"] == 34
+    assert response[990] == constants.EMPTY_PRODUCT_DETAILS
+
+
+def test_get_products_in_batches(mocked_api_client, mocker):
+    """Check that get_products() splits large requests and survives a failed batch."""
+    mocker.patch.object(constants, "GROCERY_API_SERVER_MAX_PRODUCTS_PER_BATCH", 2)
+    mocked_get_products_details = mocked_api_client.return_value.get_products_details
+    mocked_get_products_details.side_effect = (
+        tenacity.RetryError(mocker.Mock()),
+        {"data": [{"sku": 3, "qty_in_stock": 30, "unit_price": 3.3}]},
+    )
+
+    service = inv.InventoryService(logger=mocker.Mock())
+    response = service.get_products([1, 2, 3])
+
+    assert mocked_get_products_details.call_count == 2
+    assert response[1] == constants.EMPTY_PRODUCT_DETAILS
+    assert response[2] == constants.EMPTY_PRODUCT_DETAILS
+    assert response[3]["data"]["unit_price"] == 3.3
+
+
 def test_load_catalog_on_one_page(mocked_api_client, mocker):
     """Check that load_catalog() works properly on one page."""
     service = inv.InventoryService(logger=mocker.Mock())
@@ -77,6 +122,12 @@ def test_load_catalog_on_one_page(mocked_api_client, mocker):
     assert service.catalog == models.ProductCatalog(
         catalog=[models.ProductLineItem(full_name="Test Product 35", sku=35)]
     )
+    assert list(service.catalog_index.skus) == [35]
+    assert service.catalog_index.choices == ["test product 35"]
+    assert service.catalog_version == 1
+
+    service.load_catalog(100)
+    assert service.catalog_version == 2
 
 
 def test_load_catalog_on_multiple_pages(mocked_api_client, mocker):
@@ -94,7 +145,7 @@ def test_load_catalog_on_multiple_pages(mocked_api_client, mocker):
             response["next"] = None
         data = []
         for j in range(3):
-            product = copy.copy(expected_catalog[i * 3 + j])
+            product = expected_catalog[i * 3 + j].model_dump()
             data.append(product)
         response["data"] = data
         client_responses.append(response)
@@ -106,6 +157,11 @@ def test_load_catalog_on_multiple_pages(mocked_api_client, mocker):
     service.load_catalog(100)
     assert service.catalog == models.ProductCatalog(catalog=expected_catalog)
 
+    # every page after the first is requested using the last SKU of the previous page
+    mocked_listing = mocked_api_client.return_value.get_product_listing
+    cursors = [call.kwargs["after_sku"] for call in mocked_listing.call_args_list]
+    assert cursors == [None, 2, 5, 8]
+
 
 def test_load_catalog_raises_exc_on_page_1(mocked_api_client, mocker):
     """Check that an exception when loading page 1 sets the catalog to []."""
@@ -134,6 +190,31 @@ def test_load_catalog_raises_exc_on_page_2(mocked_api_client, mocker):
     assert service.catalog == models.ProductCatalog(catalog=[])
 
 
+def test_load_catalog_from_stream(mocked_api_client, mocker):
+    """Check that load_catalog() works properly on a streamed catalog."""
+    products = [{"full_name": f"Test Product {i}", "sku": i} for i in range(5)]
+    mocked_api_client.return_value.stream_product_catalog.return_value = iter(products)
+    service = inv.InventoryService(logger=mocker.Mock())
+    service.load_catalog(source="stream")
+    assert service.catalog == models.ProductCatalog(
+        catalog=[models.ProductLineItem(**product) for product in products]
+    )
+    assert mocked_api_client.return_value.get_product_listing.call_count == 0
+
+
+def test_load_catalog_from_broken_stream(mocked_api_client, mocker):
+    """Check that an exception in the middle of the stream sets the catalog to []."""
+
+    def broken_stream():
+        yield {"full_name": "Test Product 1", "sku": 1}
+        raise exc.APIServerException(500)
+
+    mocked_api_client.return_value.stream_product_catalog.return_value = broken_stream()
+    service = inv.InventoryService(logger=mocker.Mock())
+    service.load_catalog(source="stream")
+    assert service.catalog == models.ProductCatalog(catalog=[])
+
+
 def test_load_catalog_from_file(mocker, tmp_path):
     """Check that load_catalog() works properly on a file."""
     dir_ = tmp_path / "assets"
@@ -188,44 +269,43 @@ def test_get_final_recommendations(mocked_api_client, mocker):
         ]
     )
 
-    mocked_product_details = (
-        {
-            "data": {
+    # SKU 99000 doesn't exist, so the API server leaves it out of the response
+    mocked_product_details = {
+        "data": [
+            {
                 "brand": "Test Brand",
                 "description": "Test Description 1",
                 "qty_in_stock": 10,
                 "unit_price": 1.1,
                 "sku": 1000,
-            }
-        },
-        constants.EMPTY_PRODUCT_DETAILS,
-        {
-            "data": {
+            },
+            {
                 "brand": "Test Brand",
                 "description": "Test Description 2",
                 "qty_in_stock": 20,
                 "unit_price": 2.2,
                 "sku": 2000,
-            }
-        },
-        {
-            "data": {
+            },
+            {
                 "brand": "Test Brand",
                 "description": "Test Description 3",
                 "qty_in_stock": 30,
                 "unit_price": 3.3,
                 "sku": 3000,
-            }
-        },
-    )
+            },
+        ]
+    }
 
-    mocked_api_client.return_value.get_product_details.side_effect = (
-        mocked_product_details
-    )
+    mocked_get_products_details = mocked_api_client.return_value.get_products_details
+    mocked_get_products_details.return_value = mocked_product_details
 
     service = inv.InventoryService(logger=mocker.Mock())
     result = service.get_final_recommendations(llm_recs)
 
+    # all suggestions are resolved in a single request
+    assert mocked_get_products_details.call_count == 1
+    assert mocked_api_client.return_value.get_product_details.call_count == 0
+
     assert isinstance(result, models.AgentRecommendationList)
     assert len(result.recommendations) == 3
 
@@ -271,3 +351,350 @@ def test_get_final_recommendations(mocked_api_client, mocker):
     assert suggestion.sku == 3000
     assert suggestion.qty_in_stock == 30
     assert suggestion.unit_price == 3.3
+
+
+def test_aget_final_recommendations(mocked_api_client, mocked_async_api_client, mocker):
+    """Test that aget_final_recommendations() merges the details fetched asynchronously."""
+    llm_recs = models.LLMRecommendationList(
+        recommendations=[
+            models.LLMRecommendationListPerGroceryListLine(
+                query="2 cans of tuna",
+                suggestions=[
+                    models.LLMRecommendationLineItem(
+                        full_name="Test full name 1", sku=1000, confidence=90
+                    ),
+                    models.LLMRecommendationLineItem(
+                        full_name="Test full name 99", sku=99000, confidence=80
+                    ),
+                ],
+            ),
+        ]
+    )
+    mocked_function = mocker.AsyncMock(
+        return_value={"data": [{"sku": 1000, "qty_in_stock": 10, "unit_price": 1.1}]}
+    )
+    mocked_async_api_client.return_value.get_products_details = mocked_function
+
+    service = inv.InventoryService(logger=mocker.Mock())
+    result = asyncio.run(service.aget_final_recommendations(llm_recs))
+
+    assert mocked_function.call_count == 1
+    suggestions = result.recommendations[0].suggestions
+    assert (suggestions[0].qty_in_stock, suggestions[0].unit_price) == (10, 1.1)
+    assert (suggestions[1].qty_in_stock, suggestions[1].unit_price) == (-1, -1)
+
+
+def test_aget_products_bounds_concurrency(
+    mocked_api_client, mocked_async_api_client, mocker
+):
+    """Check that aget_products() fetches batches concurrently, but within the limit."""
+    mocker.patch.object(constants, "GROCERY_API_SERVER_MAX_PRODUCTS_PER_BATCH", 1)
+    mocker.patch.object(constants, "GROCERY_API_SERVER_MAX_CONCURRENT_REQUESTS", 2)
+    in_flight = []
+    max_in_flight = []
+
+    async def get_products_details(batch):
+        in_flight.append(batch)
+        max_in_flight.append(len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.remove(batch)
+        if batch == [3]:
+            raise tenacity.RetryError(mocker.Mock())
+        return {"data": [{"sku": batch[0], "qty_in_stock": 1, "unit_price": 1.0}]}
+
+    mocked_async_api_client.return_value.get_products_details = get_products_details
+
+    service = inv.InventoryService(logger=mocker.Mock())
+    response = asyncio.run(service.aget_products([1, 2, 3, 4, 5]))
+
+    assert max(max_in_flight) == 2
+    assert response[3] == constants.EMPTY_PRODUCT_DETAILS
+    assert all(response[sku]["data"]["sku"] == sku for sku in (1, 2, 4, 5))
+
+
+def test_load_catalog_shares_a_snapshot(mocked_api_client, mocker, tmp_path):
+    """Check that a loaded catalog is written to the snapshot file, which other services load."""
+    file = tmp_path / "catalog.snapshot"
+    products = [{"full_name": f"Test Product {i}", "sku": i} for i in range(5)]
+    mocked_stream = mocked_api_client.return_value.stream_product_catalog
+    mocked_stream.return_value = iter(products)
+
+    service = inv.InventoryService(logger=mocker.Mock(), snapshot_file=file)
+    service.load_catalog(source="stream")
+    assert file.exists()
+    assert mocked_stream.call_count == 1
+
+    other_service = inv.InventoryService(
+        logger=mocker.Mock(), snapshot_file=file, snapshot_max_age=60
+    )
+    other_service.load_catalog(source="stream")
+    assert mocked_stream.call_count == 1
+    assert other_service.catalog_index.snapshot is not None
+    assert other_service.catalog == service.catalog
+    assert other_service.catalog_version == 1
+
+
+def test_load_catalog_ignores_stale_snapshot(mocked_api_client, mocker, tmp_path):
+    """Check that a snapshot older than the max age, or a broken one, isn't loaded."""
+    file = tmp_path / "catalog.snapshot"
+    products = [{"full_name": "Test Product 1", "sku": 1}]
+    mocked_stream = mocked_api_client.return_value.stream_product_catalog
+    mocked_stream.side_effect = lambda: iter(products)
+    service = inv.InventoryService(
+        logger=mocker.Mock(), snapshot_file=file, snapshot_max_age=60
+    )
+    service.load_catalog(source="stream")
+
+    mocked_time = mocker.patch(
+        "apps.agent.services.inventory.time.time", return_value=1e12
+    )
+    service.load_catalog(source="stream")
+    assert mocked_stream.call_count == 2
+    # the catalog fetched instead is written to a new snapshot, then loaded from it
+    assert service.catalog_index.snapshot is not None
+
+    mocker.stop(mocked_time)
+    file.write_bytes(b"broken")
+    service.load_catalog(source="stream")
+    assert mocked_stream.call_count == 3
+    assert service.catalog == models.ProductCatalog(
+        catalog=[models.ProductLineItem(**products[0])]
+    )
+
+
+def test_refresh_catalog(mocked_api_client, mocker):
+    """Check that refresh_catalog() applies every page of changes since the loaded version."""
+    products = [{"full_name": f"Test Product {i}", "sku": i} for i in range(3)]
+    mocked_client = mocked_api_client.return_value
+    mocked_client.stream_product_catalog.return_value = iter(products)
+    mocked_client.get_catalog_changes.side_effect = [
+        {"data": [], "version": 10, "next": None},
+        {
+            "data": [{"sku": 1, "full_name": None}, {"sku": 5, "full_name": "New"}],
+            "version": 12,
+            "next": "exists",
+        },
+        {"data": [{"sku": 2, "full_name": "Renamed"}], "version": 13, "next": None},
+        {"data": [], "version": 13, "next": None},
+    ]
+    service = inv.InventoryService(logger=mocker.Mock())
+    service.load_catalog(source="stream")
+    assert service.catalog_index.change_version == 10
+
+    assert service.refresh_catalog()
+    since = [call.args[0] for call in mocked_client.get_catalog_changes.call_args_list]
+    assert since == [None, 10, 12]
+    assert service.catalog_index.change_version == 13
+    assert service.catalog_index.full_names == ["Test Product 0", "Renamed", "New"]
+    assert service.catalog_version == 2
+
+    assert not service.refresh_catalog()
+    assert service.catalog_version == 2
+
+
+def test_refresh_catalog_without_change_version(mocked_api_client, mocker):
+    """Check that a catalog whose change version is unknown isn't refreshed."""
+    mocked_client = mocked_api_client.return_value
+    mocked_client.stream_product_catalog.return_value = iter([])
+    mocked_client.get_catalog_changes.side_effect = tenacity.RetryError(mocker.Mock())
+    service = inv.InventoryService(logger=mocker.Mock())
+    service.load_catalog(source="stream")
+    assert service.catalog_index.change_version is None
+
+    assert not service.refresh_catalog()
+    assert mocked_client.get_catalog_changes.call_count == 1
+
+
+def test_refresh_catalog_shares_a_snapshot(mocked_api_client, mocker, tmp_path):
+    """
+    Check that a single service applies the changes to the snapshot,
+    and that every service then loads it instead of keeping a private index.
+    """
+    file = tmp_path / "catalog.snapshot"
+    products = [{"full_name": f"Test Product {i}", "sku": i} for i in range(3)]
+    mocked_client = mocked_api_client.return_value
+    mocked_client.stream_product_catalog.return_value = iter(products)
+    mocked_client.get_catalog_changes.side_effect = [
+        {"data": [], "version": 10, "next": None},
+        {"data": [{"sku": 1, "full_name": "Renamed"}], "version": 11, "next": None},
+    ]
+    service = inv.InventoryService(logger=mocker.Mock(), snapshot_file=file)
+    service.load_catalog(source="stream")
+    other_service = inv.InventoryService(logger=mocker.Mock(), snapshot_file=file)
+    other_service.load_catalog(source="stream")
+    assert service.catalog_index.snapshot is not None
+
+    assert service.refresh_catalog()
+    assert service.catalog_index.snapshot is not None
+    assert service.catalog_index.postings is None
+    assert service.catalog_index.change_version == 11
+    assert service.catalog_version == 2
+
+    assert other_service.refresh_catalog()
+    assert mocked_client.get_catalog_changes.call_count == 2
+    assert other_service.catalog_index.snapshot is not None
+    assert other_service.catalog_index.full_names == [
+        "Test Product 0",
+        "Renamed",
+        "Test Product 2",
+    ]
+    assert other_service.catalog_version == 2
+
+
+def test_refresh_catalog_while_snapshot_is_locked(mocked_api_client, mocker, tmp_path):
+    """Check that changes aren't fetched while another process refreshes the snapshot."""
+    file = tmp_path / "catalog.snapshot"
+    mocked_client = mocked_api_client.return_value
+    mocked_client.stream_product_catalog.return_value = iter(
+        [{"full_name": "Test Product 1", "sku": 1}]
+    )
+    mocked_client.get_catalog_changes.return_value = {
+        "data": [],
+        "version": 10,
+        "next": None,
+    }
+    service = inv.InventoryService(logger=mocker.Mock(), snapshot_file=file)
+    service.load_catalog(source="stream")
+
+    with open(f"{file}.lock", "a") as lock:
+        # flock() locks are per open file, so this conflicts within one process too
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        assert not service.refresh_catalog()
+    assert mocked_client.get_catalog_changes.call_count == 1
+
+    assert not service.refresh_catalog()
+    assert mocked_client.get_catalog_changes.call_count == 2
+
+
+def test_start_refresh(mocked_api_client, mocker):
+    """Check that the catalog is refreshed in the background until stopped."""
+    service = inv.InventoryService(logger=mocker.Mock())
+    refreshed = threading.Event()
+    mocked_refresh = mocker.patch.object(
+        service, "refresh_catalog", side_effect=lambda: refreshed.set()
+    )
+
+    service.start_refresh(0.01)
+    service.start_refresh(0.01)
+    assert refreshed.wait(5)
+    service.stop_refresh()
+    calls = mocked_refresh.call_count
+    time.sleep(0.05)
+    assert mocked_refresh.call_count == calls
+
+
+def test_get_products_reads_through_cache(mocked_api_client, mocker):
+    """Check that cached product details are served without calling the API server."""
+    mocked_get_products_details = mocked_api_client.return_value.get_products_details
+    mocked_get_products_details.side_effect = lambda batch: {
+        "data": [
+            {"sku": sku, "qty_in_stock": 1, "unit_price": 1.0}
+            for sku in batch
+            if sku != 990
+        ]
+    }
+    mocked_get_product_details = mocked_api_client.return_value.get_product_details
+    details_cache = ch.LRUCache(max_size=10)
+    service = inv.InventoryService(logger=mocker.Mock(), details_cache=details_cache)
+
+    service.get_products([100, 990])
+    response = service.get_products([100, 990, 200])
+    assert [call.args[0] for call in mocked_get_products_details.call_args_list] == [
+        [100, 990],
+        [990, 200],
+    ]
+    assert response[100]["data"]["sku"] == 100
+    assert response[990] == constants.EMPTY_PRODUCT_DETAILS
+
+    assert service.get_product(200)["data"]["sku"] == 200
+    assert mocked_get_product_details.call_count == 0
+    assert details_cache.stats()["hits"] == 2
+
+
+def test_aget_products_coalesces_concurrent_requests(
+    mocked_api_client, mocked_async_api_client, mocker
+):
+    """Check that a product requested by two concurrent calls is only fetched once."""
+    batches = []
+
+    async def get_products_details(batch):
+        batches.append(batch)
+        await asyncio.sleep(0.01)
+        return {
+            "data": [
+                {"sku": sku, "qty_in_stock": 1, "unit_price": 1.0} for sku in batch
+            ]
+        }
+
+    mocked_async_api_client.return_value.get_products_details = get_products_details
+    service = inv.InventoryService(logger=mocker.Mock())
+
+    async def get_both():
+        return await asyncio.gather(
+            service.aget_products([1, 2]), service.aget_products([2, 3])
+        )
+
+    first, second = asyncio.run(get_both())
+
+    assert batches == [[1, 2], [3]]
+    assert (
+        first[2]
+        == second[2]
+        == {"data": {"sku": 2, "qty_in_stock": 1, "unit_price": 1.0}}
+    )
+    assert service._inflight == {}
+
+
+def test_get_product_coalesces_concurrent_requests(mocked_api_client, mocker):
+    """Check that a product requested by concurrent get_product() calls is only fetched once."""
+    started = threading.Event()
+    release = threading.Event()
+
+    def get_product_details(product_id):
+        started.set()
+        release.wait(1)
+        return {"data": {"sku": product_id, "qty_in_stock": 1, "unit_price": 1.0}}
+
+    mocked_get_product_details = mocked_api_client.return_value.get_product_details
+    mocked_get_product_details.side_effect = get_product_details
+    mocked_get_products_details = mocked_api_client.return_value.get_products_details
+    service = inv.InventoryService(logger=mocker.Mock())
+
+    responses = []
+    first = threading.Thread(target=lambda: responses.append(service.get_product(2)))
+    first.start()
+    started.wait(1)
+    second = threading.Thread(target=lambda: responses.append(service.get_product(2)))
+    second.start()
+    batch = threading.Thread(
+        target=lambda: responses.append(service.get_products([2])[2])
+    )
+    batch.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in (first, second, batch):
+        thread.join()
+
+    assert mocked_get_product_details.call_count == 1
+    assert mocked_get_products_details.call_count == 0
+    assert responses == [{"data": {"sku": 2, "qty_in_stock": 1, "unit_price": 1.0}}] * 3
+    assert service._inflight == {}
+
+
+def test_details_cache_is_used_outside_the_inflight_lock(mocked_api_client, mocker):
+    """Check that the details cache, which may read its database, is never used under the lock."""
+    service = inv.InventoryService(logger=mocker.Mock(), details_cache=mocker.Mock())
+
+    def check_unlocked(*args):
+        assert not service._inflight_lock.locked()
+
+    service.details_cache.get.side_effect = lambda key: check_unlocked()
+    service.details_cache.set.side_effect = check_unlocked
+    mocked_api_client.return_value.get_products_details.return_value = {
+        "data": [{"sku": 1, "qty_in_stock": 1, "unit_price": 1.0}]
+    }
+
+    response = service.get_products([1, 2])
+    assert response[1]["data"]["sku"] == 1
+    assert service.details_cache.get.call_count == 2
+    assert service.details_cache.set.call_count == 1
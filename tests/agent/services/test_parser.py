@@ -1,12 +1,15 @@
 """Unit tests for parser.py"""
 
+import asyncio
 import json
+import os
+import pathlib
 
 import tenacity
 
-from apps.agent.dependencies import constants
+from apps.agent.dependencies import cache as ch, constants
 from apps.agent.models import models
-from apps.agent.services import parser as p
+from apps.agent.services import parser as p, rule_parser as rp
 
 
 def test_parse_grocery_text_success(mocked_openai_client, mocker, tmp_path):
@@ -57,6 +60,173 @@ def test_parse_grocery_text_failure(mocked_openai_client, mocker, tmp_path):
     assert result is None
 
 
+def test_aparse_grocery_text_success(mocked_async_openai_client, mocker, tmp_path):
+    """Test that aparse_grocery_text() returns the parsed grocery text if there are no errors."""
+    expected = models.ParsedGroceryList(
+        grocery_list=[
+            models.ParsedLineItem(
+                query="3 packs of milk", product="milk", quantity=3, unit="packs"
+            )
+        ]
+    )
+
+    parser = p.ParserService(
+        api_key="fake-key",
+        model_name=constants.PARSER_LLM_MODEL,
+        base_prompt_file=mocker.Mock(),
+        dummy_responses_folder=tmp_path,
+        logger=mocker.Mock(),
+    )
+    mocked_async_openai_client.return_value.request_structured_response = (
+        mocker.AsyncMock(return_value=expected)
+    )
+
+    result = asyncio.run(parser.aparse_grocery_text("3 packs of milk"))
+
+    assert result == expected
+
+
+def test_aparse_grocery_text_failure(mocked_async_openai_client, mocker, tmp_path):
+    """Test that aparse_grocery_text() returns None if there are errors."""
+    parser = p.ParserService(
+        api_key="fake-key",
+        model_name=constants.PARSER_LLM_MODEL,
+        base_prompt_file=mocker.Mock(),
+        dummy_responses_folder=tmp_path,
+        logger=mocker.Mock(),
+    )
+    mocked_async_openai_client.return_value.request_structured_response = (
+        mocker.AsyncMock(side_effect=tenacity.RetryError(mocker.Mock()))
+    )
+
+    result = asyncio.run(parser.aparse_grocery_text("milk"))
+
+    assert result is None
+
+
+def test_parse_grocery_text_only_sends_uncached_lines(
+    mocked_openai_client, mocker, tmp_path
+):
+    """Test that parse_grocery_text() only sends the lines missing from the cache to the LLM."""
+    parser = p.ParserService(
+        api_key="fake-key",
+        model_name=constants.PARSER_LLM_MODEL,
+        base_prompt_file=mocker.Mock(),
+        dummy_responses_folder=tmp_path,
+        logger=mocker.Mock(),
+        cache=ch.LRUCache(max_size=10),
+    )
+    request = mocked_openai_client.return_value.request_structured_response
+    request.return_value = models.ParsedGroceryList(
+        grocery_list=[
+            models.ParsedLineItem(
+                query="3 packs of milk", product="milk", quantity=3, unit="packs"
+            ),
+            models.ParsedLineItem(query="0", product=None),
+        ]
+    )
+    parser.parse_grocery_text("3 packs of milk<li/>0")
+
+    request.return_value = models.ParsedGroceryList(
+        grocery_list=[
+            models.ParsedLineItem(query="2 apples", product="apples", quantity=2),
+            models.ParsedLineItem(query="0", product=None),
+        ]
+    )
+    result = parser.parse_grocery_text("2 apples<li/>3  Packs of MILK<li/>0")
+
+    prompt = request.call_args.args[0]
+    assert prompt[1]["content"] == "<li/>2 apples<li/>0"
+    assert result == models.ParsedGroceryList(
+        grocery_list=[
+            models.ParsedLineItem(query="2 apples", product="apples", quantity=2),
+            models.ParsedLineItem(
+                query="3  Packs of MILK", product="milk", quantity=3, unit="packs"
+            ),
+            models.ParsedLineItem(query="0", product=None),
+        ]
+    )
+
+
+def test_parse_grocery_text_fully_cached(mocked_openai_client, mocker, tmp_path):
+    """Test that parse_grocery_text() doesn't call the LLM if every line is cached."""
+    cache = ch.LRUCache(max_size=10)
+    cache.set("1 bag of sugar", {"query": "1 bag of sugar", "product": "sugar"})
+    parser = p.ParserService(
+        api_key="fake-key",
+        model_name=constants.PARSER_LLM_MODEL,
+        base_prompt_file=mocker.Mock(),
+        dummy_responses_folder=tmp_path,
+        logger=mocker.Mock(),
+        cache=cache,
+    )
+
+    result = parser.parse_grocery_text("<li/>1 Bag of Sugar")
+
+    request = mocked_openai_client.return_value.request_structured_response
+    assert request.call_count == 0
+    assert result == models.ParsedGroceryList(
+        grocery_list=[models.ParsedLineItem(query="1 Bag of Sugar", product="sugar")]
+    )
+
+
+def test_parse_grocery_text_with_cache_failure(mocked_openai_client, mocker, tmp_path):
+    """Test that parse_grocery_text() returns None on errors, even if some lines are cached."""
+    cache = ch.LRUCache(max_size=10)
+    cache.set("1 bag of sugar", {"query": "1 bag of sugar", "product": "sugar"})
+    parser = p.ParserService(
+        api_key="fake-key",
+        model_name=constants.PARSER_LLM_MODEL,
+        base_prompt_file=mocker.Mock(),
+        dummy_responses_folder=tmp_path,
+        logger=mocker.Mock(),
+        cache=cache,
+    )
+    mocked_openai_client.return_value.request_structured_response.side_effect = (
+        tenacity.RetryError(mocker.Mock())
+    )
+
+    result = parser.parse_grocery_text("1 bag of sugar<li/>milk")
+
+    assert result is None
+
+
+def test_aparse_grocery_text_only_sends_uncached_lines(
+    mocked_async_openai_client, mocker, tmp_path
+):
+    """Test that aparse_grocery_text() only sends the lines missing from the cache to the LLM."""
+    cache = ch.LRUCache(max_size=10)
+    cache.set("1 bag of sugar", {"query": "1 bag of sugar", "product": "sugar"})
+    parser = p.ParserService(
+        api_key="fake-key",
+        model_name=constants.PARSER_LLM_MODEL,
+        base_prompt_file=mocker.Mock(),
+        dummy_responses_folder=tmp_path,
+        logger=mocker.Mock(),
+        cache=cache,
+    )
+    request = mocker.AsyncMock(
+        return_value=models.ParsedGroceryList(
+            grocery_list=[models.ParsedLineItem(query="milk", product="milk")]
+        )
+    )
+    mocked_async_openai_client.return_value.request_structured_response = request
+
+    result = asyncio.run(parser.aparse_grocery_text("milk<li/>1 bag of sugar"))
+
+    assert request.call_args.args[0][1]["content"] == "<li/>milk"
+    assert [line_item.product for line_item in result.grocery_list] == [
+        "milk",
+        "sugar",
+    ]
+    assert cache.get("milk") == {
+        "query": "milk",
+        "product": "milk",
+        "quantity": None,
+        "unit": None,
+    }
+
+
 def test_return_mocked_response_success(mocker, tmp_path):
     """Test that return_mocked_response() returns the mocked response written in a file."""
     content = {
@@ -113,3 +283,157 @@ def test_return_mocked_response_invalid_json(mocker, tmp_path):
     result = parser.return_mocked_response("bad.txt")
 
     assert result is None
+
+
+def test_base_prompt_is_cached(mocker, tmp_path):
+    """Test that the base prompt file is read once, and only checked again after the interval."""
+    prompt_file = tmp_path / "prompt.txt"
+    prompt_file.write_text("Parse this list.")
+    mocked_monotonic = mocker.patch("apps.agent.services.base_llm.time.monotonic")
+    mocked_monotonic.return_value = 100
+    parser = p.ParserService(
+        api_key=None,
+        model_name=constants.PARSER_LLM_MODEL,
+        base_prompt_file=prompt_file,
+        dummy_responses_folder=tmp_path,
+        logger=mocker.Mock(),
+    )
+    spied_read_text = mocker.spy(pathlib.Path, "read_text")
+
+    assert parser._build_prompt("milk")[0]["content"] == "Parse this list."
+    assert parser._build_prompt("sugar")[0]["content"] == "Parse this list."
+    assert spied_read_text.call_count == 1
+    assert parser.prompt_reloads == 1
+
+    prompt_file.write_text("Parse this grocery list.")
+    os.utime(prompt_file, ns=(0, prompt_file.stat().st_mtime_ns + 1_000_000_000))
+    assert parser._build_prompt("milk")[0]["content"] == "Parse this list."
+
+    mocked_monotonic.return_value = 100 + constants.PROMPT_RELOAD_CHECK_INTERVAL
+    assert parser._build_prompt("milk")[0]["content"] == "Parse this grocery list."
+    assert parser._build_prompt("milk")[0]["content"] == "Parse this grocery list."
+    assert spied_read_text.call_count == 2
+    assert parser.prompt_reloads == 2
+
+
+def test_base_prompt_kept_if_file_is_missing(mocker, tmp_path):
+    """Test that the cached base prompt is still used if the file can no longer be found."""
+    prompt_file = tmp_path / "prompt.txt"
+    prompt_file.write_text("Parse this list.")
+    mocked_monotonic = mocker.patch("apps.agent.services.base_llm.time.monotonic")
+    mocked_monotonic.return_value = 100
+    parser = p.ParserService(
+        api_key=None,
+        model_name=constants.PARSER_LLM_MODEL,
+        base_prompt_file=prompt_file,
+        dummy_responses_folder=tmp_path,
+        logger=mocker.Mock(),
+    )
+    parser._build_prompt("milk")
+
+    prompt_file.unlink()
+    mocked_monotonic.return_value = 200
+
+    assert parser._build_prompt("milk")[0]["content"] == "Parse this list."
+    assert parser.prompt_reloads == 1
+
+
+def parse_lines(prompt, response_model):
+    """Parse every line of the prompt into a line item; fail on lines containing "fail"."""
+    lines = prompt[1]["content"].split("<li/>")[1:]
+    if any("fail" in line for line in lines):
+        raise tenacity.RetryError(None)
+    return models.ParsedGroceryList(
+        grocery_list=[models.ParsedLineItem(query=line, product=line) for line in lines]
+    )
+
+
+def test_parse_grocery_text_in_chunks(mocked_openai_client, mocker, tmp_path):
+    """
+    Test that parse_grocery_text() sends long lists in chunks, and that the lines of a
+    failing chunk are returned unparsed while the other chunks are kept, in order.
+    """
+    parser = p.ParserService(
+        api_key="fake-key",
+        model_name=constants.PARSER_LLM_MODEL,
+        base_prompt_file=mocker.Mock(),
+        dummy_responses_folder=tmp_path,
+        logger=mocker.Mock(),
+        chunk_size=2,
+        max_concurrent_chunks=2,
+    )
+    request = mocked_openai_client.return_value.request_structured_response
+    request.side_effect = parse_lines
+
+    result = parser.parse_grocery_text("a<li/>b<li/>c<li/>fail<li/>e")
+
+    assert sorted(call.args[0][1]["content"] for call in request.call_args_list) == [
+        "<li/>a<li/>b",
+        "<li/>c<li/>fail",
+        "<li/>e",
+    ]
+    assert [(line.query, line.product) for line in result.grocery_list] == [
+        ("a", "a"),
+        ("b", "b"),
+        ("c", None),
+        ("fail", None),
+        ("e", "e"),
+    ]
+
+
+def test_aparse_grocery_text_in_chunks(mocked_async_openai_client, mocker, tmp_path):
+    """Test that aparse_grocery_text() sends at most max_concurrent_chunks chunks at a time."""
+    parser = p.ParserService(
+        api_key="fake-key",
+        model_name=constants.PARSER_LLM_MODEL,
+        base_prompt_file=mocker.Mock(),
+        dummy_responses_folder=tmp_path,
+        logger=mocker.Mock(),
+        chunk_size=1,
+        max_concurrent_chunks=2,
+    )
+    in_flight = []
+    max_in_flight = 0
+
+    async def request(prompt, response_model):
+        nonlocal max_in_flight
+        in_flight.append(prompt)
+        max_in_flight = max(max_in_flight, len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.remove(prompt)
+        return parse_lines(prompt, response_model)
+
+    mocked_async_openai_client.return_value.request_structured_response = request
+
+    result = asyncio.run(parser.aparse_grocery_text("a<li/>b<li/>c<li/>d<li/>e"))
+
+    assert max_in_flight == 2
+    assert [line.product for line in result.grocery_list] == ["a", "b", "c", "d", "e"]
+
+
+def test_parse_grocery_text_with_rule_parser(mocked_openai_client, mocker, tmp_path):
+    """Test that parse_grocery_text() only sends the lines the rule-based parser can't parse to the LLM."""
+    parser = p.ParserService(
+        api_key="fake-key",
+        model_name=constants.PARSER_LLM_MODEL,
+        base_prompt_file=mocker.Mock(),
+        dummy_responses_folder=tmp_path,
+        logger=mocker.Mock(),
+        rule_parser=rp.RuleParserService(min_confidence=0.85, logger=mocker.Mock()),
+    )
+    request = mocked_openai_client.return_value.request_structured_response
+    request.side_effect = parse_lines
+
+    result = parser.parse_grocery_text("3 packs of milk<li/>1 tuna in can<li/>bananas")
+
+    assert request.call_count == 1
+    assert request.call_args.args[0][1]["content"] == "<li/>1 tuna in can"
+    assert [(line.product, line.quantity) for line in result.grocery_list] == [
+        ("milk", 3),
+        ("1 tuna in can", None),
+        ("bananas", None),
+    ]
+
+    request.reset_mock()
+    parser.parse_grocery_text("3 packs of milk<li/>bananas")
+    assert request.call_count == 0
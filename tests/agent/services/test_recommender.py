@@ -1,10 +1,11 @@
 """Unit tests for recommender.py"""
 
+import asyncio
 import json
 
 import tenacity
 
-from apps.agent.dependencies import constants
+from apps.agent.dependencies import cache as ch, constants
 from apps.agent.models import models
 from apps.agent.services import recommender as r
 
@@ -66,6 +67,182 @@ def test_recommend_products_failure(mocked_openai_client, mocker, tmp_path):
     assert result is None
 
 
+def test_arecommend_products_success(mocked_async_openai_client, mocker, tmp_path):
+    """Test that arecommend_products() returns product recommendations if there are no errors."""
+    expected = models.LLMRecommendationList(
+        recommendations=[
+            models.LLMRecommendationListPerGroceryListLine(
+                query="1 bag of sugar", suggestions=[]
+            )
+        ]
+    )
+
+    recommender = r.RecommenderService(
+        api_key="fake-key",
+        model_name=constants.RECOMMENDER_LLM_MODEL,
+        base_prompt_file=mocker.Mock(),
+        dummy_responses_folder=tmp_path,
+        logger=mocker.Mock(),
+    )
+    mocked_async_openai_client.return_value.request_structured_response = (
+        mocker.AsyncMock(return_value=expected)
+    )
+
+    result = asyncio.run(
+        recommender.arecommend_products(models.PrunedCatalogList(lines=[]))
+    )
+
+    assert result == expected
+
+
+def test_arecommend_products_failure(mocked_async_openai_client, mocker, tmp_path):
+    """Test that arecommend_products() returns None if there are errors."""
+    recommender = r.RecommenderService(
+        api_key="fake-key",
+        model_name=constants.RECOMMENDER_LLM_MODEL,
+        base_prompt_file=mocker.Mock(),
+        dummy_responses_folder=tmp_path,
+        logger=mocker.Mock(),
+    )
+    mocked_async_openai_client.return_value.request_structured_response = (
+        mocker.AsyncMock(side_effect=tenacity.RetryError(mocker.Mock()))
+    )
+
+    result = asyncio.run(recommender.arecommend_products(mocker.Mock()))
+
+    assert result is None
+
+
+def pruned_line(query: str, product: str, skus: list[int]):
+    """Return a pruned catalog line whose candidates have the given SKUs."""
+    return models.PrunedCatalogPerGroceryListLine(
+        query=query,
+        product=product,
+        candidates=[
+            models.CandidateLineItem(full_name=f"Product {sku}", sku=sku)
+            for sku in skus
+        ],
+    )
+
+
+def recommendation(query: str, skus: list[int]):
+    """Return the recommendation of a line, suggesting the given SKUs."""
+    return models.LLMRecommendationListPerGroceryListLine(
+        query=query,
+        suggestions=[
+            models.LLMRecommendationLineItem(
+                full_name=f"Product {sku}", sku=sku, confidence=90
+            )
+            for sku in skus
+        ],
+    )
+
+
+def test_recommend_products_only_sends_uncached_lines(
+    mocked_openai_client, mocker, tmp_path
+):
+    """
+    Test that recommend_products() only sends the lines whose product and candidates
+    are missing from the cache to the LLM.
+    """
+    recommender = r.RecommenderService(
+        api_key="fake-key",
+        model_name=constants.RECOMMENDER_LLM_MODEL,
+        base_prompt_file=mocker.Mock(),
+        dummy_responses_folder=tmp_path,
+        logger=mocker.Mock(),
+        cache=ch.LRUCache(max_size=10),
+    )
+    request = mocked_openai_client.return_value.request_structured_response
+    request.return_value = models.LLMRecommendationList(
+        recommendations=[recommendation("milk", [1])]
+    )
+    recommender.recommend_products(
+        models.PrunedCatalogList(lines=[pruned_line("milk", "milk", [1, 2])]),
+        catalog_version=1,
+    )
+
+    request.return_value = models.LLMRecommendationList(
+        recommendations=[recommendation("2 milk", [3]), recommendation("sugar", [4])]
+    )
+    result = recommender.recommend_products(
+        models.PrunedCatalogList(
+            lines=[
+                pruned_line("3 packs of milk", "Milk", [2, 1]),
+                pruned_line("2 milk", "milk", [1, 3]),
+                pruned_line("sugar", "sugar", [4]),
+            ]
+        ),
+        catalog_version=1,
+    )
+
+    sent = json.loads(request.call_args.args[0][1]["content"])
+    assert [line["query"] for line in sent["lines"]] == ["2 milk", "sugar"]
+    assert result == models.LLMRecommendationList(
+        recommendations=[
+            recommendation("3 packs of milk", [1]),
+            recommendation("2 milk", [3]),
+            recommendation("sugar", [4]),
+        ]
+    )
+
+
+def test_recommend_products_cache_cleared_on_new_catalog(
+    mocked_openai_client, mocker, tmp_path
+):
+    """Test that recommend_products() clears the cache when a new catalog version is given."""
+    recommender = r.RecommenderService(
+        api_key="fake-key",
+        model_name=constants.RECOMMENDER_LLM_MODEL,
+        base_prompt_file=mocker.Mock(),
+        dummy_responses_folder=tmp_path,
+        logger=mocker.Mock(),
+        cache=ch.LRUCache(max_size=10),
+    )
+    request = mocked_openai_client.return_value.request_structured_response
+    request.return_value = models.LLMRecommendationList(
+        recommendations=[recommendation("milk", [1])]
+    )
+    pruned_catalog_list = models.PrunedCatalogList(
+        lines=[pruned_line("milk", "milk", [1])]
+    )
+
+    recommender.recommend_products(pruned_catalog_list, catalog_version=1)
+    recommender.recommend_products(pruned_catalog_list, catalog_version=1)
+    assert request.call_count == 1
+
+    result = recommender.recommend_products(pruned_catalog_list, catalog_version=2)
+    assert request.call_count == 2
+    assert result == request.return_value
+
+
+def test_arecommend_products_fully_cached(mocked_async_openai_client, mocker, tmp_path):
+    """Test that arecommend_products() doesn't call the LLM if every line is cached."""
+    recommender = r.RecommenderService(
+        api_key="fake-key",
+        model_name=constants.RECOMMENDER_LLM_MODEL,
+        base_prompt_file=mocker.Mock(),
+        dummy_responses_folder=tmp_path,
+        logger=mocker.Mock(),
+        cache=ch.LRUCache(max_size=10),
+    )
+    request = mocker.AsyncMock(
+        return_value=models.LLMRecommendationList(
+            recommendations=[recommendation("milk", [1])]
+        )
+    )
+    mocked_async_openai_client.return_value.request_structured_response = request
+    pruned_catalog_list = models.PrunedCatalogList(
+        lines=[pruned_line("milk", "milk", [1])]
+    )
+
+    asyncio.run(recommender.arecommend_products(pruned_catalog_list, 1))
+    result = asyncio.run(recommender.arecommend_products(pruned_catalog_list, 1))
+
+    assert request.call_count == 1
+    assert result == request.return_value
+
+
 def test_return_mocked_response_success(mocker, tmp_path):
     """Test that return_mocked_response() returns the mocked response written in a file."""
     content = {"recommendations": [{"query": "1 bag of sugar", "suggestions": []}]}
@@ -118,3 +295,123 @@ def test_return_mocked_response_invalid_json(mocker, tmp_path):
     result = recommender.return_mocked_response("bad.txt")
 
     assert result is None
+
+
+def test_preloaded_mocked_responses(mocker, tmp_path):
+    """Test that preloaded mocked responses are served without reading the files again."""
+    content = {"recommendations": [{"query": "milk", "suggestions": []}]}
+    (tmp_path / "list01.txt").write_text(json.dumps(content))
+    (tmp_path / "bad.txt").write_text("{invalid json}")
+
+    recommender = r.RecommenderService(
+        api_key=None,
+        model_name=constants.RECOMMENDER_LLM_MODEL,
+        base_prompt_file=mocker.Mock(),
+        dummy_responses_folder=tmp_path,
+        logger=mocker.Mock(),
+    )
+    recommender.preload_mocked_responses()
+    (tmp_path / "list01.txt").unlink()
+
+    result = recommender.return_mocked_response("list01.txt")
+
+    assert result == models.LLMRecommendationList.model_validate(content)
+    result.recommendations[0].query = "changed"
+    result.recommendations.clear()
+    assert recommender.return_mocked_response(
+        "list01.txt"
+    ) == models.LLMRecommendationList.model_validate(content)
+    assert recommender.return_mocked_response("bad.txt") is None
+    assert recommender.return_mocked_response("does_not_exist.txt") is None
+    assert list(recommender.mocked_responses) == ["list01.txt"]
+
+
+def recommend_lines(prompt, response_model):
+    """Suggest the first candidate of every line of the prompt; fail on "fail" queries."""
+    lines = json.loads(prompt[1]["content"])["lines"]
+    if any(line["query"] == "fail" for line in lines):
+        raise tenacity.RetryError(None)
+    return models.LLMRecommendationList(
+        recommendations=[
+            recommendation(line["query"], [line["candidates"][0]["sku"]])
+            for line in lines
+        ]
+    )
+
+
+def test_recommend_products_per_line(mocked_openai_client, mocker, tmp_path):
+    """
+    Test that recommend_products() sends one request per line when group_size is 1,
+    and that a failing request only leaves its own line without suggestions.
+    """
+    recommender = r.RecommenderService(
+        api_key="fake-key",
+        model_name=constants.RECOMMENDER_LLM_MODEL,
+        base_prompt_file=mocker.Mock(),
+        dummy_responses_folder=tmp_path,
+        logger=mocker.Mock(),
+        group_size=1,
+        max_concurrent_requests=2,
+    )
+    request = mocked_openai_client.return_value.request_structured_response
+    request.side_effect = recommend_lines
+
+    result = recommender.recommend_products(
+        models.PrunedCatalogList(
+            lines=[
+                pruned_line("milk", "milk", [1]),
+                pruned_line("fail", "fail", [2]),
+                pruned_line("sugar", "sugar", [3]),
+            ]
+        )
+    )
+
+    assert request.call_count == 3
+    assert result == models.LLMRecommendationList(
+        recommendations=[
+            recommendation("milk", [1]),
+            recommendation("fail", []),
+            recommendation("sugar", [3]),
+        ]
+    )
+
+
+def test_arecommend_products_per_line(mocked_async_openai_client, mocker, tmp_path):
+    """Test that arecommend_products() sends at most max_concurrent_requests requests at a time."""
+    recommender = r.RecommenderService(
+        api_key="fake-key",
+        model_name=constants.RECOMMENDER_LLM_MODEL,
+        base_prompt_file=mocker.Mock(),
+        dummy_responses_folder=tmp_path,
+        logger=mocker.Mock(),
+        group_size=2,
+        max_concurrent_requests=2,
+    )
+    in_flight = []
+    max_in_flight = 0
+    group_sizes = []
+
+    async def request(prompt, response_model):
+        nonlocal max_in_flight
+        in_flight.append(prompt)
+        max_in_flight = max(max_in_flight, len(in_flight))
+        group_sizes.append(len(json.loads(prompt[1]["content"])["lines"]))
+        await asyncio.sleep(0.01)
+        in_flight.remove(prompt)
+        return recommend_lines(prompt, response_model)
+
+    mocked_async_openai_client.return_value.request_structured_response = request
+
+    result = asyncio.run(
+        recommender.arecommend_products(
+            models.PrunedCatalogList(
+                lines=[pruned_line(str(sku), "product", [sku]) for sku in range(7)]
+            )
+        )
+    )
+
+    assert max_in_flight == 2
+    assert sorted(group_sizes) == [1, 2, 2, 2]
+    assert result == models.LLMRecommendationList(
+        recommendations=[recommendation(str(sku), [sku]) for sku in range(7)]
+    )
@@ -0,0 +1,77 @@
+"""Unit tests for rule_parser.py"""
+
+import pytest
+
+from apps.agent.services import rule_parser as rp
+
+
+@pytest.mark.parametrize(
+    "test_input, expected",
+    [
+        pytest.param("3 packs of milk", ("milk", 3, "packs", 0.95), id="Unit with of"),
+        pytest.param("3 cans sardines", ("sardines", 3, "cans", 0.95), id="Unit"),
+        pytest.param("4l of water", ("water", 4, "l", 0.95), id="Attached unit"),
+        pytest.param("1.5 KG  Potatoes", ("potatoes", 1.5, "kg", 0.95), id="Decimal"),
+        pytest.param("3 cookies", ("cookies", 3, None, 0.9), id="No unit"),
+        pytest.param("four apple", ("apple", 4, None, 0.85), id="Number word"),
+        pytest.param("popcorn, 5", ("popcorn", 5, None, 0.85), id="Quantity last"),
+        pytest.param("bananas", ("bananas", None, None, 0.9), id="Product only"),
+        pytest.param(
+            "fresh lemonade", ("fresh lemonade", None, None, 0.75), id="Several words"
+        ),
+    ],
+)
+def test_parse_line(mocker, test_input, expected):
+    """Test that parse_line() extracts the product, quantity and unit with a confidence."""
+    service = rp.RuleParserService(min_confidence=0.85, logger=mocker.Mock())
+
+    line_item, confidence = service.parse_line(test_input)
+
+    assert line_item.query == test_input
+    assert (line_item.product, line_item.quantity, line_item.unit) == expected[:3]
+    assert confidence == expected[3]
+
+
+@pytest.mark.parametrize(
+    "test_input, expected_product",
+    [
+        pytest.param("500g beef, ground", None, id="Comma"),
+        pytest.param("1 tuna in can", None, id="Preposition"),
+        pytest.param("5 packks of ham", None, id="Unknown unit"),
+        pytest.param("milk and eggs", None, id="Several products"),
+        pytest.param("0", None, id="No product"),
+        pytest.param("2 gallons milk", "gallons milk", id="Unknown unit, no of"),
+        pytest.param(
+            "6 rolls toilet paper", "rolls toilet paper", id="Unknown unit, 2 words"
+        ),
+        pytest.param("3 cups greek yogurt", "cups greek yogurt", id="Unknown cups"),
+        pytest.param("2 heads lettuce", "heads lettuce", id="Unknown heads"),
+        pytest.param("3 fresh lemons", "fresh lemons", id="Adjective"),
+        pytest.param("two fresh lemons", "fresh lemons", id="Adjective, number word"),
+    ],
+)
+def test_parse_line_no_match(mocker, test_input, expected_product):
+    """
+    Test that parse_line() doesn't parse lines that don't follow a simple pattern,
+    nor confidently parse lines whose product may hold an unknown unit or adjectives.
+    """
+    service = rp.RuleParserService(min_confidence=0.85, logger=mocker.Mock())
+
+    line_item, confidence = service.parse_line(test_input)
+
+    if expected_product is None:
+        assert (line_item, confidence) == (None, 0)
+    else:
+        assert line_item.product == expected_product
+        assert confidence < service.min_confidence
+        assert service.parse_lines([test_input]) == {}
+
+
+def test_parse_lines(mocker):
+    """Test that parse_lines() only returns the lines parsed with enough confidence."""
+    service = rp.RuleParserService(min_confidence=0.85, logger=mocker.Mock())
+
+    result = service.parse_lines(["3 packs of milk", "fresh lemonade", "1 tuna in can"])
+
+    assert list(result) == ["3 packs of milk"]
+    assert result["3 packs of milk"].product == "milk"
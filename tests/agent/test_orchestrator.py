@@ -1,7 +1,10 @@
 """Unit tests for orchestrator.py"""
 
+import asyncio
+
 from apps.agent import orchestrator
 from apps.agent.models import models
+from apps.agent.services import catalog_index as ci, fast_accept as fa
 
 
 def test_main(mocker):
@@ -33,6 +36,34 @@ def test_init_agent(
     assert isinstance(obj, orchestrator.GroceryAgent)
     mocked_load = mocked_inventory_service.return_value.load_catalog
     assert mocked_load.call_count == 1
+    mocked_start_refresh = mocked_inventory_service.return_value.start_refresh
+    assert mocked_start_refresh.call_count == 1
+
+
+def test_init_agent_preloads_mocked_responses(
+    mocker,
+    mocked_parser_service,
+    mocked_recommender_service,
+    mocked_inventory_service,
+    mocked_fuzzy_service,
+):
+    """Test that init_agent() preloads the mocked responses only if there's no API key."""
+    mocker.patch("apps.agent.orchestrator.logging")
+    mocked_getenv = mocker.patch("apps.agent.orchestrator.os.getenv")
+    mocked_parser_preload = mocked_parser_service.return_value.preload_mocked_responses
+    mocked_recommender_preload = (
+        mocked_recommender_service.return_value.preload_mocked_responses
+    )
+
+    mocked_getenv.return_value = "fake-key"
+    orchestrator.init_agent()
+    assert mocked_parser_preload.call_count == 0
+    assert mocked_recommender_preload.call_count == 0
+
+    mocked_getenv.return_value = None
+    orchestrator.init_agent()
+    assert mocked_parser_preload.call_count == 1
+    assert mocked_recommender_preload.call_count == 1
 
 
 def test_process_on_empty_catalog(
@@ -44,8 +75,8 @@ def test_process_on_empty_catalog(
 ):
     """Test that process() returns empty recommendations for an empty catalog."""
     mocker.patch("apps.agent.orchestrator.logging")
-    empty = models.ProductCatalog(catalog=[])
-    mocked_inventory_service.return_value = mocker.Mock(catalog=empty)
+    empty = ci.CatalogIndex([], [])
+    mocked_inventory_service.return_value = mocker.Mock(catalog_index=empty)
     obj = orchestrator.init_agent()
     resp = obj.process("some.file", "some text")
     assert resp == {"recommendations": []}
@@ -141,6 +172,8 @@ def test_use_llms_on_empty_responses(
 ):
     """Test that _use_llms() returns empty recommendations for empty responses."""
     mocker.patch("apps.agent.orchestrator.logging")
+    # the mocked pruned catalog lists have no lines to fast accept
+    mocker.patch("apps.agent.orchestrator.constants.FAST_ACCEPT_MIN_SCORE", None)
     mocker.patch("apps.agent.models.models.CatalogForFuzzyMatching")
     empty = models.LLMRecommendationList(recommendations=[])
     obj = orchestrator.init_agent()
@@ -171,3 +204,135 @@ def test_use_llms_on_empty_responses(
     obj = orchestrator.init_agent()
     resp = obj._use_llms("some text")
     assert resp == empty
+
+
+def test_aprocess_on_api_key_existence(
+    mocker,
+    mocked_parser_service,
+    mocked_recommender_service,
+    mocked_inventory_service,
+    mocked_fuzzy_service,
+):
+    """Test that aprocess() calls the correct methods depending on the API key existence."""
+    mocked_ause_llms = mocker.patch(
+        "apps.agent.orchestrator.GroceryAgent._ause_llms", new=mocker.AsyncMock()
+    )
+    mocked_mock_llms = mocker.patch("apps.agent.orchestrator.GroceryAgent._mock_llms")
+    mocked_inventory_service.aget_final_recommendations = mocker.AsyncMock(
+        return_value=mocker.Mock()
+    )
+
+    obj = orchestrator.GroceryAgent(
+        mocked_parser_service,
+        mocked_recommender_service,
+        mocked_inventory_service,
+        mocked_fuzzy_service,
+        api_key="some key",
+        logger=mocker.Mock(),
+    )
+    asyncio.run(obj.aprocess("some.file", "some text"))
+    assert mocked_ause_llms.call_count == 1
+    assert mocked_mock_llms.call_count == 0
+
+    obj.api_key = None
+    asyncio.run(obj.aprocess("some.file", "some text"))
+    assert mocked_ause_llms.call_count == 1
+    assert mocked_mock_llms.call_count == 1
+    assert mocked_inventory_service.aget_final_recommendations.call_count == 2
+
+
+def test_ause_llms_on_empty_responses(
+    mocker,
+    mocked_parser_service,
+    mocked_recommender_service,
+    mocked_inventory_service,
+    mocked_fuzzy_service,
+):
+    """Test that _ause_llms() returns empty recommendations for empty responses."""
+    mocker.patch("apps.agent.orchestrator.logging")
+    # the mocked pruned catalog lists have no lines to fast accept
+    mocker.patch("apps.agent.orchestrator.constants.FAST_ACCEPT_MIN_SCORE", None)
+    mocker.patch("apps.agent.models.models.CatalogForFuzzyMatching")
+    empty = models.LLMRecommendationList(recommendations=[])
+    parser_svc = mocked_parser_service.return_value
+    recommender_svc = mocked_recommender_service.return_value
+    parser_svc.aparse_grocery_text = mocker.AsyncMock()
+    recommender_svc.arecommend_products = mocker.AsyncMock()
+
+    obj = orchestrator.init_agent()
+    resp = asyncio.run(obj._ause_llms("some text"))
+    assert resp == recommender_svc.arecommend_products.return_value
+
+    parser_svc.aparse_grocery_text.return_value = None
+    resp = asyncio.run(obj._ause_llms("some text"))
+    assert resp == empty
+    parser_svc.aparse_grocery_text.return_value = mocker.Mock()
+
+    mocked_fuzzy_service.return_value.filter_catalog.return_value = None
+    resp = asyncio.run(obj._ause_llms("some text"))
+    assert resp == empty
+    mocked_fuzzy_service.return_value.filter_catalog.return_value = mocker.Mock()
+
+    recommender_svc.arecommend_products.return_value = None
+    resp = asyncio.run(obj._ause_llms("some text"))
+    assert resp == empty
+
+
+def test_use_llms_fast_accepts_unambiguous_lines(
+    mocker,
+    mocked_parser_service,
+    mocked_recommender_service,
+    mocked_inventory_service,
+    mocked_fuzzy_service,
+):
+    """Test that _use_llms() only sends the lines that weren't fast accepted to the recommender."""
+    mocker.patch("apps.agent.models.models.CatalogForFuzzyMatching")
+    fast_accept_svc = fa.FastAcceptService(
+        min_score=90, min_margin=20, logger=mocker.Mock()
+    )
+    milk = models.PrunedCatalogPerGroceryListLine(
+        query="milk",
+        product="milk",
+        candidates=[models.CandidateLineItem(sku=1, full_name="Milk 1L", score=95)],
+    )
+    bread = models.PrunedCatalogPerGroceryListLine(
+        query="bread",
+        product="bread",
+        candidates=[models.CandidateLineItem(sku=2, full_name="Rye Bread", score=70)],
+    )
+    bread_recommendation = models.LLMRecommendationListPerGroceryListLine(
+        query="bread",
+        suggestions=[
+            models.LLMRecommendationLineItem(
+                sku=2, full_name="Rye Bread", confidence=80
+            )
+        ],
+    )
+    recommend_products = mocked_recommender_service.recommend_products
+    recommend_products.return_value = models.LLMRecommendationList(
+        recommendations=[bread_recommendation]
+    )
+    obj = orchestrator.GroceryAgent(
+        mocked_parser_service,
+        mocked_recommender_service,
+        mocked_inventory_service,
+        mocked_fuzzy_service,
+        api_key="some key",
+        logger=mocker.Mock(),
+        fast_accept_svc=fast_accept_svc,
+    )
+
+    mocked_fuzzy_service.filter_catalog.return_value = models.PrunedCatalogList(
+        lines=[milk, bread]
+    )
+    resp = obj._use_llms("some text")
+    assert recommend_products.call_args.args[0].lines == [bread]
+    assert [line.query for line in resp.recommendations] == ["milk", "bread"]
+    assert resp.recommendations[0].suggestions[0].confidence == 95
+
+    mocked_fuzzy_service.filter_catalog.return_value = models.PrunedCatalogList(
+        lines=[milk]
+    )
+    resp = obj._use_llms("some text")
+    assert recommend_products.call_count == 1
+    assert [line.query for line in resp.recommendations] == ["milk"]
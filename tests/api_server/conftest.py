@@ -5,7 +5,7 @@ import pytest
 from fastapi.testclient import TestClient
 
 from apps.api_server import grocery
-from apps.api_server.dependencies import constants, database, scripts
+from apps.api_server.dependencies import cache, constants, database, scripts
 
 
 @pytest.fixture
@@ -32,4 +32,24 @@ def patch_global_engine() -> None:
     scripts.seed(test_engine, 17)
 
     database.engine = test_engine
+    database.read_only_engine = database.get_engine(
+        database_uri=constants.SQLITE_URI.format(
+            "file:endpoints_test?mode=memory&cache=shared"
+        ),
+        read_only=True,
+    )
     return None
+
+
+@pytest.fixture(autouse=True)
+def clear_caches() -> None:
+    """Start every test with empty product and listing caches."""
+    cache.products.clear()
+    cache.listings.clear()
+
+
+@pytest.fixture
+def enabled_caches(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Enable the product and listing caches, which are disabled by default."""
+    monkeypatch.setattr(cache.products, "max_size", 16)
+    monkeypatch.setattr(cache.listings, "max_size", 16)
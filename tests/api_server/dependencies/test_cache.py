@@ -0,0 +1,53 @@
+"""Unit tests for cache.py"""
+
+from apps.api_server.dependencies import cache
+
+
+def test_lru_cache_disabled():
+    """Test that a cache with a max size of 0 never caches anything."""
+    lru_cache = cache.LRUCache(0)
+    lru_cache.set(1, "one")
+    assert lru_cache.get(1) is None
+    assert len(lru_cache) == 0
+
+
+def test_lru_cache_evicts_least_recently_used():
+    """Test that the least recently used entry is evicted once the cache is full."""
+    lru_cache = cache.LRUCache(2)
+    lru_cache.set(1, "one")
+    lru_cache.set(2, "two")
+    lru_cache.get(1)
+    lru_cache.set(3, "three")
+    assert lru_cache.get(2) is None
+    assert lru_cache.get(1) == "one"
+    assert lru_cache.get(3) == "three"
+
+
+def test_lru_cache_expires_entries(mocker):
+    """Test that entries are no longer served once their TTL has passed."""
+    mocked_monotonic = mocker.patch(
+        "apps.api_server.dependencies.cache.time.monotonic", return_value=100.0
+    )
+    lru_cache = cache.LRUCache(2, ttl=5.0)
+    lru_cache.set(1, "one")
+
+    mocked_monotonic.return_value = 104.9
+    assert lru_cache.get(1) == "one"
+    mocked_monotonic.return_value = 105.0
+    assert lru_cache.get(1) is None
+    assert len(lru_cache) == 0
+
+
+def test_lru_cache_drops_values_loaded_before_invalidation():
+    """
+    Test that a value loaded before an invalidation isn't cached afterwards,
+    since it may hold the row as it was before the change.
+    """
+    lru_cache = cache.LRUCache(2)
+    generation = lru_cache.generation
+    lru_cache.delete(1)
+    lru_cache.set(1, "stale", generation)
+    assert lru_cache.get(1) is None
+
+    lru_cache.set(1, "fresh", lru_cache.generation)
+    assert lru_cache.get(1) == "fresh"
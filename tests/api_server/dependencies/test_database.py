@@ -1,5 +1,8 @@
 """Unit tests for database.py"""
 
+import pytest
+from sqlalchemy import exc, text
+
 from apps.api_server.dependencies import database
 
 
@@ -15,8 +18,34 @@ def test_get_engine(mocker):
     mocked_create_engine = mocker.patch(
         "apps.api_server.dependencies.database.create_engine"
     )
+    mocker.patch("apps.api_server.dependencies.database.event")
+    mocked_attach = mocker.patch.object(database.query_timer.timer, "attach")
     database.get_engine(None)
     assert mocked_create_engine.call_count == 1
+    assert mocked_create_engine.call_args.kwargs["echo"] is False
+    mocked_attach.assert_called_once_with(mocked_create_engine.return_value)
+
+
+def test_get_engine_pragmas(tmp_path):
+    """Test that get_engine() tunes every new connection with the pragmas."""
+    engine = database.get_engine(f"sqlite:///{tmp_path / 'test.sqlite3'}")
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1
+        assert conn.execute(text("PRAGMA temp_store")).scalar() == 2
+        assert conn.execute(text("PRAGMA query_only")).scalar() == 0
+
+
+def test_get_engine_read_only(tmp_path):
+    """Test that the connections of a read-only engine can read but not write."""
+    database_uri = f"sqlite:///{tmp_path / 'test.sqlite3'}"
+    with database.get_engine(database_uri).begin() as conn:
+        conn.execute(text("CREATE TABLE t (x INTEGER)"))
+
+    with database.get_engine(database_uri, read_only=True).connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM t")).scalar() == 0
+        with pytest.raises(exc.OperationalError, match="readonly"):
+            conn.execute(text("INSERT INTO t VALUES (1)"))
 
 
 def test_get_session(mocker):
@@ -0,0 +1,63 @@
+"""Unit tests for query_timer.py"""
+
+import pytest
+from sqlalchemy import create_engine, exc, text
+
+from apps.api_server.dependencies import query_timer as qt
+
+
+@pytest.fixture
+def timer(mocker) -> qt.QueryTimer:
+    """Defines a pytest fixture for a query timer that times every statement."""
+    return qt.QueryTimer(
+        buckets=(0.01, 0.001),
+        slow_query_threshold=None,
+        sample_rate=1.0,
+        logger=mocker.Mock(),
+    )
+
+
+def test_record(timer):
+    """Test that record() fills the histogram of each statement."""
+    timer.record("SELECT 1", 0.0005)
+    timer.record("SELECT 1", 0.005)
+    timer.record("SELECT 1", 2.0)
+    timer.record("SELECT 2", 0.005)
+
+    stats = timer.stats()
+    assert stats["buckets"] == [0.001, 0.01]
+    assert stats["statements"][0]["statement"] == "SELECT 1"
+    assert stats["statements"][0]["count"] == 3
+    assert stats["statements"][0]["max"] == 2.0
+    assert stats["statements"][0]["histogram"] == [1, 1, 1]
+    assert stats["statements"][1]["histogram"] == [0, 1, 0]
+    timer.logger.warning.assert_not_called()
+
+    timer.reset()
+    assert timer.stats()["statements"] == []
+
+
+def test_record_slow_query(timer):
+    """Test that record() logs statements slower than the threshold."""
+    timer.slow_query_threshold = 0.1
+    timer.record("SELECT 1", 0.05)
+    timer.logger.warning.assert_not_called()
+    timer.record("SELECT 1", 0.5)
+    timer.logger.warning.assert_called_once()
+
+
+@pytest.mark.parametrize("sample_rate, expected", [(1.0, 3), (0.0, 0)])
+def test_attach(timer, sample_rate, expected):
+    """Test that the statements executed by an engine are timed, when sampled."""
+    timer.sample_rate = sample_rate
+    engine = create_engine("sqlite://")
+    timer.attach(engine)
+
+    with engine.connect() as conn:
+        for _ in range(3):
+            conn.execute(text("SELECT 1"))
+        with pytest.raises(exc.OperationalError):
+            conn.execute(text("SELECT * FROM missing"))
+
+    counts = [stats["count"] for stats in timer.stats()["statements"]]
+    assert sum(counts) == expected
@@ -1,5 +1,17 @@
 """Unit tests for products.py"""
 
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, text
+
+from apps.api_server import grocery
+from apps.api_server.dependencies import cache, database
+from apps.api_server.models import products
+
 
 def test_retrieve_listing(test_client):
     """Unit test for retrieve_listing()"""
@@ -17,6 +29,22 @@ def test_retrieve_listing(test_client):
     }
 
 
+def test_retrieve_listing_not_modified(test_client):
+    """Test that retrieve_listing() answers a matching If-None-Match with a 304."""
+    url = "/api/v1/products?page=5&products_per_page=3"
+    etag = test_client.get(url).headers["etag"]
+
+    response = test_client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    response = test_client.get(
+        "/api/v1/products?after_sku=50187&products_per_page=3",
+        headers={"If-None-Match": etag},
+    )
+    assert response.status_code == 200
+
+
 def test_retrieve_listing_blank_page(test_client):
     """Unit test for retrieve_listing() resulting in blank page."""
     response = test_client.get("/api/v1/products?page=2&products_per_page=30")
@@ -43,6 +71,22 @@ def test_retrieve_listing_no_arguments(test_client):
     }
 
 
+@pytest.mark.parametrize(
+    "query",
+    [
+        "products_per_page=0",
+        "products_per_page=-1",
+        "products_per_page=1001",
+        "page=0",
+        "after_sku=0&products_per_page=0",
+    ],
+)
+def test_retrieve_listing_invalid_arguments(test_client, query):
+    """Unit test for retrieve_listing() with out-of-range paging arguments."""
+    response = test_client.get(f"/api/v1/products?{query}")
+    assert response.status_code == 422
+
+
 def test_count_calls_to_retrieve_full_listing(test_client):
     """Count the number of calls needed to get the entire catalog."""
     calls = 0
@@ -56,6 +100,46 @@ def test_count_calls_to_retrieve_full_listing(test_client):
     assert calls == 3
 
 
+def test_retrieve_listing_with_cursor(test_client):
+    """Unit test for retrieve_listing() using a cursor instead of a page number."""
+    response = test_client.get("/api/v1/products?after_sku=50187&products_per_page=3")
+    assert response.status_code == 200
+    assert response.json() == {
+        "count": 3,
+        "data": [
+            {"full_name": "Terra canned mushrooms - 400g", "sku": 50204},
+            {"full_name": "Twilight pretzels - 200g", "sku": 50221},
+            {"full_name": "Luminous ground beef - 500g", "sku": 50238},
+        ],
+        "next": "/api/v1/products/?after_sku=50238&products_per_page=3",
+        "previous": None,
+    }
+
+
+def test_retrieve_listing_with_cursor_on_last_page(test_client):
+    """Unit test for retrieve_listing() using a cursor past the last product."""
+    response = test_client.get("/api/v1/products?after_sku=99999")
+    assert response.status_code == 200
+    assert response.json() == {"count": 0, "data": [], "next": None, "previous": None}
+
+
+def test_count_calls_to_retrieve_full_listing_with_cursor(test_client):
+    """Count the number of calls needed to get the entire catalog using cursors."""
+    calls = 0
+    skus = []
+    url = "/api/v1/products/?after_sku=0&products_per_page=7"
+    while url:
+        response = test_client.get(url)
+        assert response.status_code == 200
+        calls += 1
+        resp = response.json()
+        skus.extend(product["sku"] for product in resp["data"])
+        url = resp["next"]
+    assert calls == 3
+    assert len(skus) == 17
+    assert skus == sorted(skus)
+
+
 def test_get_existing_product(test_client):
     """Unit test for get_product() of existing product."""
     response = test_client.get("/api/v1/products/50017")
@@ -75,3 +159,206 @@ def test_get_nonexistent_product(test_client):
     """Unit test for get_product() of nonexistent product."""
     response = test_client.get("/api/v1/products/123")
     assert response.status_code == 404
+
+
+def test_get_product_not_modified(test_client):
+    """Test that get_product() answers a matching If-None-Match with a 304."""
+    etag = test_client.get("/api/v1/products/50017").headers["etag"]
+
+    response = test_client.get(
+        "/api/v1/products/50017", headers={"If-None-Match": f'W/"other", W/{etag}'}
+    )
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+
+    response = test_client.get(
+        "/api/v1/products/50034", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_get_product_cached(test_client, enabled_caches, mocker):
+    """Test that get_product() serves a cached product without querying it again."""
+    test_client.get("/api/v1/products/50017")
+    mocked_retrieve = mocker.spy(products.Products, "retrieve")
+
+    response = test_client.get("/api/v1/products/50017")
+    assert response.status_code == 200
+    assert response.json()["data"]["qty_in_stock"] == 34
+    mocked_retrieve.assert_not_called()
+    assert cache.products.stats()["hits"] >= 1
+
+
+def test_get_product_invalidated_on_update(test_client, enabled_caches):
+    """Test that committing a change to a product through the ORM invalidates its caches."""
+    etag = test_client.get("/api/v1/products/50017").headers["etag"]
+    test_client.get("/api/v1/products?page=1&products_per_page=3")
+    assert len(cache.listings) == 1
+
+    try:
+        with Session(database.engine) as session:
+            product = products.Products.retrieve(session, 50017)
+            product.qty_in_stock = 0
+            session.add(product)
+            session.commit()
+
+        assert len(cache.listings) == 0
+        response = test_client.get(
+            "/api/v1/products/50017", headers={"If-None-Match": etag}
+        )
+        assert response.status_code == 200
+        assert response.json()["data"]["qty_in_stock"] == 0
+    finally:
+        with Session(database.engine) as session:
+            product = products.Products.retrieve(session, 50017)
+            product.qty_in_stock = 34
+            session.add(product)
+            session.commit()
+
+
+def test_get_product_sees_raw_sql_updates(test_client):
+    """Test that, with the default settings, changes made around the ORM are served."""
+    etag = test_client.get("/api/v1/products/50017").headers["etag"]
+
+    try:
+        with database.engine.begin() as conn:
+            conn.execute(text("UPDATE products SET qty_in_stock = 0 WHERE sku = 50017"))
+
+        response = test_client.get(
+            "/api/v1/products/50017", headers={"If-None-Match": etag}
+        )
+        assert response.status_code == 200
+        assert response.json()["data"]["qty_in_stock"] == 0
+    finally:
+        with database.engine.begin() as conn:
+            conn.execute(
+                text("UPDATE products SET qty_in_stock = 34 WHERE sku = 50017")
+            )
+
+
+def test_get_product_slow_query_does_not_block(mocker):
+    """Test that a slow product lookup doesn't hold up requests for other products."""
+    release = threading.Event()
+    retrieve = products.Products.retrieve
+
+    def slow_retrieve(session, product_id):
+        # only released once the other request is answered, unless the loop is blocked
+        if product_id == 50017 and not release.wait(2):
+            raise TimeoutError("the other request was held up")
+        return retrieve(session, product_id)
+
+    mocker.patch.object(products.Products, "retrieve", side_effect=slow_retrieve)
+
+    # the client's requests share a single event loop
+    with TestClient(grocery.app) as client, ThreadPoolExecutor(1) as executor:
+        slow_response = executor.submit(client.get, "/api/v1/products/50017")
+        response = client.get("/api/v1/products/50034")
+        assert response.status_code == 200
+        assert not slow_response.done()
+        release.set()
+        assert slow_response.result().status_code == 200
+
+
+def test_get_products(test_client):
+    """Unit test for get_products() on a mix of existing and nonexistent products."""
+    response = test_client.post(
+        "/api/v1/products/batch", json={"skus": [50034, 123, 50017, 50034]}
+    )
+    assert response.status_code == 200
+    assert response.json() == {
+        "data": [
+            {
+                "brand": "Phoenix",
+                "description": "canned chickpeas - 450g",
+                "qty_in_stock": 34,
+                "sku": 50017,
+                "unit_price": 7.69,
+            },
+            {
+                "brand": "Frostbite",
+                "description": "bell pepper - 130g",
+                "qty_in_stock": 20,
+                "sku": 50034,
+                "unit_price": 8.36,
+            },
+        ]
+    }
+
+
+def test_get_products_empty_request(test_client):
+    """Unit test for get_products() when no products are requested."""
+    response = test_client.post("/api/v1/products/batch", json={"skus": []})
+    assert response.status_code == 200
+    assert response.json() == {"data": []}
+
+
+def test_get_products_too_many(test_client):
+    """Unit test for get_products() when too many products are requested."""
+    response = test_client.post(
+        "/api/v1/products/batch", json={"skus": list(range(1000))}
+    )
+    assert response.status_code == 422
+
+
+def test_export_catalog(test_client):
+    """Unit test for export_catalog()"""
+    response = test_client.get("/api/v1/products/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == 17
+    assert lines[1] == {"full_name": "Phoenix canned chickpeas - 450g", "sku": 50017}
+    assert [line["sku"] for line in lines] == sorted(line["sku"] for line in lines)
+
+
+def test_retrieve_changes(test_client):
+    """Unit test for retrieve_changes() on the changes made by seeding the database."""
+    response = test_client.get("/api/v1/products/changes")
+    assert response.status_code == 200
+    version = response.json()["version"]
+    assert response.json() == {"data": [], "version": version, "next": None}
+
+    response = test_client.get(f"/api/v1/products/changes?since={version - 3}&limit=2")
+    assert response.status_code == 200
+    resp = response.json()
+    assert len(resp["data"]) == 2
+    assert resp["version"] == version - 1
+    assert resp["next"] == f"/api/v1/products/changes?since={version - 1}&limit=2"
+
+    response = test_client.get(resp["next"])
+    assert len(response.json()["data"]) == 1
+    assert response.json()["version"] == version
+    assert response.json()["next"] is None
+
+
+@pytest.mark.parametrize("limit", [0, -1])
+def test_retrieve_changes_invalid_limit(test_client, limit):
+    """Unit test for retrieve_changes() with a limit that would never make progress."""
+    response = test_client.get(f"/api/v1/products/changes?since=0&limit={limit}")
+    assert response.status_code == 422
+
+
+def test_retrieve_changes_after_updates(test_client):
+    """Unit test for retrieve_changes() after products are added, renamed and deleted."""
+    version = test_client.get("/api/v1/products/changes").json()["version"]
+    with Session(database.engine) as session:
+        session.exec(
+            text(
+                "INSERT INTO products VALUES (99999, 'Acme', 'oat milk - 1L', 2.5, 10)"
+            )
+        )
+        session.exec(text("UPDATE products SET qty_in_stock = 0 WHERE sku = 50017"))
+        session.exec(text("UPDATE products SET brand = 'Zenith' WHERE sku = 99999"))
+        session.exec(text("DELETE FROM products WHERE sku = 99999"))
+        session.exec(text("UPDATE products SET qty_in_stock = 34 WHERE sku = 50017"))
+        session.commit()
+
+    response = test_client.get(f"/api/v1/products/changes?since={version}")
+    assert response.status_code == 200
+    assert response.json() == {
+        "data": [{"sku": 99999, "full_name": None}],
+        "version": version + 3,
+        "next": None,
+    }
@@ -13,3 +13,14 @@ def test_health(test_client):
     response = test_client.get("/health")
     assert response.status_code == 200
     assert response.json() == {"message": "All is well."}
+
+
+def test_query_metrics(test_client):
+    """Unit test for query_metrics()"""
+    test_client.get("/api/v1/products/50017")
+    response = test_client.get("/metrics/queries")
+    assert response.status_code == 200
+    resp = response.json()
+    assert resp["sample_rate"] == 1.0
+    assert len(resp["buckets"]) + 1 == len(resp["statements"][0]["histogram"])
+    assert any("FROM products" in stats["statement"] for stats in resp["statements"])
@@ -30,4 +30,6 @@ def test_client() -> flask.testing.FlaskClient:
 
 @pytest.fixture
 def mocked_agent(mocker: pytest_mock.plugin.MockerFixture) -> unittest.mock.MagicMock:
-    return mocker.patch("apps.agent.orchestrator.GroceryAgent")
+    agent = mocker.patch("apps.agent.orchestrator.GroceryAgent")
+    agent.aprocess = mocker.AsyncMock()
+    return agent